@@ -5,12 +5,30 @@ Roll-call AI Logger Assistant
 @author: BG5CVB
 
 """
+import argparse
+import contextlib
 import json
 import csv
 import os
+import sys
 import datetime
-from openai import OpenAI
+import time
+import re
+import shutil
+import random
+import hashlib
+import io
+import queue
+import sqlite3
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from typing import List
+import prompt_templates    # 提示词模板，与本程序放在同一目录
+# openai（连同httpx、pydantic）导入需要约0.5秒，因此在用到时才导入：
+# 启动时由后台的start_warm_up()导入并建立连接，提示符不必等它
 
 # 导入彩色输出库
 try:
@@ -44,12 +62,335 @@ except ImportError:
         NORMAL = ''
         RESET_ALL = ''
 
+RECORD_FIELDS = ('NR', 'DATE', 'UTC', 'CALL', 'RST', 'QTH', 'RIG', 'ANT', 'PWR', 'ALT', 'RMKS', 'OP')
+
+
+class QSORecord:
+    """
+    One QSO of the log. Fields are attributes named as in RECORD_FIELDS
+    (record.CALL, record.QTH, ...), all strings; __slots__ keeps it compact.
+    Backups and the journal store records as plain lists in field order.
+    """
+    
+    __slots__ = RECORD_FIELDS
+    
+    def __init__(self, *values):
+        for field, value in zip(RECORD_FIELDS, values):
+            setattr(self, field, value)
+        for field in RECORD_FIELDS[len(values):]:
+            setattr(self, field, "")
+    
+    @classmethod
+    def from_list(cls, values: List[str]) -> "QSORecord":
+        return cls(*values)
+    
+    def to_list(self) -> List[str]:
+        return [getattr(self, field) for field in RECORD_FIELDS]
+    
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in RECORD_FIELDS}
+    
+    def __repr__(self):
+        return f"QSORecord({', '.join(repr(v) for v in self.to_list())})"
+
+
+def call_key(call: str) -> str:
+    """
+    Returns the index key of a callsign, or "" when it is not a real one
+    (placeholder, empty or NULL).
+    """
+    
+    key = str(call).strip().upper()
+    return "" if key in ("", "NULL", PENDING_MARK) else key
+
+
+class RecordStore:
+    """
+    The records of the session, in NR order, with two indexes kept up to date
+    on append, update and clear: NR -> record and CALL -> records.
+    `rendered` keeps the SHOW line of each record (NR -> (layout, text)); an
+    update drops the line of that record only.
+    
+    Iterating yields QSORecord objects; len() is the number of records.
+    Callers hold RECORD_LOCK while changing the store.
+    """
+    
+    def __init__(self, records = ()):
+        self.rows = []
+        self.by_nr = {}
+        self.by_call = {}
+        self.rendered = {}
+        for record in records:
+            self.append(record if isinstance(record, QSORecord) else QSORecord.from_list(record))
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def __iter__(self):
+        return iter(self.rows)
+    
+    def __contains__(self, record):
+        return self.by_nr.get(record.NR) is record
+    
+    def append(self, record: QSORecord) -> None:
+        self.rows.append(record)
+        self.by_nr[record.NR] = record
+        key = call_key(record.CALL)
+        if key:
+            self.by_call.setdefault(key, []).append(record)
+    
+    def update(self, record: QSORecord, **fields) -> None:
+        """
+        Changes fields of a stored record, re-indexing it if CALL changes.
+        """
+        
+        old_key = call_key(record.CALL)
+        for field, value in fields.items():
+            setattr(record, field, value)
+        self.rendered.pop(record.NR, None)
+        new_key = call_key(record.CALL)
+        if new_key == old_key:
+            return
+        if old_key:
+            rows = [r for r in self.by_call.get(old_key, []) if r is not record]
+            if rows:
+                self.by_call[old_key] = rows
+            else:
+                self.by_call.pop(old_key, None)
+        if new_key:
+            rows = self.by_call.setdefault(new_key, [])
+            rows.append(record)
+            rows.sort(key = lambda r: int(r.NR))
+    
+    def get(self, nr) -> "QSORecord":
+        return self.by_nr.get(str(nr))
+    
+    def find_call(self, call: str) -> List[QSORecord]:
+        return list(self.by_call.get(call_key(call), []))
+    
+    def clear(self) -> None:
+        self.rows.clear()
+        self.by_nr.clear()
+        self.by_call.clear()
+        self.rendered.clear()
+    
+    def to_lists(self) -> List[List[str]]:
+        return [record.to_list() for record in self.rows]
+
+
 CITY = "杭州"
 OPERATOR = ""
-RECORD = []    # NR, DATE, UTC, CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS, OP
+RECORD = RecordStore()    # QSORecord: NR, DATE, UTC, CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS, OP
 NR_COUNTER = 1
+SESSION_ID = ""           # 本次点名在日志簿中的键，第一条记录加入时生成，随日志、快照和备份保存
+
+API_KEY_ENV = "DEEPSEEK_API_KEY"                                        # 环境变量名
+API_BASE_URL = os.getenv("LOGGER_BASE_URL", "https://api.deepseek.com/v1")  # 大模型基地址
+MODEL_NAME = "deepseek-chat"                                            # 模型名称
+API_TIMEOUT = 30.0             # 单次请求的读写超时（秒）
+API_CONNECT_TIMEOUT = 5.0      # 建立连接的超时（秒）
+API_KEEPALIVE = 120.0          # 空闲连接保持的时间（秒）
+API_DEADLINE = 20.0            # 一次识别或编辑最多等待的时间（秒），包括重试和对冲请求
+API_RETRIES = 2                # 超时、连接错误、429和5xx时的重试次数
+API_RETRY_BASE = 0.5           # 第一次重试前的等待（秒），之后每次加倍，并乘以0.5~1.5的随机数
+HEDGE_ENABLED = True           # 请求迟迟没有返回时再发一个相同的请求，用先返回的结果
+HEDGE_DEFAULT_DELAY = 4.0      # 耗时样本不足时，发出对冲请求前等待的时间（秒）；样本足够后用最近200次耗时的p95
+HEDGE_MIN_SAMPLES = 20
+BREAKER_THRESHOLD = 3          # 连续失败这么多次后进入仅本地模式，暂停调用AI
+BREAKER_COOLDOWN = 30.0        # 仅本地模式持续的时间（秒），之后用一条QSO试探AI是否恢复
+RETRY_DELAY = 15.0             # 识别失败的QSO第一次重新处理前等待的时间（秒），之后每次加倍
+RETRY_MAX_DELAY = 300.0
+API_ERROR = "API调用错误"       # 调用失败时，结果的RMKS以此开头
+BACKENDS_FILE = "backends.json"  # 多个兼容OpenAI接口的后端及其分工（见backends.example.json）；文件不存在时只用上面的设置
+ROUTE_ALPHA = 0.2              # 后端评分中最近一次请求的权重（指数移动平均）
+ROUTE_EXPLORE = 0.05           # 按此比例随机选用评分并非最好的后端，让它的评分保持更新
+
+REQUIRED_FIELDS = ["CALL", "RST", "QTH", "RIG", "ANT", "PWR", "ALT", "RMKS"]
+
+CACHE_FILE = "extract_cache.json"
+CACHE_MAX_ENTRIES = 2000       # 缓存条目上限，超出时淘汰最久未使用的条目
+CACHE_MAX_AGE_DAYS = 90        # 缓存条目的有效期（天）
+CACHE_STATS = {"hits": 0, "misses": 0, "coalesced": 0}
+
+# 本地快速解析：整行都能识别时不再调用AI
+RIG_MODELS = {    # 去掉连字符后的写法 -> 规范写法
+    "UVK5": "UV-K5", "UVK6": "UV-K6", "UVK58": "UV-K5(8)", "UV5R": "UV-5R", "UV82": "UV-82",
+    "UV9R": "UV-9R", "BF888S": "BF-888S", "UV5RM": "UV-5RM", "UV17": "UV-17", "UV21": "UV-21",
+    "FT60R": "FT-60R", "FT65R": "FT-65R", "FT4XR": "FT-4XR", "FT70D": "FT-70D", "FT5D": "FT-5D",
+    "FT3D": "FT-3D", "FT2D": "FT-2D", "VX6R": "VX-6R", "VX8R": "VX-8R", "FT7900": "FT-7900",
+    "FT8900": "FT-8900", "FTM100": "FTM-100", "FTM200": "FTM-200", "FTM300": "FTM-300",
+    "FT817": "FT-817", "FT818": "FT-818", "FT891": "FT-891", "FT991": "FT-991", "FT991A": "FT-991A",
+    "FT710": "FT-710", "FTDX10": "FTDX10", "FTDX101": "FTDX101",
+    "IC705": "IC-705", "IC7300": "IC-7300", "IC9700": "IC-9700", "IC7100": "IC-7100",
+    "IC2730": "IC-2730", "ID52": "ID-52", "ID50": "ID-50", "IC905": "IC-905",
+    "THD72": "TH-D72", "THD74": "TH-D74", "THD75": "TH-D75", "TMV71": "TM-V71", "TMD710": "TM-D710",
+    "ATD878UV": "AT-D878UV", "ATD578UV": "AT-D578UV", "ATD168UV": "AT-D168UV",
+    "TH9800": "TH-9800", "TH7800": "TH-7800", "MD380": "MD-380", "UV98": "UV-98",
+    "KGUV9D": "KG-UV9D", "KGUV8D": "KG-UV8D", "Q900": "Q900",
+}
+ANT_ALIASES = {    # 天线缩写 -> 中文写法（与提示词中的约定一致）
+    "ORGN": "原装", "ORG": "原装", "ORIGINAL": "原装", "原装": "原装", "原厂": "原装",
+    "GP": "GP", "DIPOLE": "偶极子", "偶极子": "偶极子", "YAGI": "八木", "八木": "八木",
+    "MAG": "吸盘", "吸盘": "吸盘", "车载": "车载天线", "MOBILE": "车载天线",
+    "LONG": "长天线", "拉杆": "拉杆天线", "NAGOYA": "NAGOYA", "JPOLE": "J天线",
+}
+LOCAL_PATTERNS = [    # (字段, 正则, 规范写法)
+    ("ANT", re.compile(r"(\d+)\s*(?:ELE|EL|单元)\s*(?:YAGI|八木)"), lambda m: f"{m.group(1)}单元八木"),
+    ("PWR", re.compile(r"(?<![A-Z0-9.])(\d+(?:\.\d+)?)\s*(?:W|瓦)(?![A-Z0-9])"), lambda m: f"{m.group(1)}W"),
+    ("ALT", re.compile(r"(?<![A-Z0-9.])(\d+)\s*(?:楼|层|L|F)(?![A-Z0-9])"), lambda m: f"{m.group(1)}楼"),
+    ("ALT", re.compile(r"(?<![A-Z0-9.])(\d+(?:\.\d+)?)\s*(?:M|米)(?![A-Z0-9])"), lambda m: f"{m.group(1)}米"),
+    ("ALT", re.compile(r"(?<![A-Z])(?:GND|GROUND|地面)(?![A-Z])"), lambda m: "地面"),
+]
+CALL_PATTERN = re.compile(r"(?:[A-Z]{1,2}|\d[A-Z])\d[A-Z]{1,4}(?:/[A-Z0-9]{1,4})?")
+RST_PATTERN = re.compile(r"[1-5][1-9][1-9]?")
+RST_PLAUSIBLE = re.compile(r"[3-5][1-9]9?")   # 本地直接当作信号报告的写法；12、144、435等也可能是频率、波段或门牌，交给AI判断
+FILLER_WORDS = {"DE", "QSL", "TNX", "TKS", "73", "QRZ", "CQ", "RST", "QTH", "RIG", "ANT",
+                "PWR", "ALT", "RMKS", ",", "，", "。", ";", "；", "-", "/"}
+FASTPATH_AUDIT_RATE = 0.0      # 本地完整解析后仍抽样送AI比对的比例，0表示不抽样
+FASTPATH_STATS = {"full": 0, "partial": 0, "none": 0, "compared": 0, "agreed": 0}
+FASTPATH_MISMATCHES = []       # 最近的 (字段, 本地结果, AI结果)
+EDIT_FIELD_ALIASES = {    # EDIT更正内容中的字段名写法 -> 字段
+    "CALL": "CALL", "CALLSIGN": "CALL", "呼号": "CALL",
+    "RST": "RST", "REPORT": "RST", "信号报告": "RST", "信号": "RST", "报告": "RST",
+    "QTH": "QTH", "LOCATION": "QTH", "地点": "QTH", "位置": "QTH", "地址": "QTH",
+    "RIG": "RIG", "RADIO": "RIG", "设备": "RIG", "机器": "RIG", "电台": "RIG",
+    "ANT": "ANT", "ANTENNA": "ANT", "天线": "ANT",
+    "PWR": "PWR", "POWER": "PWR", "功率": "PWR",
+    "ALT": "ALT", "HEIGHT": "ALT", "ALTITUDE": "ALT", "高度": "ALT", "海拔": "ALT", "楼层": "ALT",
+    "RMKS": "RMKS", "REMARKS": "RMKS", "REMARK": "RMKS", "NOTE": "RMKS", "备注": "RMKS",
+}
+EDIT_CLEAR_WORDS = {"NULL", "NONE", "无", "没有", "删除", "删掉", "清空", "去掉"}
+EDIT_CLAUSE = re.compile(
+    r"(?:把|将|CHANGE\s+|SET\s+|FIX\s+)?("
+    + "|".join(sorted(map(re.escape, EDIT_FIELD_ALIASES), key = len, reverse = True))
+    + r")(?![A-Z])\s*(?:的)?\s*(?:改为|改成|更正为|更改为|修改为|换成|应为|应该是|是|为|=|:|：|->|→|(?:TO|IS|SHOULD\s+BE)\s+)?\s*(.*)",
+    re.IGNORECASE)
+EDIT_SEPARATORS = re.compile(r"\s*[,，;；、\n]\s*")
+EDIT_FIELD_WORD = re.compile(    # 值中出现字段名：多半是没有分隔的几个子句，交给AI
+    r"(?<![A-Z0-9])(?:" + "|".join(sorted((re.escape(a) for a in EDIT_FIELD_ALIASES if a.isascii()), key = len, reverse = True))
+    + r")(?![A-Z0-9])|" + "|".join(sorted((re.escape(a) for a in EDIT_FIELD_ALIASES if not a.isascii()), key = len, reverse = True)),
+    re.IGNORECASE)
+EDIT_VAGUE = re.compile(    # 含这些词的更正交给AI理解
+    r"不|没|错|？|\?|或者|可能|(?<![A-Z])(?:NOT|NO|WRONG|BROKEN|MAYBE|PERHAPS|PROBABLY|MIGHT|SHOULD|CHECK(?:ED)?|"
+    r"LATER|UNSURE|UNKNOWN|OR)(?![A-Z])", re.IGNORECASE)
+EDIT_STATS = {"local": 0, "model": 0}
+PROFILE_FILE = "station_profiles.json"  # 常客档案：呼号 -> 最近报告的QTH、设备等；设为空字符串则不使用
+PROFILE_FIELDS = ["QTH", "RIG", "ANT", "PWR", "ALT"]
+PROFILE_MAX_PLACES = 8         # 每个呼号记住的地名写法数量
+PROFILE_STATS = {"known": 0, "prefilled": 0, "places": 0}
+GAZETTEER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer")  # 地名表目录，读取其中的“{CITY}.tsv”
+GAZETTEER_STATS = {"resolved": 0, "corrected": 0}
+CALL_BLOCKS = [    # ITU呼号前缀分配（节选）：(前缀或“起-止”, 国家或地区)
+    ("BA-BL", "China"), ("BR-BT", "China"), ("BY-BZ", "China"), ("BM-BQ", "Taiwan"), ("BU-BX", "Taiwan"),
+    ("VR", "Hong Kong"), ("XX", "Macao"), ("JA-JS", "Japan"), ("7J-7N", "Japan"), ("8J-8N", "Japan"),
+    ("HL", "South Korea"), ("DS-DT", "South Korea"), ("6K-6N", "South Korea"), ("P5-P9", "North Korea"),
+    ("JT-JV", "Mongolia"), ("UA-UI", "Russia"), ("R", "Russia"), ("UN-UQ", "Kazakhstan"),
+    ("K", "USA"), ("W", "USA"), ("N", "USA"), ("AA-AL", "USA"), ("VA-VG", "Canada"), ("VO", "Canada"),
+    ("VY", "Canada"), ("XE-XI", "Mexico"), ("VK", "Australia"), ("AX", "Australia"), ("ZL-ZM", "New Zealand"),
+    ("HS", "Thailand"), ("E2", "Thailand"), ("9V", "Singapore"), ("9M", "Malaysia"), ("9W", "Malaysia"),
+    ("YB-YH", "Indonesia"), ("DU-DZ", "Philippines"), ("4D-4I", "Philippines"), ("XV", "Vietnam"),
+    ("3W", "Vietnam"), ("XU", "Cambodia"), ("XW", "Laos"), ("XY-XZ", "Myanmar"), ("V8", "Brunei"),
+    ("VU", "India"), ("AT-AW", "India"), ("AP-AS", "Pakistan"), ("4S", "Sri Lanka"), ("9N", "Nepal"),
+    ("S2", "Bangladesh"), ("A6", "UAE"), ("HZ", "Saudi Arabia"), ("7Z", "Saudi Arabia"), ("4X", "Israel"),
+    ("TA-TC", "Turkey"), ("SU", "Egypt"), ("ZS-ZU", "South Africa"), ("G", "England"), ("M", "England"),
+    ("2", "England"), ("EI-EJ", "Ireland"), ("DA-DR", "Germany"), ("F", "France"), ("I", "Italy"),
+    ("EA-EH", "Spain"), ("CT", "Portugal"), ("HB", "Switzerland"), ("OE", "Austria"), ("ON-OT", "Belgium"),
+    ("PA-PI", "Netherlands"), ("OU-OZ", "Denmark"), ("LA-LN", "Norway"), ("SA-SM", "Sweden"),
+    ("OF-OJ", "Finland"), ("SN-SR", "Poland"), ("OK-OL", "Czechia"), ("HA", "Hungary"), ("HG", "Hungary"),
+    ("YO-YR", "Romania"), ("UR-UZ", "Ukraine"), ("EM-EO", "Ukraine"), ("SV-SZ", "Greece"),
+    ("PP-PY", "Brazil"), ("LO-LW", "Argentina"), ("CA-CE", "Chile"), ("OA-OC", "Peru"), ("HK", "Colombia"),
+]
+CN_AMATEUR_SERIES = "ADGHITY"  # 中国大陆业余电台使用的B字头第二个字母（BY为集体台，BT为特设台）
+CALL_CONFUSABLE = {"0": "O", "O": "0Q", "Q": "O", "1": "IL", "I": "1", "L": "1", "5": "S", "S": "5",
+                   "2": "Z", "Z": "2", "8": "B", "B": "8", "6": "G", "G": "6"}   # 手写或抄收时容易混淆的字符
+CALL_SOUNDALIKE = ["BCDEGPTVZ", "MN", "FSX", "AJK", "IY", "QU"]   # 英文字母读音相近的组
+CALL_STRUCTURE = re.compile(r"([A-Z]{1,2}|[A-Z]\d|\d[A-Z])(\d)([A-Z]{1,4})")
+
+MAX_CONCURRENT_REQUESTS = 4    # 同时进行的API请求数量上限
+JOURNAL_FILE = "journal.jsonl"           # 每次增改都会追加一行，程序意外退出后可以恢复；设为空字符串则不记录
+JOURNAL_SNAPSHOT = "journal_snapshot.json"
+JOURNAL_COMPACT_EVERY = 200             # 每记录这么多行就合并为一次快照
+LOGBOOK_DB = "logbook.db"               # 历次点名的SQLite日志簿，可查询历史；设为空字符串则不使用
+LIVE_EXPORT_FILE = ""                   # 点名过程中随时更新的记录文件（.csv/.adi/.log），如供俱乐部大屏显示；空字符串则不写
+STATION_FREQ = "144.640"                # 点名频率（MHz），写入ADIF和Cabrillo
+STATION_MODE = "FM"
+STATION_BANDS = [    # (起, 止 MHz, ADIF波段, Cabrillo频率栏)；短波的Cabrillo频率栏写kHz
+    (1.8, 2.0, "160m", None), (3.5, 4.0, "80m", None), (7.0, 7.3, "40m", None), (14.0, 14.35, "20m", None),
+    (21.0, 21.45, "15m", None), (28.0, 29.7, "10m", None), (50.0, 54.0, "6m", "50"),
+    (144.0, 148.0, "2m", "144"), (222.0, 225.0, "1.25m", "222"), (420.0, 450.0, "70cm", "432"),
+]
+CABRILLO_CONTEST = "ROLL-CALL"
+TRANSCRIPT_TIME = re.compile(r"(\d{1,2}):(\d{2})(?::(\d{2}))?\s+(.+)")   # 笔记中每行开头可选的时间（时:分[:秒]）
+
+STREAM_MODE = True             # 流式接收AI的回答，CALL和RST一生成完就显示出来
+STREAM_STATS = {"requests": 0, "first_field": 0.0, "total": 0.0}
+STATS_DUMP = False             # 保存备份（SAVE）时，另存一份各环节耗时与token用量（stats_时间.json）供日后分析
+STATS_MAX_SAMPLES = 5000       # 每个环节保留的最近耗时样本数
+STATS_STAGES = ["prompt", "api", "first_token", "generate", "model", "parse", "record", "qso_total", "edit_total"]
+TOKEN_PRICES = {"prompt": 2.0, "cached": 0.2, "completion": 3.0}   # 每百万token的价格（元），请按所用模型的官网价格修改
+TOKEN_STATS = {kind: {"requests": 0, "prompt": 0, "cached": 0, "completion": 0} for kind in ("qso", "edit")}
+STAGE_TIMES = {}               # 环节 -> 最近的耗时（秒）
+BATCH_MODE = True              # 把排队中的多条QSO合并为一次请求
+BATCH_MAX_SIZE = 8             # 每批最多的条目数
+BATCH_FLUSH_SEC = 0.3          # 取到第一条后，最多再等待这么久以凑成一批
+TYPEAHEAD_MODE = False         # 用行编辑器输入（需要prompt_toolkit）：输入停顿时先把这一行送AI，回车时内容没变就直接用其结果；也可用TYPEAHEAD ON/OFF切换
+TYPEAHEAD_PAUSE = 0.4          # 停止输入这么久（秒）后发出预测请求
+TYPEAHEAD_MIN_CHARS = 8        # 不足这么多字符时不预测
+TYPEAHEAD_STATS = {"requests": 0, "hits": 0, "ready": 0, "wasted": 0, "stopped": 0}
+SHOW_PAGE_SIZE = 20            # SHOW每页的记录数；不带参数的SHOW只显示最后一页
+SHOW_COLUMNS = (("NR", 4), ("DATE", 10), ("UTC", 8), ("CALL", 10), ("RST", 4), ("QTH", 14), ("RIG", 12),
+                ("ANT", 12), ("PWR", 6), ("ALT", 8), ("RMKS", 20))   # (字段, 显示宽度)；RMKS占满终端剩下的宽度，至少20
+COMMAND_WORDS = {"HELP", "H", "SAVE", "S", "LOAD", "L", "FINAL", "SF", "OP", "EDIT", "E", "QUIT", "SHOW", "PENDING",
+                 "BATCH", "B", "CLEAR", "STATUS", "STATS", "SEEN", "CHECKINS", "SESSIONS", "EXPORT", "TYPEAHEAD"}
+PENDING_MARK = "..."           # AI处理完成之前，占位记录各字段显示的内容
+PENDING = {}                   # NR -> (原始文本, 提交时间)，正在等待AI处理的条目
+RECORD_LOCK = threading.RLock()
+PROMPT_SHOWN = threading.Event()   # 主线程正阻塞在 input() 上
+_EXECUTOR = None
+_FUTURES = []
+_HTTP_CLIENT = None            # 所有后端共用的HTTP连接池
+_CLIENT_LOCK = threading.Lock()
+_BACKENDS = None               # {"backends": 名称 -> Backend, "routes": "qso"/"edit" -> [Backend]}
+_ROUTE_LOCK = threading.Lock()
+_CACHE = None                  # OrderedDict: key -> [时间戳, 结果JSON]
+_CACHE_LOCK = threading.RLock()
+_INFLIGHT = {}                 # key -> Future，正在请求中的相同文本只发送一次
+_PROFILES = None               # {"stations": 呼号 -> 档案, "sources": 已导入的CSV -> 修改时间}
+_PROFILE_LOCK = threading.RLock()
+_GAZETTEER = None              # 首次使用时读取的地名表（Gazetteer），没有地名表时为False
+_GAZETTEER_LOCK = threading.Lock()
+_CALL_TRIE = None              # 由CALL_BLOCKS生成的前缀树
+_CALL_INDEX = None             # 删去一个字符后的写法 -> 已知呼号，用于查找相差一个字符的呼号
+_CALL_LOCK = threading.Lock()
+_JOURNAL = None                # 日志文件句柄，首次写入时打开
+_JOURNAL_SEQ = 0
+_JOURNAL_SINCE_SNAPSHOT = 0
+JOURNAL_LISTENERS = []         # 每写一条日志都按顺序调用一次（共享会话服务器借此广播记录的增改）
+SOURCE_LINES = []              # 无界面模式下已提交的每行笔记的哈希，与RECORD一一对应，续跑时据此核对笔记文件
+_LOGBOOK = None                # SQLite连接，首次使用时打开
+_LOGBOOK_LOCK = threading.Lock()
+_LIVE_EXPORT = None            # LIVE_EXPORT_FILE对应的ExportFile
+_EXPORTS = {}                  # 文件名 -> ExportFile，再次导出同一文件时只重写变化的部分
+_EARLY_LISTENERS = {}          # key -> 等待流式字段的占位记录
+_BATCH_QUEUE = queue.Queue()   # (key, 原始文本, Future)，等待合并发送的条目
+_BATCH_SLOTS = threading.Semaphore(MAX_CONCURRENT_REQUESTS)
+_BATCH_LOCK = threading.Lock()
+_BATCH_THREAD = None
+_STATS_LOCK = threading.Lock()
+_BATCH_STATE = {"size": max(1, BATCH_MAX_SIZE // 2), "batches": 0, "lines": 0, "retried": 0}
+API_STATS = {"retries": 0, "hedged": 0, "hedge_won": 0, "timeouts": 0, "deferred": 0, "recovered": 0}
+_BREAKER = {"state": "closed", "failures": 0, "opened": 0.0, "trips": 0, "probe": False}
+_BREAKER_LOCK = threading.Lock()
+_CALL_POOL = None              # 执行单次API请求的线程，对冲请求与原请求并行
+_RETRY = {}                    # NR -> [记录, 原始文本, 已失败次数, 下次重试时间]，识别失败、等待重新处理的QSO
+_RETRY_WAKE = threading.Event()
+_RETRY_THREAD = None
+_WARNINGS = None               # 无人值守模式下收集的 (NR, 提示)，处理完后统一列出
+_TYPEAHEAD = {"edits": 0, "timer": None, "request": None}   # 输入行的修改次数、停顿计时器、当前的预测请求
+_TYPEAHEAD_LOCK = threading.Lock()
+_LINE_EDITOR = None            # prompt_toolkit的PromptSession，首次使用时创建；无法使用时为False
 
-def cprint(text: str, color: str = "WHITE", bright: bool = False, end_str: str = "\n") -> None:
+def cprint(text: str, color: str = "WHITE", bright: bool = False, end_str: str = "\n", flush: bool = False) -> None:
     """
     彩色打印函数，自动处理 colorama 是否可用。
     
@@ -61,368 +402,3150 @@ def cprint(text: str, color: str = "WHITE", bright: bool = False, end_str: str =
         颜色名称，如 'RED', 'GREEN', 'YELLOW', 'BLUE', 'MAGENTA', 'CYAN', 'WHITE'。
     bright : bool
         是否使用高亮（bright）样式。
+    flush : bool
+        是否立即刷新输出（后台线程打印提示符时使用）。
     """
     if COLORS_AVAILABLE:
         color_code = getattr(Fore, color.upper(), Fore.WHITE)
         style_code = Style.BRIGHT if bright else Style.NORMAL
         reset_code = Style.RESET_ALL
-        print(f"{style_code}{color_code}{text}{reset_code}", end = end_str)
+        print(f"{style_code}{color_code}{text}{reset_code}", end = end_str, flush = flush)
     else:
         # 无 colorama 时直接打印原文
-        print(text, end = end_str)
+        print(text, end = end_str, flush = flush)
 
 
-def get_client():
-    return OpenAI(
-        api_key = os.getenv("DEEPSEEK_API_KEY"),
-        base_url = "https://api.deepseek.com/v1",
-    )
+class Backend:
+    """
+    One OpenAI-compatible endpoint (DeepSeek, Qwen, a local llama.cpp or
+    Ollama server...) with its own client and a rolling score: the moving
+    averages of its latency and error rate.
+    """
+    
+    __slots__ = ("name", "base_url", "model", "api_key_env", "client", "latency", "error_rate", "requests", "errors",
+                 "samples")
+    
+    def __init__(self, name: str, base_url: str, model: str, api_key_env: str = API_KEY_ENV):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key_env = api_key_env    # 空字符串表示不需要API key（本地服务器）
+        self.client = None
+        self.latency = None               # 成功请求耗时的移动平均（秒）
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.samples = deque(maxlen = 200)    # 最近成功请求的耗时，用于决定何时发出对冲请求
+    
+    def score(self) -> float:
+        """
+        Expected seconds per successful answer, counting the failed requests
+        and the waits before their retries; lower is better. A backend not
+        tried yet scores 0, so every backend gets a first request.
+        """
+        
+        if self.latency is None:
+            latency = API_DEADLINE if self.requests else 0.0
+        else:
+            latency = self.latency
+        errors = min(0.95, self.error_rate)
+        return (latency + errors * API_RETRY_BASE) / (1.0 - errors)
+    
+    def report(self, seconds: float, ok: bool) -> None:
+        """
+        Adds the outcome of one request to the moving averages.
+        """
+        
+        with _ROUTE_LOCK:
+            self.requests += 1
+            self.errors += not ok
+            self.error_rate += ROUTE_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                self.latency = seconds if self.latency is None else self.latency + ROUTE_ALPHA * (seconds - self.latency)
+                self.samples.append(seconds)
 
 
-def get_respond(raw_text):
+def load_backends() -> dict:
     """
-    Parameters
-    ----------
-    raw_text : str
-        Row text recorded while listening to the callee.
-
-    Returns
-    -------
-    record : srt(json)
-        Formatted text, including CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS.
+    Returns the backend registry, reading BACKENDS_FILE on first use:
         
-    The function is called to call the API
-        (using environment veriable API_key)
-            to obtain a formatted json result.
+        {"backends": [{"name": ..., "base_url": ..., "model": ..., "api_key_env": ...}, ...],
+         "routes": {"qso": [names], "edit": [names]}}
+    
+    A kind missing from "routes" may use every backend, so pinning edits
+    and new QSOs to different models is a matter of listing them there.
+    Without the file (or when it is unusable) the single backend is
+    API_BASE_URL / MODEL_NAME / API_KEY_ENV.
+    """
+    
+    global _BACKENDS
+    with _ROUTE_LOCK:
+        if _BACKENDS is not None:
+            return _BACKENDS
+        
+        default = Backend("default", API_BASE_URL, MODEL_NAME, API_KEY_ENV)
+        backends, routes = {}, {}
+        if BACKENDS_FILE and os.path.exists(BACKENDS_FILE):
+            try:
+                with open(BACKENDS_FILE, 'r', encoding = 'utf-8') as f:
+                    config = json.load(f)
+                for item in config.get("backends", []):
+                    backends[item["name"]] = Backend(item["name"], item["base_url"], item["model"],
+                                                     item.get("api_key_env", API_KEY_ENV))
+                for kind, names in config.get("routes", {}).items():
+                    unknown = [name for name in names if name not in backends]
+                    if unknown:
+                        cprint(f"Unknown backend(s) in {BACKENDS_FILE} routes.{kind}: {', '.join(unknown)}", "YELLOW")
+                    routes[kind] = [backends[name] for name in names if name in backends]
+            except Exception as e:
+                cprint(f"Error loading {BACKENDS_FILE}, using {MODEL_NAME} only: {e}", "RED")
+                backends, routes = {}, {}
+        
+        if not backends:
+            backends = {default.name: default}
+        for kind in ("qso", "edit"):
+            if not routes.get(kind):
+                routes[kind] = list(backends.values())
+        _BACKENDS = {"backends": backends, "routes": routes}
+        return _BACKENDS
+
 
+def route(kind: str) -> list:
+    """
+    Returns the backends that may serve requests of `kind` ("qso" or "edit").
     """
-    client = get_client()
     
-    sys_prompt = (
-        "你是一名资深业余无线电爱好者，现在需要帮助新手将杂乱的信息整理成一条有序的QSO记录。"
-        "你需要从中提取相关信息，推测地点、设备、高度、天线等。除了设备（如UV-K6等）需要用字母，其他信息请使用数字和中文表述。"
-        "需要提取的字段，分别是CALL（呼号）, RST（信号报告）, QTH（地址）, RIG（设备）, ANT（天线）, PWR（功率）, ALT（高度，通常为几米或几楼）, RMKS（备注）。"
-        f"你所在的城市是{CITY}，推测地点时需要优先考虑本地以及附近地区的地名。"
-        "一些可能的缩写，供你参考：“3ele yagi”表示“3单元八木”，“orgn”表示“原装（天线）”，“gnd”表示“地面高度（ground）”，等。"
-        "请返回JSON格式的内容，不要输出其他任何多余的内容！"
-    )
+    return load_backends()["routes"][kind]
+
+
+def pick_backend(kind: str, exclude = ()):
+    """
+    Returns the backend for the next request of `kind`: the best score among
+    its route, leaving out `exclude` (backends that just failed, or the one
+    already running when hedging) unless nothing else is left. With
+    probability ROUTE_EXPLORE another backend is tried instead.
+    """
     
-    usr_prompt = (
-        f"请根据下文推测相关信息，如果遇到无法辨别的字段，请使用字符串NULL表示。信号报告默认为59。"
-        f"\n\n输入文本：{raw_text}"
-        f"\n\n请严格按照以下JSON格式返回："
-        f'{{"CALL": "呼号", "RST": "信号报告", "QTH": "地点", "RIG": "设备", "ANT": "天线", "PWR": "功率", "ALT": "高度", "RMKS": "备注"}}'
-    )
+    candidates = [b for b in route(kind) if b not in exclude] or route(kind)
+    if len(candidates) > 1 and random.random() < ROUTE_EXPLORE:
+        return random.choice(candidates)
+    return min(candidates, key = lambda b: b.score())    # 分数相同时按配置文件中的顺序
+
+
+def get_client(backend: Backend = None):
+    """
+    Returns the API client of `backend` (by default the first backend for
+    QSOs), creating it on first use.
     
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": usr_prompt},
-            ],
-            stream = False,
-            temperature = 0.8,
-            response_format = {"type": "json_object"}  # 确保返回JSON格式
-        )
-        
-        # 提取AI返回的内容
-        content = response.choices[0].message.content
-        
-        # 尝试解析JSON
+    All clients share one HTTP connection pool with keep-alive, so only the
+    first request to each server pays for the TCP/TLS handshake.
+    OpenAI clients are thread-safe, so the worker pool can share them too.
+    """
+    
+    global _HTTP_CLIENT
+    import httpx
+    from openai import OpenAI
+    
+    if backend is None:
+        backend = route("qso")[0]
+    with _CLIENT_LOCK:
+        if backend.client is None:
+            if _HTTP_CLIENT is None:
+                _HTTP_CLIENT = httpx.Client(
+                    limits = httpx.Limits(
+                        max_connections = MAX_CONCURRENT_REQUESTS * 2,
+                        max_keepalive_connections = MAX_CONCURRENT_REQUESTS,
+                        keepalive_expiry = API_KEEPALIVE,
+                    ),
+                    timeout = httpx.Timeout(API_TIMEOUT, connect = API_CONNECT_TIMEOUT),
+                )
+            backend.client = OpenAI(
+                api_key = os.getenv(backend.api_key_env) if backend.api_key_env else "local",
+                base_url = backend.base_url,
+                http_client = _HTTP_CLIENT,
+            )
+        return backend.client
+
+
+def warm_up_client() -> None:
+    """
+    
+    The function opens the pooled connection to every backend ahead of the
+    first QSO. It is run in a background thread at startup; failures are
+    only reported.
+    
+    """
+    
+    for backend in load_backends()["backends"].values():
         try:
-            result = json.loads(content)
-            # 确保所有必需字段都存在
-            required_fields = ["CALL", "RST", "QTH", "RIG", "ANT", "PWR", "ALT", "RMKS"]
-            
-            for field in required_fields:
-                if field not in result:
-                    result[field] = "NULL"
-            return json.dumps(result, ensure_ascii = False)
-        
-        except json.JSONDecodeError:
-            # 如果解析失败，返回一个默认的JSON结构
-            cprint(f"Warning: Could not parse JSON response: {content}", "YELLOW")
-            return json.dumps({
-                "CALL": "NULL",
-                "RST": "NULL",
-                "QTH": "NULL",
-                "RIG": "NULL",
-                "ANT": "NULL",
-                "PWR": "NULL",
-                "ALT": "NULL",
-                "RMKS": content  # 将原始响应作为备注
-            }, ensure_ascii = False)
-            
+            get_client(backend).models.list()
+        except Exception as e:
+            cprint(f"API warm-up failed ({backend.name}): {e}", "YELLOW")
+
+
+def start_warm_up() -> None:
+    """
+    
+    The function starts warm_up_client() in a daemon thread.
+    
+    """
+    
+    threading.Thread(target = warm_up_client, name = "warm-up", daemon = True).start()
+
+
+def null_result(rmks: str) -> str:
+    """
+    Returns a JSON record with every field set to NULL, and `rmks` as RMKS.
+    Used when the API call or the JSON parsing fails.
+    """
+    
+    result = {field: "NULL" for field in REQUIRED_FIELDS}
+    result["RMKS"] = rmks
+    return json.dumps(result, ensure_ascii = False)
+
+
+def api_failed(result: dict) -> bool:
+    """
+    True when `result` is the null_result() of a failed API call (as
+    opposed to an answer with unknown fields).
+    """
+    
+    return str(result.get("RMKS", "")).startswith(API_ERROR)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    Adds one timing sample (seconds) of a hot-path stage, see STATS_STAGES.
+    """
+    
+    with _STATS_LOCK:
+        if stage not in STAGE_TIMES:
+            STAGE_TIMES[stage] = deque(maxlen = STATS_MAX_SAMPLES)
+        STAGE_TIMES[stage].append(seconds)
+
+
+def record_usage(kind: str, usage) -> None:
+    """
+    Adds the `usage` of one API response to TOKEN_STATS[kind] ("qso" or
+    "edit"). Cached prompt tokens are read from DeepSeek's
+    prompt_cache_hit_tokens or OpenAI's prompt_tokens_details.
+    """
+    
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(usage, "prompt_cache_hit_tokens", None) or getattr(details, "cached_tokens", None) or 0
+    with _STATS_LOCK:
+        stats = TOKEN_STATS[kind]
+        stats["requests"] += 1
+        stats["prompt"] += usage.prompt_tokens or 0
+        stats["cached"] += cached
+        stats["completion"] += usage.completion_tokens or 0
+
+
+def call_model_once(sys_prompt: str, usr_prompt: str, on_field = None, kind: str = "qso",
+                    timeout: float = API_TIMEOUT, backend: Backend = None, cancel: threading.Event = None) -> str:
+    """
+    Sends one chat completion to `backend`, without retries, and returns the
+    message content; see call_model() for the other parameters. `timeout`
+    (seconds) bounds the connection and every read. The outcome is added to
+    the backend's score; exceptions from the API are passed on.
+    """
+    
+    backend = backend or pick_backend(kind)
+    start = time.perf_counter()
+    try:
+        content = request_completion(backend, sys_prompt, usr_prompt, on_field, kind, timeout, cancel)
+    except RequestCancelled:
+        raise    # 与后端的好坏无关
     except Exception as e:
-        cprint(f"API调用错误: {e}", "RED")
-        # 返回一个默认的JSON结构作为错误处理
-        return json.dumps({
-            "CALL": "NULL",
-            "RST": "NULL",
-            "QTH": "NULL",
-            "RIG": "NULL",
-            "ANT": "NULL",
-            "PWR": "NULL",
-            "ALT": "NULL",
-            "RMKS": f"API调用错误: {str(e)}"
-        }, ensure_ascii = False)
+        # 400等错误与后端的好坏无关
+        backend.report(time.perf_counter() - start, not (retryable(e) or getattr(e, "status_code", None) in (401, 403)))
+        raise
+    backend.report(time.perf_counter() - start, True)
+    return content
 
 
-def get_respond_for_edit(original_record: str, correction: str):
+def request_completion(backend: Backend, sys_prompt: str, usr_prompt: str, on_field, kind: str,
+                       timeout: float, cancel: threading.Event = None) -> str:
     """
-    专门用于编辑记录的API调用函数，基于原始记录和更正内容生成新的记录
+    The request of call_model_once(), streamed or not. A streamed answer is
+    abandoned (connection closed) as soon as `cancel` is set.
     """
-    client = get_client()
     
-    sys_prompt = (
-        "你是一名资深业余无线电爱好者，现在需要帮助新手将杂乱的信息整理成一条有序的QSO记录。"
-        "你需要从中提取相关信息，推测地点、设备、高度、天线等。除了设备（如UV-K6等）需要用字母，其他信息请使用数字和中文表述。"
-        "需要提取的字段，分别是CALL（呼号）, RST（信号报告）, QTH（地址）, RIG（设备）, ANT（天线）, PWR（功率）, ALT（高度，通常为几米或几楼）, RMKS（备注）。"
-        f"你所在的城市是{CITY}，推测地点时需要优先考虑本地以及附近地区的地名。"
-        "一些可能的缩写，供你参考：“3ele yagi”表示“3单元八木”，“orgn”表示“原装（天线）”，“gnd”表示“地面高度（ground）”，等。"
-        "请返回JSON格式的内容，不要输出其他任何多余的内容！"
+    if cancel is not None and cancel.is_set():
+        raise RequestCancelled("request cancelled")
+    import httpx
+    client = get_client(backend).with_options(
+        timeout = httpx.Timeout(timeout, connect = min(API_CONNECT_TIMEOUT, timeout)),
+        max_retries = 0,    # 重试由call_model()负责
     )
-    
-    usr_prompt = (
-        f"原始记录：{original_record}\n\n"
-        f"更正内容：{correction}\n\n"
-        f"请根据更正内容对原始记录进行修正，如果更正内容中没有提到的字段，保持原记录的值不变。"
-        f"请严格按照以下JSON格式返回："
-        f'{{"CALL": "呼号", "RST": "信号报告", "QTH": "地点", "RIG": "设备", "ANT": "天线", "PWR": "功率", "ALT": "高度", "RMKS": "备注"}}'
+    start = time.perf_counter()
+    response = client.chat.completions.create(
+        model = backend.model,
+        messages=[
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": usr_prompt},
+        ],
+        stream = STREAM_MODE,
+        temperature = 0.8,
+        response_format = {"type": "json_object"},  # 确保返回JSON格式
+        **({"stream_options": {"include_usage": True}} if STREAM_MODE else {})  # 流式时在最后一块返回token用量
     )
+    # 非流式时包括生成的全部时间；流式时为收到响应头的时间（网络与排队）
+    record_stage("api", time.perf_counter() - start)
     
-    try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": usr_prompt},
-            ],
-            stream = False,
-            temperature = 0.8,
-            response_format = {"type": "json_object"}  # 确保返回JSON格式
-        )
-        
+    if not STREAM_MODE:
+        record_usage(kind, response.usage)
+        record_stage("model", time.perf_counter() - start)
         # 提取AI返回的内容
-        content = response.choices[0].message.content
-        
-        # 尝试解析JSON
-        try:
-            result = json.loads(content)
-            # 确保所有必需字段都存在
-            required_fields = ["CALL", "RST", "QTH", "RIG", "ANT", "PWR", "ALT", "RMKS"]
-            
-            for field in required_fields:
-                if field not in result:
-                    result[field] = "NULL"
-            return json.dumps(result, ensure_ascii = False)
-        
-        except json.JSONDecodeError:
-            # 如果解析失败，返回一个默认的JSON结构
-            cprint(f"Warning: Could not parse JSON response: {content}", "YELLOW")
-            return json.dumps({
-                "CALL": "NULL",
-                "RST": "NULL",
-                "QTH": "NULL",
-                "RIG": "NULL",
-                "ANT": "NULL",
-                "PWR": "NULL",
-                "ALT": "NULL",
-                "RMKS": content  # 将原始响应作为备注
-            }, ensure_ascii = False)
-            
-    except Exception as e:
-        cprint(f"API调用错误: {e}", "RED")
-        # 返回一个默认的JSON结构作为错误处理
-        return json.dumps({
-            "CALL": "NULL",
-            "RST": "NULL",
-            "QTH": "NULL",
-            "RIG": "NULL",
-            "ANT": "NULL",
-            "PWR": "NULL",
-            "ALT": "NULL",
-            "RMKS": f"API调用错误: {str(e)}"
-        }, ensure_ascii = False)
+        return response.choices[0].message.content
+    
+    headers = time.perf_counter()
+    first_token = None
+    first_field = []
+    
+    def field_done(obj, key, value):
+        if not first_field:
+            first_field.append(time.perf_counter() - start)
+        if on_field is not None:
+            on_field(obj, key, value)
+    
+    parser = StreamFieldParser(field_done)
+    parts = []
+    for chunk in response:
+        if cancel is not None and cancel.is_set():
+            response.close()    # 断开连接，服务端随之停止生成
+            raise RequestCancelled("request cancelled")
+        if getattr(chunk, "usage", None) is not None:
+            record_usage(kind, chunk.usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if first_token is None:
+                first_token = time.perf_counter()
+                record_stage("first_token", first_token - headers)
+            parts.append(delta)
+            parser.feed(delta)
+    if first_token is not None:
+        record_stage("generate", time.perf_counter() - first_token)
+    
+    with _STATS_LOCK:
+        STREAM_STATS["requests"] += 1
+        STREAM_STATS["first_field"] += first_field[0] if first_field else time.perf_counter() - start
+        STREAM_STATS["total"] += time.perf_counter() - start
+    record_stage("model", time.perf_counter() - start)
+    return "".join(parts)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised by call_model() without contacting the API while the circuit
+    breaker is open (local-only mode).
+    """
+
 
+class RequestCancelled(Exception):
+    """
+    Raised by call_model() when its `cancel` event is set, e.g. for a
+    speculative request whose line was changed (see speculate()).
+    """
+
+
+def retryable(error: BaseException) -> bool:
+    """
+    True for errors worth retrying: timeouts, connection errors, 429 and 5xx.
+    """
     
-def save_final(filename):
+    if isinstance(error, TimeoutError):
+        return True
+    openai = sys.modules.get("openai")
+    if openai is None:    # 尚未导入openai，错误不是API返回的
+        return False
+    if isinstance(error, openai.APIConnectionError):    # APITimeoutError也属于APIConnectionError
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def background_print(text: str, color: str) -> None:
     """
-    Parameters
-    ----------
-    filename : str
-        The name of the final record file, without filetype postfix.
+    Prints a message from a worker thread, redrawing the prompt if the
+    operator is typing.
+    """
+    
+    if PROMPT_SHOWN.is_set():
+        cprint(f"\n{text}", color)
+        print_prompt()
+    else:
+        cprint(text, color)
 
-    Returns
-    -------
-    None.
+
+def breaker_allow() -> bool:
+    """
+    Returns whether the API may be called. After BREAKER_COOLDOWN in
+    local-only mode a single trial request is let through (half-open).
+    """
     
-    The function is called to save the record as a .csv file.
+    with _BREAKER_LOCK:
+        if _BREAKER["state"] == "closed":
+            return True
+        if _BREAKER["state"] == "open":
+            if time.monotonic() - _BREAKER["opened"] < BREAKER_COOLDOWN:
+                return False
+            _BREAKER["state"] = "half-open"
+        if _BREAKER["probe"]:
+            return False
+        _BREAKER["probe"] = True
+        return True
 
+
+def breaker_report(ok: bool) -> None:
+    """
+    Updates the circuit breaker with the outcome of one API request.
+    BREAKER_THRESHOLD failures in a row, or a failed trial request, switch
+    to local-only mode; the first success switches back and wakes the
+    deferred QSOs.
     """
     
-    global RECORD
-    if not filename.endswith('.csv'):
-        filename += '.csv'
+    tripped = recovered = False
+    with _BREAKER_LOCK:
+        _BREAKER["probe"] = False
+        if ok:
+            recovered = _BREAKER["state"] != "closed"
+            _BREAKER["state"] = "closed"
+            _BREAKER["failures"] = 0
+        else:
+            _BREAKER["failures"] += 1
+            if _BREAKER["state"] == "half-open" or (_BREAKER["state"] == "closed"
+                                                     and _BREAKER["failures"] >= BREAKER_THRESHOLD):
+                tripped = _BREAKER["state"] == "closed"
+                _BREAKER["state"] = "open"
+                _BREAKER["opened"] = time.monotonic()
+                _BREAKER["trips"] += tripped
     
-    # 修复CSV编码问题，使用utf-8-sig以避免BOM问题，同时确保中文正确显示
-    with open(filename, 'w', newline = '', encoding = 'utf-8-sig') as csvfile:
-        fieldnames = ['NR', 'DATE', 'UTC', 'CALL', 'RST', 'QTH', 'RIG', 'ANT', 'PWR', 'ALT', 'RMKS', 'OP']
-        writer = csv.DictWriter(csvfile, fieldnames = fieldnames)
-        
-        writer.writeheader()
-        for record in RECORD:
-            row = {
-                'NR': record[0],
-                'DATE': record[1],
-                'UTC': record[2],
-                'CALL': record[3],
-                'RST': record[4],
-                'QTH': record[5],
-                'RIG': record[6],
-                'ANT': record[7],
-                'PWR': record[8],
-                'ALT': record[9],
-                'RMKS': record[10],
-                'OP': record[11]
-            }
-            writer.writerow(row)
-    
-    cprint(f"Final record saved as {filename}", "GREEN")
+    if tripped:
+        background_print(f"AI unreachable ({BREAKER_THRESHOLD} failures in a row): local-only mode, "
+                         f"new QSOs keep their local fields and are retried later", "RED")
+    elif recovered:
+        with RECORD_LOCK:
+            for item in _RETRY.values():
+                if item[3] != float("inf"):    # 已在处理中的不再重复发送
+                    item[3] = min(item[3], time.time())
+        _RETRY_WAKE.set()
+        background_print(f"AI reachable again, {len(_RETRY)} deferred QSO(s) will be retried", "GREEN")
 
 
-def backup():
+def hedge_delay(backend: Backend) -> float:
+    """
+    Seconds to wait for an answer from `backend` before a duplicate (hedged)
+    request is sent: the p95 of its last 200 request durations, or
+    HEDGE_DEFAULT_DELAY while there are fewer than HEDGE_MIN_SAMPLES.
     """
     
-    The function is called halfway, to leave a latest backup file.
+    with _ROUTE_LOCK:
+        samples = list(backend.samples)
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return percentile(sorted(samples), 95)
+
+
+def get_call_pool() -> ThreadPoolExecutor:
+    """
+    Returns the pool running the individual API requests, creating it on
+    first use; each call_model() may have a request and its hedge running.
+    """
     
+    global _CALL_POOL
+    with _CLIENT_LOCK:
+        if _CALL_POOL is None:
+            _CALL_POOL = ThreadPoolExecutor(max_workers = MAX_CONCURRENT_REQUESTS * 2 + 2,
+                                            thread_name_prefix = "api")
+        return _CALL_POOL
+
+
+def hedged_call(sys_prompt: str, usr_prompt: str, on_field, kind: str, deadline: float, failed: list,
+                cancel: threading.Event = None) -> str:
+    """
+    Runs call_model_once() until `deadline` (time.monotonic()) on the best
+    backend not in `failed`. Without an answer after hedge_delay(), the same
+    request is sent once more, to another backend when there is one, and the
+    first successful answer is used; the slower request is left to finish
+    in the background. Backends that fail are added to `failed`. Raises the
+    last error, or TimeoutError.
     """
     
-    global RECORD
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M")
-    filename = f"backup_{timestamp}.json"
+    pool = get_call_pool()
+    backend = pick_backend(kind, failed)
+    first = pool.submit(call_model_once, sys_prompt, usr_prompt, on_field, kind, deadline - time.monotonic(), backend,
+                        cancel)
+    running = [first]
+    backends = {first: backend}
+    hedge_at = time.monotonic() + hedge_delay(backend) if HEDGE_ENABLED else float("inf")
+    hedged = False
+    error = None
     
-    with open(filename, 'w', encoding = 'utf-8') as f:
-        json.dump({
-            "OPERATOR": OPERATOR,
-            "RECORD": RECORD,
-            "NR_COUNTER": NR_COUNTER
-        }, f, ensure_ascii = False, indent = 2)
+    while running:
+        now = time.monotonic()
+        if now >= deadline:
+            with _STATS_LOCK:
+                API_STATS["timeouts"] += 1
+            raise TimeoutError(f"no answer within {API_DEADLINE:g}s")
+        until = deadline if hedged else min(deadline, hedge_at)
+        done, _ = wait(running, timeout = until - now, return_when = FIRST_COMPLETED)
+        for future in done:
+            running.remove(future)
+            if future.exception() is None:
+                if future is not first:
+                    with _STATS_LOCK:
+                        API_STATS["hedge_won"] += 1
+                return future.result()
+            error = future.exception()
+            if isinstance(error, RequestCancelled):
+                raise error
+            failed.append(backends[future])
+        if running and not hedged and time.monotonic() >= hedge_at and not (cancel and cancel.is_set()):
+            hedged = True
+            with _STATS_LOCK:
+                API_STATS["hedged"] += 1
+            backend = pick_backend(kind, failed + list(backends.values()))
+            hedge = pool.submit(call_model_once, sys_prompt, usr_prompt, on_field, kind,
+                                deadline - time.monotonic(), backend, cancel)
+            running.append(hedge)
+            backends[hedge] = backend
+    raise error
+
+
+def call_model(sys_prompt: str, usr_prompt: str, on_field = None, kind: str = "qso",
+               cancel: threading.Event = None) -> str:
+    """
+    Parameters
+    ----------
+    sys_prompt : str
+        System prompt.
+    usr_prompt : str
+        User prompt.
+    on_field : callable, optional
+        With STREAM_MODE, called as on_field(obj, key, value) as soon as a
+        key/value pair of the streamed JSON is complete (see StreamFieldParser).
+    kind : str
+        "qso" or "edit", the TOKEN_STATS entry the usage is added to.
+    cancel : threading.Event, optional
+        Once set, the request is given up with RequestCancelled (not retried,
+        not counted by the circuit breaker).
     
-    cprint(f"Backup saved as {filename}", "CYAN")
+    Returns
+    -------
+    content : str
+        The raw message content returned by the model. Streamed or not, the
+        content is the same, so the assembled record is identical.
     
-    # 清理旧备份文件（保留最近5个）
-    clean_old_backups()
- 
+    Each request goes to the backend of the `kind` route with the best
+    score (see pick_backend). Timeouts, connection errors, 429 and 5xx are
+    retried up to API_RETRIES times with jittered exponential backoff, on
+    another backend when there is one; slow requests are hedged (see
+    hedged_call), and nothing is waited for beyond API_DEADLINE. In
+    local-only mode CircuitOpenError is raised at once. The remaining
+    exceptions from the API are passed to the caller.
     
-def clean_old_backups() -> None:
     """
     
-    The function cleans all old backups but left 5 latest.
+    if not breaker_allow():
+        raise CircuitOpenError("AI unavailable (local-only mode)")
+    
+    deadline = time.monotonic() + API_DEADLINE
+    attempt = 0
+    failed = []
+    while True:
+        try:
+            content = hedged_call(sys_prompt, usr_prompt, on_field, kind, deadline, failed, cancel)
+        except RequestCancelled:
+            with _BREAKER_LOCK:
+                if _BREAKER["state"] == "half-open":
+                    _BREAKER["probe"] = False    # 被取消的试探请求没有结果，由下一个请求再试探
+            raise
+        except Exception as e:
+            # 400等错误说明服务可以访问，不计入熔断
+            breaker_report(not (retryable(e) or getattr(e, "status_code", None) in (401, 403)))
+            attempt += 1
+            delay = API_RETRY_BASE * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            if (attempt > API_RETRIES or not retryable(e)
+                    or time.monotonic() + delay >= deadline or not breaker_allow()):
+                raise
+            with _STATS_LOCK:
+                API_STATS["retries"] += 1
+            time.sleep(delay)
+            continue
+        breaker_report(True)
+        return content
+
+
+class StreamFieldParser:
+    """
+    Incremental parser for a JSON answer arriving in pieces.
     
+    feed() takes the text chunks as they are streamed; on_field(obj, key, value)
+    is called the moment a scalar key/value pair of any object is complete,
+    where `obj` holds the pairs of that object seen so far (so a batched
+    answer can be matched by its ID). Nested containers are walked into.
     """
     
-    backup_files = [f for f in os.listdir('.') if f.startswith('backup_') and f.endswith('.json')]
-    backup_files.sort(key = lambda x: os.path.getmtime(x), reverse = True)
+    def __init__(self, on_field):
+        self.on_field = on_field
+        self.stack = []          # 每层容器一项：对象为 [已完成的键值对, 待定的键]，数组为 None
+        self.in_string = False
+        self.escape = False
+        self.text = []
+        self.scalar = []
     
-    for old_backup in backup_files[5:]:
-        os.remove(old_backup)
-        cprint(f"Removed old backup: {old_backup}", "YELLOW")
+    def feed(self, chunk: str) -> None:
+        for c in chunk:
+            if self.in_string:
+                self.text.append(c)
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    self.value_done(json.loads('"' + "".join(self.text)))
+            elif c == '"':
+                self.in_string = True
+                self.text = []
+            elif c in "{[":
+                if self.stack and self.stack[-1] is not None:
+                    self.stack[-1][1] = None    # 值是容器，不单独报告
+                self.stack.append([{}, None] if c == "{" else None)
+            elif c in "}],":
+                self.flush_scalar()
+                if c != "," and self.stack:
+                    self.stack.pop()
+            elif c not in " \t\r\n:":
+                self.scalar.append(c)
     
+    def flush_scalar(self) -> None:
+        if self.scalar:
+            raw, self.scalar = "".join(self.scalar), []
+            try:
+                self.value_done(json.loads(raw))
+            except json.JSONDecodeError:
+                pass
     
-def clean_bkup():
+    def value_done(self, value) -> None:
+        if not self.stack or self.stack[-1] is None:
+            return
+        entry = self.stack[-1]
+        if entry[1] is None and isinstance(value, str) and not self.scalar:
+            entry[1] = value    # 对象中的字符串先作为键
+            return
+        key, entry[1] = entry[1], None
+        if key is not None:
+            entry[0][key] = value
+            self.on_field(entry[0], key, value)
+
+
+def parse_record(content: str) -> dict:
+    """
+    Parses the model output into a dict holding all required fields
+    (missing ones are set to NULL). Raises json.JSONDecodeError on bad output.
     """
     
-    The function is called to clean all backup files.
+    result = json.loads(content)
+    if not isinstance(result, dict):
+        raise json.JSONDecodeError("JSON object expected", content, 0)
     
+    # 确保所有必需字段都存在
+    for field in REQUIRED_FIELDS:
+        if field not in result:
+            result[field] = "NULL"
+    return result
+
+
+def get_sys_prompt() -> str:
+    """
+    Returns the system prompt shared by QSO extraction and record editing.
+    It contains nothing variable (CITY goes at the end of the user prompt),
+    so providers can cache it together with the static part of the task;
+    see prompt_templates.
     """
     
-    backup_files = [f for f in os.listdir('.') if f.startswith('backup_') and f.endswith('.json')]
+    return prompt_templates.SYSTEM_PROMPT
+
+
+def get_respond(raw_text):
+    """
+    Parameters
+    ----------
+    raw_text : str
+        Row text recorded while listening to the callee.
+
+    Returns
+    -------
+    record : srt(json)
+        Formatted text, including CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS.
+        
+    The function is called to call the API
+        (using environment veriable API_key)
+            to obtain a formatted json result.
     
-    for backup_file in backup_files:
-        os.remove(backup_file)
-        cprint(f"Removed backup: {backup_file}", "YELLOW")
+    The local parser runs first; when it understands the whole line the API
+    is not called at all. Otherwise the fields it did resolve are kept and
+    only the rest is taken from the AI answer.
+
+    """
     
-    cprint("All backup files cleaned.", "RED")
+    local, resolved, result = fast_path(raw_text)
+    if result is not None:
+        return result
+    return merge_local(local, resolved, get_remote_respond(raw_text))
+
+
+def fast_path(raw_text: str):
+    """
+    Runs the local parser on `raw_text` and updates the fast-path counters.
+    
+    Returns (fields, resolved, result): `result` is the finished JSON string
+    when the whole line was understood locally, otherwise None.
+    
+    For a known station, words the operator has typed for its QTH before are
+    resolved from its profile, and fields not stated are pre-filled from it.
+    Otherwise leftover words that clearly name a place in the gazetteer of
+    CITY are taken as the QTH.
+    """
+    
+    local, resolved, leftover, source = resolve_local(raw_text)
+    full = "CALL" in resolved and not leftover
+    with _STATS_LOCK:
+        if source == "profile":
+            PROFILE_STATS["places"] += 1
+        elif source == "gazetteer":
+            GAZETTEER_STATS["resolved"] += 1
+        FASTPATH_STATS["full" if full else "partial" if resolved else "none"] += 1
+    
+    if full:
+        if FASTPATH_AUDIT_RATE and random.random() < FASTPATH_AUDIT_RATE:
+            get_executor().submit(audit_fast_path, raw_text, dict(local), resolved)
+        prefill_from_profile(local)
+        return local, resolved, json.dumps(local, ensure_ascii = False)
+    
+    return local, resolved, None
+
+
+def resolve_local(raw_text: str):
+    """
+    Returns (fields, resolved, leftover, source): local_extract() of
+    `raw_text`, with the leftover words taken as the QTH when the station's
+    profile ("profile") or the gazetteer ("gazetteer") resolves them, source
+    None otherwise. No counters are updated.
+    """
+    
+    local, resolved, leftover = local_extract(raw_text)
+    if "CALL" not in resolved or not leftover:
+        return local, resolved, leftover, None
+    
+    place, source = profile_place(local["CALL"], leftover), "profile"
+    if place is None:
+        place, source = gazetteer_place(leftover), "gazetteer"
+    if place is None:
+        return local, resolved, leftover, None
+    local["QTH"] = place
+    resolved.append("QTH")
+    return local, resolved, [], source
+
+
+def claim_inflight(key: str):
+    """
+    Returns (future, owner). The first caller for a key becomes its owner and
+    must send the request and resolve the future with resolve_inflight();
+    later callers only wait for the same future. An entry whose future is
+    already done (e.g. a cancelled speculative request) is replaced.
+    """
+    
+    with _CACHE_LOCK:
+        future = _INFLIGHT.get(key)
+        if future is not None and not future.done():
+            CACHE_STATS["coalesced"] += 1
+            return future, False
+        future = Future()
+        _INFLIGHT[key] = future
+        return future, True
+
+
+def resolve_inflight(key: str, future: Future, result: str = None, error: BaseException = None) -> None:
+    """
+    Completes an owned in-flight future and forgets the key (unless it
+    already belongs to a newer request, after a cancellation).
+    """
+    
+    with _CACHE_LOCK:
+        if _INFLIGHT.get(key) is future:
+            del _INFLIGHT[key]
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def get_remote_respond(raw_text: str) -> str:
+    """
+    Returns the AI extraction of `raw_text` as a JSON string.
+    
+    Results are looked up in the extraction cache first; if the same text
+    is already being sent by another worker, its answer is waited for instead.
+    """
+    
+    key = cache_key(raw_text)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+    
+    future, owner = claim_inflight(key)
+    if not owner:
+        return future.result()
+    
+    try:
+        result = request_extraction(raw_text, key)
+    except BaseException as e:
+        resolve_inflight(key, future, error = e)
+        raise
+    resolve_inflight(key, future, result)
+    return result
+
+
+def extract_async(raw_text: str) -> Future:
+    """
+    Parameters
+    ----------
+    raw_text : str
+        Raw QSO text typed by the operator.
+
+    Returns
+    -------
+    future : Future
+        Resolves to the same JSON string get_respond() would return.
+    
+    Without BATCH_MODE this simply runs get_respond() in the worker pool.
+    With it, lines the fast path or the cache cannot answer are queued for
+    the batch dispatcher, which sends several of them in one request.
+
+    """
+    
+    if not BATCH_MODE:
+        return get_executor().submit(get_respond, raw_text)
+    
+    local, resolved, result = fast_path(raw_text)
+    if result is not None:
+        done = Future()
+        done.set_result(result)
+        return done
+    
+    key = cache_key(raw_text)
+    cached = cache_get(key)
+    if cached is not None:
+        remote = Future()
+        remote.set_result(cached)
+    else:
+        remote, owner = claim_inflight(key)
+        if owner:
+            start_batch_dispatcher()
+            _BATCH_QUEUE.put((key, raw_text, remote))
+    
+    return chain_future(remote, lambda result_json: merge_local(local, resolved, result_json))
+
+
+def chain_future(source: Future, fn) -> Future:
+    """
+    Returns a future resolving to fn(result of `source`); exceptions propagate.
+    """
+    
+    target = Future()
+    
+    def done(f):
+        try:
+            target.set_result(fn(f.result()))
+        except BaseException as e:
+            target.set_exception(e)
+    
+    source.add_done_callback(done)
+    return target
+
+
+def start_batch_dispatcher() -> None:
+    """
+    
+    The function starts the batch dispatcher thread on first use.
+    
+    """
+    
+    global _BATCH_THREAD
+    with _BATCH_LOCK:
+        if _BATCH_THREAD is None:
+            _BATCH_THREAD = threading.Thread(target = batch_dispatcher, name = "batch", daemon = True)
+            _BATCH_THREAD.start()
+
+
+def batch_dispatcher() -> None:
+    """
+    Collects queued lines into batches and hands them to the worker pool.
+    
+    A batch is started only when a request slot is free, so lines pile up
+    while all slots are busy and the next batch is larger. Once the first
+    line is taken, more are collected for at most BATCH_FLUSH_SEC.
+    """
+    
+    while True:
+        _BATCH_SLOTS.acquire()
+        batch = [_BATCH_QUEUE.get()]
+        deadline = time.time() + BATCH_FLUSH_SEC
+        while len(batch) < _BATCH_STATE["size"]:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_BATCH_QUEUE.get(timeout = remaining))
+            except queue.Empty:
+                break
+        get_executor().submit(run_batch, batch)
+
+
+def run_batch(batch: list) -> None:
+    """
+    Parameters
+    ----------
+    batch : list
+        (cache key, raw text, in-flight future) of each queued line.
+
+    Returns
+    -------
+    None.
+    
+    The function sends one batch, resolves the future of every valid answer
+    and retries only the broken items, one request each. The batch size is
+    adapted: +1 after a fully valid batch, halved after a partial failure.
+
+    """
+    
+    try:
+        if len(batch) == 1:
+            answers = [None]    # 只有一条时直接走单条请求
+        else:
+            try:
+                answers = request_batch([raw_text for _, raw_text, _ in batch],
+                                        [key for key, _, _ in batch])
+            except Exception as e:
+                # 整批请求失败（网络等问题），与单条请求失败时的处理一致
+                if not isinstance(e, CircuitOpenError):
+                    cprint(f"{API_ERROR}: {e}", "RED")
+                for key, _, future in batch:
+                    resolve_inflight(key, future, null_result(f"{API_ERROR}: {str(e)}"))
+                return
+        
+        broken = []
+        for (key, raw_text, future), answer in zip(batch, answers):
+            if answer is None:
+                broken.append((key, raw_text, future))
+                continue
+            result = json.dumps(answer, ensure_ascii = False)
+            cache_put(key, result)
+            resolve_inflight(key, future, result)
+        
+        with _BATCH_LOCK:
+            if len(batch) > 1 and not broken:
+                _BATCH_STATE["size"] = min(BATCH_MAX_SIZE, _BATCH_STATE["size"] + 1)
+            elif len(batch) > 1:
+                _BATCH_STATE["size"] = max(1, _BATCH_STATE["size"] // 2)
+                _BATCH_STATE["retried"] += len(broken)
+            _BATCH_STATE["batches"] += 1
+            _BATCH_STATE["lines"] += len(batch)
+        
+        for key, raw_text, future in broken:
+            try:
+                resolve_inflight(key, future, request_extraction(raw_text, key))
+            except BaseException as e:
+                resolve_inflight(key, future, error = e)
+    finally:
+        _BATCH_SLOTS.release()
+
+
+def request_batch(raw_texts: List[str], keys: List[str] = None) -> list:
+    """
+    Parameters
+    ----------
+    raw_texts : list
+        Several raw QSO texts.
+    keys : list, optional
+        Their cache keys, used to show early (streamed) fields.
+
+    Returns
+    -------
+    answers : list
+        One validated record dict per input line, in the same order,
+        or None where the answer was missing or incomplete.
+    
+    The function extracts several QSOs with a single chat completion, so the
+    system prompt is sent (and billed) once for the whole batch.
+
+    """
+    
+    begin = time.perf_counter()
+    sys_prompt = get_sys_prompt()
+    
+    usr_prompt = prompt_templates.batch_prompt(raw_texts, CITY)
+    record_stage("prompt", time.perf_counter() - begin)
+    
+    def on_field(obj, field, value):
+        try:
+            index = int(obj.get("ID")) - 1
+        except (TypeError, ValueError):
+            return
+        if keys and 0 <= index < len(keys):
+            notify_early(keys[index], field, value)
+    
+    content = call_model(sys_prompt, usr_prompt, on_field)
+    begin = time.perf_counter()
+    try:
+        return batch_answers(content, len(raw_texts))
+    finally:
+        record_stage("parse", time.perf_counter() - begin)
+
+
+def batch_answers(content: str, count: int) -> list:
+    """
+    Returns the validated record dicts of a batch answer, one per input line
+    (None where missing or incomplete); see request_batch().
+    """
+    
+    answers = [None] * count
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        cprint(f"Warning: Could not parse JSON response: {content}", "YELLOW")
+        return answers
+    
+    items = data.get("records", []) if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return answers
+    
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("ID")) - 1
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= index < len(answers) or answers[index] is not None:
+            continue
+        if not all(isinstance(item.get(field), (str, int, float)) for field in REQUIRED_FIELDS):
+            continue
+        answers[index] = {field: str(item[field]) for field in REQUIRED_FIELDS}
+    return answers
+
+
+def request_extraction(raw_text: str, key: str = "", cancel: threading.Event = None) -> str:
+    """
+    Sends one QSO to the API and returns the formatted JSON string.
+    Successful results are stored in the extraction cache under `key`.
+    RequestCancelled is passed on when `cancel` is set.
+    """
+    
+    begin = time.perf_counter()
+    sys_prompt = get_sys_prompt()
+    
+    usr_prompt = prompt_templates.extraction_prompt(raw_text, CITY)
+    record_stage("prompt", time.perf_counter() - begin)
+    
+    try:
+        content = call_model(sys_prompt, usr_prompt,
+                             lambda obj, field, value: notify_early(key, field, value), cancel = cancel)
+        
+        # 尝试解析JSON
+        begin = time.perf_counter()
+        try:
+            result = json.dumps(parse_record(content), ensure_ascii = False)
+        except json.JSONDecodeError:
+            # 如果解析失败，返回一个默认的JSON结构，将原始响应作为备注
+            cprint(f"Warning: Could not parse JSON response: {content}", "YELLOW")
+            return null_result(content)
+        finally:
+            record_stage("parse", time.perf_counter() - begin)
+        
+        if key:
+            cache_put(key, result)
+        return result
+    
+    except RequestCancelled:
+        raise
+    except Exception as e:
+        if not isinstance(e, CircuitOpenError):
+            cprint(f"{API_ERROR}: {e}", "RED")
+        # 返回一个默认的JSON结构作为错误处理，complete_qso()据此稍后重试
+        return null_result(f"{API_ERROR}: {str(e)}")
+
+
+def get_respond_for_edit(original_record: str, correction: str):
+    """
+    专门用于编辑记录的API调用函数，基于原始记录和更正内容生成新的记录
+    """
+    
+    begin = time.perf_counter()
+    sys_prompt = get_sys_prompt()
+    
+    usr_prompt = prompt_templates.edit_prompt(original_record, correction, CITY)
+    record_stage("prompt", time.perf_counter() - begin)
+    
+    try:
+        content = call_model(sys_prompt, usr_prompt, kind = "edit")
+        
+        # 尝试解析JSON
+        begin = time.perf_counter()
+        try:
+            return json.dumps(parse_record(content), ensure_ascii = False)
+        except json.JSONDecodeError:
+            # 如果解析失败，返回一个默认的JSON结构，将原始响应作为备注
+            cprint(f"Warning: Could not parse JSON response: {content}", "YELLOW")
+            return null_result(content)
+        finally:
+            record_stage("parse", time.perf_counter() - begin)
+            
+    except Exception as e:
+        cprint(f"{API_ERROR}: {e}", "RED")
+        # 返回一个默认的JSON结构作为错误处理
+        return null_result(f"{API_ERROR}: {str(e)}")
+
+
+def parse_edit(correction: str):
+    """
+    Parameters
+    ----------
+    correction : str
+        The correction typed after EDIT, e.g. "QTH 改为 滨江" or "PWR 10w, ANT gp".
+
+    Returns
+    -------
+    patch : dict or None
+        Field -> new value, or None when the correction is not a plain list of
+        "field value" clauses and has to be understood by the AI.
+    
+    Field names may be written in English or Chinese (EDIT_FIELD_ALIASES),
+    optionally followed by 改为, 是, =, to... Values are normalized the same way
+    as a QSO line; a clear word (无, 删除, NULL...) empties the field. A value
+    that names another field ("PWR 10W ANT GP" without a comma) or holds more
+    than the field's own value also goes to the AI, and so does a QTH, RIG or
+    ANT of several words that is not a known place, rig or antenna.
+
+    """
+    
+    text = unicodedata.normalize("NFKC", correction).strip()
+    
+    # 以逗号等分隔子句，不以字段名开头的片段并入前一个子句（备注中可以有逗号）
+    clauses = []
+    for part in EDIT_SEPARATORS.split(text):
+        if not part:
+            continue
+        if clauses and not EDIT_CLAUSE.fullmatch(part):
+            clauses[-1] = (clauses[-1][0], clauses[-1][1] + "，" + part)
+            continue
+        match = EDIT_CLAUSE.fullmatch(part)
+        if match is None:
+            return None
+        clauses.append((EDIT_FIELD_ALIASES[match.group(1).upper()], match.group(2).strip()))
+    
+    patch = {}
+    for field, value in clauses:
+        if field in patch or not value:
+            return None
+        if value.upper() in EDIT_CLEAR_WORDS:
+            patch[field] = "NULL"
+            continue
+        if field == "RMKS":
+            # 备注是自由文本，只拦截英文字段名（中文字段名常出现在正常备注中，如“信号”）
+            if any(m.group(0).isascii() for m in EDIT_FIELD_WORD.finditer(value)):
+                return None
+            patch[field] = value
+            continue
+        if "，" in value or EDIT_VAGUE.search(value) or EDIT_FIELD_WORD.search(value):
+            return None
+        
+        if field == "CALL":
+            value = value.upper().replace(" ", "")
+            if not CALL_PATTERN.fullmatch(value):
+                return None
+        elif field == "RST":
+            if not RST_PATTERN.fullmatch(value):
+                return None
+        elif field == "QTH":
+            # 地点中认出了设备、功率等其他字段，说明不止一个子句
+            if local_extract(value)[1]:
+                return None
+            value = normalize_qth(value)
+            gazetteer = load_gazetteer()
+            if len(value.split()) > 1 and not (gazetteer and value in gazetteer.names):
+                return None
+        else:
+            # 设备、天线、功率、高度按点名记录的规则规范写法，识别不了的原样保留；
+            # 认出了其他字段或者还剩下别的内容时交给AI
+            fields, resolved, leftover = local_extract(value)
+            compact = re.sub(r"[\s\-_/.]", "", value.upper())
+            if any(f != field for f in resolved) or (field in resolved and leftover):
+                return None
+            if field in resolved:
+                value = fields[field]
+            elif field == "RIG" and compact in RIG_MODELS:
+                value = RIG_MODELS[compact]
+            elif field == "PWR" and re.fullmatch(r"\d+(?:\.\d+)?", value):
+                value = f"{value}W"
+            elif field in ("RIG", "ANT") and len(value.split()) > 1:
+                # 认不出的多个词（如“is broken”）多半是一句话，不是型号
+                return None
+        patch[field] = value
+    
+    return patch or None
+
+
+def local_extract(raw_text: str):
+    """
+    Parameters
+    ----------
+    raw_text : str
+        Raw QSO text typed by the operator.
+
+    Returns
+    -------
+    fields : dict
+        CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS; NULL where nothing was found
+        (RST defaults to 59, as in the AI prompt).
+    resolved : list
+        Names of the fields recognised in the text.
+    leftover : list
+        Tokens the parser could not place (usually a place name).
+    
+    The function is a deterministic extractor for the quasi-structured part of
+    the input: callsign, RST, known rigs, antenna abbreviations, power and height.
+
+    """
+    
+    text = unicodedata.normalize("NFKC", raw_text).upper()
+    fields = {field: "NULL" for field in REQUIRED_FIELDS}
+    fields["RST"] = "59"
+    resolved = []
+    
+    def take(field, value):
+        if field in resolved:
+            return False
+        fields[field] = value
+        resolved.append(field)
+        return True
+    
+    # 先处理可能跨越空格或与中文相连的片段，匹配到的部分替换为空格
+    for field, pattern, fmt in LOCAL_PATTERNS:
+        match = pattern.search(text)
+        if match and take(field, fmt(match)):
+            text = text[:match.start()] + " " + text[match.end():]
+    
+    # 信号报告只认呼号之后或紧跟在RST之后的独立数字
+    leftover = []
+    after_rst = False
+    for token in text.split():
+        compact = re.sub(r"[-_/.]", "", token)
+        report_position = after_rst or "CALL" in resolved
+        after_rst = token == "RST"
+        if compact in RIG_MODELS and take("RIG", RIG_MODELS[compact]):
+            continue
+        if compact in ANT_ALIASES and take("ANT", ANT_ALIASES[compact]):
+            continue
+        if report_position and RST_PLAUSIBLE.fullmatch(token) and take("RST", token):
+            continue
+        if CALL_PATTERN.fullmatch(token) and take("CALL", token):
+            continue
+        if token in FILLER_WORDS:
+            continue
+        leftover.append(token)
+    
+    return fields, resolved, leftover
+
+
+def merge_local(local: dict, resolved: list, result_json: str) -> str:
+    """
+    Overrides the AI answer with the fields the local parser resolved, and
+    records whether the two agree (side-by-side accuracy check). The AI's QTH
+    is normalized against the gazetteer; fields neither of them found (except
+    QTH) are pre-filled from the station's profile.
+    """
+    
+    result = json.loads(result_json)
+    if api_failed(result):
+        return result_json
+    compare_fast_path(local, resolved, result)
+    for field in resolved:
+        result[field] = local[field]
+    if "QTH" not in resolved:
+        result["QTH"] = normalize_qth(str(result.get("QTH", "NULL")))
+    # 有本地未识别的词时，QTH以AI的理解为准，不用档案中的旧地名
+    prefill_from_profile(result, skip = ["QTH"])
+    return json.dumps(result, ensure_ascii = False)
+
+
+def compare_fast_path(local: dict, resolved: list, result: dict) -> None:
+    """
+    Counts, for every locally resolved field, whether the AI gave the same value.
+    Error answers (all NULL) are skipped.
+    """
+    
+    if all(result.get(field, "NULL") == "NULL" for field in REQUIRED_FIELDS[:7]):
+        return
+    
+    def canon(value):
+        return re.sub(r"[\s\-_]", "", unicodedata.normalize("NFKC", str(value)).upper())
+    
+    with _STATS_LOCK:
+        for field in resolved:
+            FASTPATH_STATS["compared"] += 1
+            if canon(local[field]) == canon(result.get(field, "NULL")):
+                FASTPATH_STATS["agreed"] += 1
+            else:
+                FASTPATH_MISMATCHES.append((field, local[field], result.get(field, "NULL")))
+                del FASTPATH_MISMATCHES[:-20]
+
+
+def audit_fast_path(raw_text: str, local: dict, resolved: list) -> None:
+    """
+    Sends a locally parsed line to the AI as well, only to compare the answers.
+    """
+    
+    compare_fast_path(local, resolved, json.loads(get_remote_respond(raw_text)))
+
+
+def normalize_raw_text(raw_text: str) -> str:
+    """
+    Normalizes raw QSO text for cache lookup: full-width characters folded
+    (NFKC), case and runs of whitespace ignored.
+    """
+    
+    return " ".join(unicodedata.normalize("NFKC", raw_text).upper().split())
+
+
+def cache_key(raw_text: str) -> str:
+    """
+    Returns the cache key of a raw QSO text. The city, the models of the QSO
+    route and the prompt template ID are part of the key, so changing any
+    of them starts afresh.
+    """
+    
+    models = sorted({backend.model for backend in route("qso")})
+    material = json.dumps([normalize_raw_text(raw_text), CITY, "+".join(models), prompt_templates.TEMPLATE_ID],
+                          ensure_ascii = False)
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+
+def load_cache() -> "OrderedDict[str, list]":
+    """
+    Returns the extraction cache, reading CACHE_FILE on first use.
+    Entries are [timestamp, result json], least recently used first.
+    """
+    
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = OrderedDict()
+            if os.path.exists(CACHE_FILE):
+                try:
+                    with open(CACHE_FILE, 'r', encoding = 'utf-8') as f:
+                        _CACHE.update(json.load(f))
+                except Exception as e:
+                    cprint(f"Error loading cache, starting empty: {e}", "YELLOW")
+            evict_cache()
+        return _CACHE
+
+
+def evict_cache() -> None:
+    """
+    Drops entries older than CACHE_MAX_AGE_DAYS, then the least recently used
+    ones beyond CACHE_MAX_ENTRIES. The caller holds _CACHE_LOCK.
+    """
+    
+    expire_before = time.time() - CACHE_MAX_AGE_DAYS * 86400
+    for key in [k for k, (stamp, _) in _CACHE.items() if stamp < expire_before]:
+        del _CACHE[key]
+    while len(_CACHE) > CACHE_MAX_ENTRIES:
+        _CACHE.popitem(last = False)
+
+
+def save_cache() -> None:
+    """
+    Writes the extraction cache to CACHE_FILE (via a temporary file, so an
+    interrupted write never leaves a truncated cache behind).
+    """
+    
+    tmp_name = CACHE_FILE + ".tmp"
+    with _CACHE_LOCK:
+        with open(tmp_name, 'w', encoding = 'utf-8') as f:
+            json.dump(_CACHE, f, ensure_ascii = False)
+        os.replace(tmp_name, CACHE_FILE)
+
+
+def cache_get(key: str):
+    """
+    Returns the cached result json for `key`, or None (counted as a miss).
+    """
+    
+    cache = load_cache()
+    with _CACHE_LOCK:
+        entry = cache.get(key)
+        if entry is not None and entry[0] < time.time() - CACHE_MAX_AGE_DAYS * 86400:
+            del cache[key]
+            entry = None
+        if entry is None:
+            CACHE_STATS["misses"] += 1
+            return None
+        cache.move_to_end(key)
+        CACHE_STATS["hits"] += 1
+        return entry[1]
+
+
+def cache_put(key: str, result: str) -> None:
+    """
+    Stores a successful extraction result and persists the cache.
+    """
+    
+    cache = load_cache()
+    with _CACHE_LOCK:
+        cache[key] = [time.time(), result]
+        cache.move_to_end(key)
+        evict_cache()
+    try:
+        save_cache()
+    except OSError as e:
+        cprint(f"Error saving cache: {e}", "YELLOW")
+
+    
+def load_profiles() -> dict:
+    """
+    Returns the station profiles, keyed by callsign, reading PROFILE_FILE on
+    first use. The first time (no file yet) they are seeded from the logbook;
+    final CSV files in the working directory are imported once per version.
+    
+    A profile holds the latest reported QTH, RIG, ANT, PWR and ALT, the time
+    of that report (LAST), and PLACES: the raw place words the operator typed
+    for this station -> the QTH they meant.
+    """
+    
+    global _PROFILES
+    with _PROFILE_LOCK:
+        if _PROFILES is not None:
+            return _PROFILES["stations"]
+        
+        _PROFILES = {"stations": {}, "sources": {}}
+        changed = False
+        if os.path.exists(PROFILE_FILE):
+            try:
+                with open(PROFILE_FILE, 'r', encoding = 'utf-8') as f:
+                    _PROFILES.update(json.load(f))
+            except Exception as e:
+                cprint(f"Error loading station profiles, rebuilding: {e}", "YELLOW")
+        elif get_logbook() is not None:
+            for row in logbook_query("SELECT call, date, utc, qth, rig, ant, pwr, alt FROM qso ORDER BY date, utc"):
+                learn_profile(dict(zip(["CALL", "DATE", "UTC"] + PROFILE_FIELDS, row)), save = False)
+            changed = True
+        
+        for name in sorted(f for f in os.listdir('.') if f.lower().endswith('.csv')):
+            mtime = os.path.getmtime(name)
+            if _PROFILES["sources"].get(name) == mtime:
+                continue
+            try:
+                with open(name, 'r', newline = '', encoding = 'utf-8-sig') as f:
+                    reader = csv.DictReader(f)
+                    if tuple(reader.fieldnames or ()) == RECORD_FIELDS:
+                        for row in reader:
+                            learn_profile(row, save = False)
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                cprint(f"Skipped {name} for station profiles: {e}", "YELLOW")
+            _PROFILES["sources"][name] = mtime
+            changed = True
+        
+        if changed:
+            save_profiles()
+        return _PROFILES["stations"]
+
+
+def save_profiles() -> None:
+    """
+    Writes the station profiles to PROFILE_FILE (via a temporary file).
+    """
+    
+    tmp_name = PROFILE_FILE + ".tmp"
+    with _PROFILE_LOCK:
+        try:
+            with open(tmp_name, 'w', encoding = 'utf-8') as f:
+                json.dump(_PROFILES, f, ensure_ascii = False)
+            os.replace(tmp_name, PROFILE_FILE)
+        except OSError as e:
+            cprint(f"Error saving station profiles: {e}", "RED")
+
+
+def learn_profile(fields: dict, raw_text: str = None, old_qth: str = None, save: bool = True) -> None:
+    """
+    Parameters
+    ----------
+    fields : dict
+        A finished record (CALL, DATE, UTC and the PROFILE_FIELDS).
+    raw_text : str
+        The text the record was extracted from, if known; its unplaced words
+        are remembered as this station's spelling of the QTH.
+    old_qth : str
+        The QTH before an EDIT; remembered spellings of it are corrected.
+    save : bool
+        Write PROFILE_FILE afterwards.
+    
+    Returns
+    -------
+    None.
+    
+    The function updates the profile of the record's callsign. Newer reports
+    win; NULL and empty fields never overwrite what is known.
+    
+    """
+    
+    if not PROFILE_FILE:
+        return
+    call = call_key(fields.get("CALL", ""))
+    if not call or PENDING_MARK in fields.values():
+        return
+    
+    stations = load_profiles()
+    with _PROFILE_LOCK:
+        profile = stations.setdefault(call, {"LAST": "", "PLACES": {}})
+        stamp = f"{fields.get('DATE', '')} {fields.get('UTC', '')}"
+        if stamp >= profile["LAST"]:
+            for field in PROFILE_FIELDS:
+                value = str(fields.get(field) or "").strip()
+                if value and value.upper() != "NULL":
+                    profile[field] = value
+            profile["LAST"] = stamp
+        
+        qth = str(fields.get("QTH") or "NULL")
+        places = profile["PLACES"]
+        if old_qth and old_qth != qth:
+            for place, meant in places.items():
+                if meant == old_qth:
+                    places[place] = qth
+        if raw_text and qth != "NULL":
+            _, _, leftover = local_extract(raw_text)
+            if leftover:
+                place = " ".join(leftover)
+                places.pop(place, None)
+                places[place] = qth
+                for stale in list(places)[:-PROFILE_MAX_PLACES]:
+                    del places[stale]
+        
+        if save:
+            save_profiles()
+
+
+def profile_place(call: str, leftover: list):
+    """
+    Returns the QTH this station meant the last time the operator typed
+    exactly these leftover words, or None.
+    """
+    
+    if not PROFILE_FILE or not leftover:
+        return None
+    profile = load_profiles().get(call_key(call))
+    if profile is None:
+        return None
+    return profile["PLACES"].get(" ".join(leftover))
+
+
+def prefill_from_profile(fields: dict, skip = ()) -> list:
+    """
+    Fills the PROFILE_FIELDS that are NULL in `fields` (not stated in this
+    report) from the station's profile, except those in `skip`. Returns the
+    names of the filled fields.
+    """
+    
+    if not PROFILE_FILE:
+        return []
+    profile = load_profiles().get(call_key(fields.get("CALL", "")))
+    if profile is None:
+        return []
+    
+    filled = []
+    with _PROFILE_LOCK:
+        for field in PROFILE_FIELDS:
+            if field not in skip and fields.get(field, "NULL") == "NULL" and profile.get(field):
+                fields[field] = profile[field]
+                filled.append(field)
+        PROFILE_STATS["known"] += 1
+        PROFILE_STATS["prefilled"] += len(filled)
+    return filled
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    Levenshtein distance between two strings.
+    """
+    
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree: finds every word within an edit distance of a
+    query without comparing it against the whole vocabulary.
+    """
+    
+    def __init__(self):
+        self.root = None    # [词, {距离: 子节点}]
+    
+    def add(self, word: str) -> None:
+        if self.root is None:
+            self.root = [word, {}]
+            return
+        node = self.root
+        while True:
+            d = edit_distance(word, node[0])
+            if d == 0:
+                return
+            if d not in node[1]:
+                node[1][d] = [word, {}]
+                return
+            node = node[1][d]
+    
+    def search(self, word: str, max_dist: int) -> list:
+        """
+        Returns [(distance, word)] for the words within max_dist of `word`.
+        """
+        
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            d = edit_distance(word, node[0])
+            if d <= max_dist:
+                found.append((d, node[0]))
+            for child_dist, child in node[1].items():
+                if d - max_dist <= child_dist <= d + max_dist:
+                    stack.append(child)
+        return found
+
+
+class Gazetteer:
+    """
+    Place names around CITY, read from a TSV file (name, pinyin syllables,
+    kind, and for aliases the standard name). Every place is indexed under
+    its Chinese name and its pinyin; names of three or more syllables also
+    under their initials. Names ending in 区/县/市/镇 get their short form too.
+    
+    lookup() resolves what the operator typed (Chinese, pinyin, a prefix of
+    either, or a pinyin typo); correct() fixes a near-miss QTH in an answer.
+    Both return a name only when the match is unambiguous.
+    """
+    
+    def __init__(self, path: str):
+        self.exact = {}     # 键 -> {标准名称}
+        self.trie = {}      # 逐字符嵌套的字典，"" 键下为以此为前缀的标准名称
+        self.fuzzy = BKTree()
+        self.names = set()
+        with open(path, 'r', encoding = 'utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                columns = line.rstrip('\n').split('\t')
+                name, syllables = columns[0].strip(), columns[1].split()
+                standard = columns[3].strip() if len(columns) > 3 and columns[3].strip() else name
+                self.add(name, syllables, standard)
+                if len(name) >= 3 and name[-1] in "区县市镇":
+                    self.add(name[:-1], syllables[:-1], standard)
+    
+    @staticmethod
+    def key(text: str) -> str:
+        return re.sub(r"[\s\-_'·.,，。]", "", unicodedata.normalize("NFKC", text).upper())
+    
+    def add(self, name: str, syllables: list, standard: str) -> None:
+        self.names.add(standard)
+        keys = [self.key(name), "".join(syllables).upper()]
+        for key in keys:
+            self.exact.setdefault(key, set()).add(standard)
+            self.fuzzy.add(key)
+            node = self.trie
+            for char in key:
+                node = node.setdefault(char, {})
+                node.setdefault("", set()).add(standard)
+        if len(syllables) >= 3:
+            self.exact.setdefault("".join(s[0] for s in syllables).upper(), set()).add(standard)
+    
+    def lookup(self, text: str):
+        key = self.key(text)
+        if len(key) < 2:
+            return None
+        chinese = not key.isascii()
+        
+        names = self.exact.get(key, set())
+        if len(names) == 1:
+            return next(iter(names))
+        if names:
+            return None
+        
+        # 前缀：拼音至少4个字母，中文至少2个字
+        if chinese or len(key) >= 4:
+            node = self.trie
+            for char in key:
+                node = node.get(char)
+                if node is None:
+                    break
+            else:
+                if len(node[""]) == 1:
+                    return next(iter(node[""]))
+                return None
+        
+        # 拼写错误：中文至少3个字、拼音至少5个字母，才允许1处差错（较长的拼音允许2处）
+        if (chinese and len(key) < 3) or (not chinese and len(key) < 5):
+            return None
+        hits = self.fuzzy.search(key, 1 if chinese or len(key) <= 7 else 2)
+        if not hits:
+            return None
+        best = min(d for d, _ in hits)
+        names = set().union(*(self.exact[word] for d, word in hits if d == best))
+        return next(iter(names)) if len(names) == 1 else None
+    
+    def correct(self, qth: str):
+        key = self.key(qth)
+        names = self.exact.get(key, set())
+        if names:
+            return next(iter(names)) if len(names) == 1 else None
+        if key.isascii() or len(key) < 3:
+            return None
+        hits = [word for d, word in self.fuzzy.search(key, 1) if not word.isascii() and len(word) == len(key)]
+        names = set().union(*(self.exact[word] for word in hits)) if hits else set()
+        return next(iter(names)) if len(names) == 1 else None
+
+
+def load_gazetteer():
+    """
+    Returns the Gazetteer of CITY, reading GAZETTEER_DIR/{CITY}.tsv on first
+    use, or None when there is no such file.
+    """
+    
+    global _GAZETTEER
+    with _GAZETTEER_LOCK:
+        if _GAZETTEER is None:
+            path = os.path.join(GAZETTEER_DIR, f"{CITY}.tsv")
+            _GAZETTEER = False
+            if os.path.exists(path):
+                try:
+                    _GAZETTEER = Gazetteer(path)
+                except (OSError, IndexError) as e:
+                    cprint(f"Error loading gazetteer {path}: {e}", "YELLOW")
+        return _GAZETTEER or None
+
+
+def gazetteer_place(leftover: list):
+    """
+    Returns the place name the leftover words of a line clearly refer to,
+    or None.
+    """
+    
+    gazetteer = load_gazetteer()
+    if gazetteer is None or not leftover:
+        return None
+    return gazetteer.lookup("".join(leftover))
+
+
+def normalize_qth(qth: str) -> str:
+    """
+    Returns the gazetteer spelling of a QTH given by the AI if it is a known
+    place or one character away from exactly one; otherwise `qth` unchanged.
+    """
+    
+    gazetteer = load_gazetteer()
+    if gazetteer is None or qth in ("", "NULL") or qth in gazetteer.names:
+        return qth
+    corrected = gazetteer.correct(qth)
+    if corrected is None:
+        return qth
+    with _STATS_LOCK:
+        GAZETTEER_STATS["corrected"] += 1
+    return corrected
+
+
+def call_entity(call: str):
+    """
+    Returns the country or region of a callsign from the longest matching
+    ITU prefix in CALL_BLOCKS (a trie built on first use), or None.
+    """
+    
+    global _CALL_TRIE
+    if _CALL_TRIE is None:
+        trie = {}
+        for block, entity in CALL_BLOCKS:
+            first, _, last = block.partition("-")
+            if last:
+                chars = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                seconds = chars[chars.index(first[1]):chars.index(last[1]) + 1]
+                prefixes = [first[0] + c for c in seconds]
+            else:
+                prefixes = [first]
+            for prefix in prefixes:
+                node = trie
+                for char in prefix:
+                    node = node.setdefault(char, {})
+                node[""] = entity
+        _CALL_TRIE = trie
+    
+    node, entity = _CALL_TRIE, None
+    for char in call[:2]:
+        node = node.get(char)
+        if node is None:
+            break
+        entity = node.get("", entity)
+    return entity
+
+
+def validate_call(call: str):
+    """
+    Parameters
+    ----------
+    call : str
+        A callsign, possibly with a /portable part.
+    
+    Returns
+    -------
+    entity : str or None
+        Country or region of the prefix.
+    problem : str or None
+        Why the callsign is not well formed; None when it is.
+    
+    """
+    
+    parts = [p for p in call.upper().split("/") if p]
+    base = max(parts, key = len) if parts else ""
+    match = CALL_STRUCTURE.fullmatch(base)
+    entity = call_entity(base)
+    if match is None:
+        if re.fullmatch(r"[A-Z0-9]{1,2}\d[A-Z0-9]{1,4}", base) and re.match(r"[A-Z]|\d[A-Z]", base) \
+                and any(c.isdigit() for c in base[3:]):
+            return entity, "digit in suffix"
+        return entity, "not a callsign"
+    if entity is None:
+        return None, f"unknown prefix {match.group(1)}"
+    if entity == "China":
+        if base[1] not in CN_AMATEUR_SERIES:
+            return entity, f"B{base[1]} is not an amateur series"
+        if len(match.group(3)) > 3:
+            return entity, "suffix longer than 3 letters"
+    return entity, None
+
+
+def index_call(call: str) -> None:
+    """
+    Adds a callsign, and each spelling of it with one character deleted,
+    to the index of known callsigns. The caller holds _CALL_LOCK.
+    """
+    
+    _CALL_INDEX.setdefault(call, set()).add(call)
+    for i in range(len(call)):
+        _CALL_INDEX.setdefault(call[:i] + call[i + 1:], set()).add(call)
+
+
+def known_calls() -> dict:
+    """
+    Returns the index of known callsigns, built on first use from the
+    station profiles and the current log.
+    """
+    
+    global _CALL_INDEX
+    if _CALL_INDEX is None:
+        stations = list(load_profiles()) if PROFILE_FILE else []
+        with RECORD_LOCK:
+            stations += list(RECORD.by_call)
+        with _CALL_LOCK:
+            if _CALL_INDEX is None:
+                _CALL_INDEX = {}
+                for call in stations:
+                    index_call(call)
+    return _CALL_INDEX
+
+
+def suggest_calls(call: str, in_log = (), limit: int = 3, swaps: bool = True) -> list:
+    """
+    Parameters
+    ----------
+    call : str
+        The callsign to correct.
+    in_log : collection
+        Callsigns of the current session, ranked first.
+    limit : int
+        Number of suggestions.
+    swaps : bool
+        Also propose never-heard spellings reached by confusable swaps.
+    
+    Returns
+    -------
+    suggestions : list
+        (callsign, where) pairs, best first. `where` is "log", "history" or
+        "" (well formed, but never heard).
+    
+    Candidates are the known callsigns one edit away and the well-formed
+    spellings reached by swapping confusable characters (O/0, I/1, S/5...).
+    Swaps between confusable or sound-alike characters rank above other edits.
+    
+    """
+    
+    call = call.upper()
+    index = known_calls()
+    
+    def likely(a, b):
+        return b in CALL_CONFUSABLE.get(a, "") or any(a in g and b in g for g in CALL_SOUNDALIKE)
+    
+    scores = {}
+    with _CALL_LOCK:
+        near = set(index.get(call, ()))
+        for i in range(len(call)):
+            near |= index.get(call[:i] + call[i + 1:], set())
+    for known in near:
+        if known == call or edit_distance(known, call) > 1:
+            continue
+        swapped = len(known) == len(call) and all(a == b or likely(a, b) for a, b in zip(call, known))
+        scores[known] = (0 if known in in_log else 1, 0 if swapped else 1)
+    
+    # 易混淆字符替换，至多两处
+    variants = {call} if swaps else set()
+    for _ in range(2):
+        variants |= {v[:i] + c + v[i + 1:] for v in variants for i, ch in enumerate(v)
+                     for c in CALL_CONFUSABLE.get(ch, "")}
+    for variant in variants - {call} - set(scores):
+        if validate_call(variant)[1] is None:
+            scores[variant] = (2, 0)
+    
+    ranked = sorted(scores, key = lambda c: (scores[c], c))[:limit]
+    return [(c, ("log", "history", "")[scores[c][0]]) for c in ranked]
+
+
+def check_call(record: QSORecord, earlier: List[QSORecord]) -> List[str]:
+    """
+    Returns the warnings to print after a record was added: a malformed CALL
+    with suggestions, or a never-heard CALL one character away from a known
+    station. The CALL is then added to the known callsigns.
+    """
+    
+    call = call_key(record.CALL)
+    if not call:
+        return []
+    
+    index = known_calls()
+    with _CALL_LOCK:
+        heard = bool(earlier) or call in index.get(call, ())
+    with RECORD_LOCK:
+        in_log = {c for c in RECORD.by_call if c != call}
+    
+    _, problem = validate_call(call)
+    messages = []
+    if problem is not None or not heard:
+        suggestions = suggest_calls(call, in_log, swaps = problem is not None)
+        hint = ", ".join(f"{c} ({where})" if where else c for c, where in suggestions)
+        if problem is not None:
+            messages.append(f"Check CALL {call}: {problem}" + (f"; did you mean {hint}?" if hint else ""))
+        elif any(where for _, where in suggestions):
+            hint = ", ".join(f"{c} ({where})" for c, where in suggestions if where)
+            messages.append(f"Note: {call} is new; similar known stations: {hint}")
+    
+    with _CALL_LOCK:
+        index_call(call)
+    return messages
+
+
+def save_final(filename):
+    """
+    Parameters
+    ----------
+    filename : str
+        The name of the final record file, without filetype postfix.
+
+    Returns
+    -------
+    None.
+    
+    The function is called to save the record as a .csv file, or as ADIF
+    (.adi) or Cabrillo (.log) when the filename ends with that extension.
+    Saving the same file again after an EDIT only rewrites the changed rows.
+
+    """
+    
+    filename = export_path(filename)
+    exporter = _EXPORTS.setdefault(filename, ExportFile(filename))
+    records = finished_records()
+    try:
+        written = exporter.sync(records)
+    except OSError as e:
+        cprint(f"Error saving {filename}: {e}", "RED")
+        return
+    
+    if written <= len(records):
+        cprint(f"Final record saved as {filename} ({written} row(s) rewritten)", "GREEN")
+    else:
+        cprint(f"Final record saved as {filename}", "GREEN")
+    logbook_sync()
+
+
+def backup():
+    """
+    
+    The function is called halfway, to leave a latest backup file.
+    
+    """
+    
+    global RECORD
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"backup_{timestamp}.json"
+    
+    with RECORD_LOCK:
+        with open(filename, 'w', encoding = 'utf-8') as f:
+            json.dump({
+                "OPERATOR": OPERATOR,
+                "RECORD": RECORD.to_lists(),
+                "NR_COUNTER": NR_COUNTER,
+                "SESSION": SESSION_ID
+            }, f, ensure_ascii = False, indent = 2)
+        compact_journal()
+    
+    cprint(f"Backup saved as {filename}", "CYAN")
+    if STATS_DUMP:
+        dump_stats(f"stats_{timestamp}.json")
+    
+    # 清理旧备份文件（保留最近5个）
+    clean_old_backups()
+ 
+    
+def clean_old_backups() -> None:
+    """
+    
+    The function cleans all old backups (and stats dumps) but left 5 latest.
+    
+    """
+    
+    for prefix in ('backup_', 'stats_'):
+        backup_files = [f for f in os.listdir('.') if f.startswith(prefix) and f.endswith('.json')]
+        backup_files.sort(key = lambda x: os.path.getmtime(x), reverse = True)
+        
+        for old_backup in backup_files[5:]:
+            os.remove(old_backup)
+            cprint(f"Removed old backup: {old_backup}", "YELLOW")
+    
+    
+def clean_bkup():
+    """
+    
+    The function is called to clean all backup files.
+    
+    """
+    
+    backup_files = [f for f in os.listdir('.') if f.startswith('backup_') and f.endswith('.json')]
+    
+    for backup_file in backup_files:
+        os.remove(backup_file)
+        cprint(f"Removed backup: {backup_file}", "YELLOW")
+    
+    cprint("All backup files cleaned.", "RED")
+    
+    
+def journal_write(op: str, **fields) -> None:
+    """
+    Parameters
+    ----------
+    op : str
+        reserve / append / fill / defer / edit / clear / op / line / session
+    **fields
+        Payload of the entry, e.g. rec = record or call = operator.
+
+    Returns
+    -------
+    None.
+    
+    The function appends one line to the session journal and fsyncs it, so
+    every change survives a crash or power cut. The caller holds RECORD_LOCK,
+    which keeps the journal in the same order as the changes to RECORD.
+    Every JOURNAL_COMPACT_EVERY entries the journal is folded into a snapshot.
+    Each entry is also passed to the JOURNAL_LISTENERS, in the same order.
+
+    """
+    
+    global _JOURNAL, _JOURNAL_SEQ, _JOURNAL_SINCE_SNAPSHOT
+    _JOURNAL_SEQ += 1
+    entry = dict(seq = _JOURNAL_SEQ, op = op, **fields)
+    for listener in JOURNAL_LISTENERS:
+        listener(entry)
+    if not JOURNAL_FILE:
+        return
+    
+    try:
+        if _JOURNAL is None:
+            _JOURNAL = open(JOURNAL_FILE, 'a', encoding = 'utf-8')
+        _JOURNAL.write(json.dumps(entry, ensure_ascii = False) + "\n")
+        _JOURNAL.flush()
+        os.fsync(_JOURNAL.fileno())
+    except OSError as e:
+        cprint(f"Error writing journal: {e}", "RED")
+        return
+    
+    _JOURNAL_SINCE_SNAPSHOT += 1
+    if _JOURNAL_SINCE_SNAPSHOT >= JOURNAL_COMPACT_EVERY:
+        compact_journal()
+
+
+def compact_journal() -> None:
+    """
+    
+    The function writes the current state into JOURNAL_SNAPSHOT (atomically)
+    and empties the journal. The snapshot remembers the last sequence number
+    it covers, so a crash between the two steps cannot replay entries twice.
+    
+    """
+    
+    global _JOURNAL, _JOURNAL_SINCE_SNAPSHOT
+    if not JOURNAL_FILE:
+        return
+    
+    with RECORD_LOCK:
+        try:
+            tmp_name = JOURNAL_SNAPSHOT + ".tmp"
+            with open(tmp_name, 'w', encoding = 'utf-8') as f:
+                json.dump({
+                    "SEQ": _JOURNAL_SEQ,
+                    "OPERATOR": OPERATOR,
+                    "RECORD": RECORD.to_lists(),
+                    "NR_COUNTER": NR_COUNTER,
+                    "PENDING": list(PENDING),
+                    "LINES": SOURCE_LINES,
+                    "SESSION": SESSION_ID
+                }, f, ensure_ascii = False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_name, JOURNAL_SNAPSHOT)
+            
+            if _JOURNAL is not None:
+                _JOURNAL.close()
+            _JOURNAL = open(JOURNAL_FILE, 'w', encoding = 'utf-8')
+            _JOURNAL_SINCE_SNAPSHOT = 0
+        except OSError as e:
+            cprint(f"Error compacting journal: {e}", "RED")
+
+
+def read_journal():
+    """
+    Returns
+    -------
+    state : dict or None
+        OPERATOR, RECORD, NR_COUNTER, PENDING (NRs still waiting for the AI),
+        LINES (hashes of the notes lines, headless mode only), SESSION (the
+        logbook key) and SEQ, rebuilt
+        from JOURNAL_SNAPSHOT plus the journal entries after it; None when
+        there is nothing to recover.
+    
+    A torn last line (power cut mid-write) ends the replay.
+
+    """
+    
+    state = {"SEQ": 0, "OPERATOR": "", "RECORD": [], "NR_COUNTER": 1, "PENDING": [], "LINES": [], "SESSION": ""}
+    found = False
+    if os.path.exists(JOURNAL_SNAPSHOT):
+        with open(JOURNAL_SNAPSHOT, 'r', encoding = 'utf-8') as f:
+            state.update(json.load(f))
+        found = True
+    
+    records = state["RECORD"]
+    index = {record[0]: i for i, record in enumerate(records)}
+    pending = set(state["PENDING"])
+    
+    if os.path.exists(JOURNAL_FILE):
+        with open(JOURNAL_FILE, 'r', encoding = 'utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if entry["seq"] <= state["SEQ"]:
+                    continue
+                found = True
+                state["SEQ"] = entry["seq"]
+                op = entry["op"]
+                if op in ("reserve", "append"):
+                    record = entry["rec"]
+                    index[record[0]] = len(records)
+                    records.append(record)
+                    state["NR_COUNTER"] = int(record[0]) + 1
+                    if op == "reserve":
+                        pending.add(record[0])
+                elif op in ("fill", "defer", "edit"):
+                    record = entry["rec"]
+                    if record[0] in index:
+                        records[index[record[0]]] = record
+                    # 识别失败、只有本地字段的记录仍待处理；更正过的占位记录仍有字段是PENDING_MARK时也是
+                    fields = dict(zip(RECORD_FIELDS, record))
+                    if op == "fill" or op == "edit" and PENDING_MARK not in (fields[f] for f in REQUIRED_FIELDS[:-1]):
+                        pending.discard(record[0])
+                elif op == "clear":
+                    records.clear()
+                    index.clear()
+                    pending.clear()
+                    state["NR_COUNTER"] = 1
+                    state["SESSION"] = ""
+                elif op == "op":
+                    state["OPERATOR"] = entry["call"]
+                elif op == "line":
+                    state["LINES"].append(entry["sha"])
+                elif op == "session":
+                    state["SESSION"] = entry["id"]
+    
+    state["PENDING"] = sorted(pending, key = int)
+    return state if found else None
+
+
+def restore_state(state: dict) -> None:
+    """
+    Replaces the session state with `state` (from a journal or backup file)
+    and re-queues the QSOs that were still waiting for the AI.
+    """
+    
+    global OPERATOR, RECORD, NR_COUNTER, SESSION_ID, _JOURNAL_SEQ
+    
+    with RECORD_LOCK:
+        OPERATOR = state.get("OPERATOR", "")
+        RECORD = RecordStore(state.get("RECORD", []))
+        NR_COUNTER = state.get("NR_COUNTER", len(RECORD) + 1)
+        # 旧的日志和备份没有SESSION，沿用当时以第一条记录的时间为键的写法，仍写入原来的行
+        first = next(iter(RECORD), None)
+        SESSION_ID = state.get("SESSION") or (f"{first.DATE} {first.UTC}" if first is not None else "")
+        # 写入哈希之后、记录之前中断时，多出的哈希没有对应的记录
+        SOURCE_LINES[:] = state.get("LINES", [])[:len(RECORD)]
+        _JOURNAL_SEQ = max(_JOURNAL_SEQ, state.get("SEQ", 0))
+        PENDING.clear()
+        _RETRY.clear()
+        
+        # 先重新排队再压缩，快照中才会保留仍在等待的NR
+        waiting = set(state.get("PENDING", []))
+        for record in RECORD:
+            if record.NR in waiting:
+                queue_extraction(record, record.RMKS)
+        compact_journal()
+        for listener in JOURNAL_LISTENERS:
+            listener({"seq": _JOURNAL_SEQ, "op": "restore", "call": OPERATOR, "nr": NR_COUNTER})
+    logbook_sync()
+    live_export()
+    
+    if waiting:
+        cprint(f"Re-queued {len(waiting)} unfinished QSO(s)", "CYAN")
+
+
+def recover_session() -> None:
+    """
+    
+    The function is called at startup. If the journal holds an unfinished
+    session, the operator may resume it; otherwise the old journal is kept
+    aside under a timestamped name and a new session starts.
+    
+    """
+    
+    try:
+        state = read_journal()
+    except Exception as e:
+        cprint(f"Error reading journal: {e}", "RED")
+        state = None
+    if state is None:
+        return
+    
+    if state["RECORD"]:
+        cprint(f"Unfinished session found: {len(state['RECORD'])} records, OP {state['OPERATOR'] or '-'}", "YELLOW", bright = True)
+        if input("Resume it? [Y/n] ").strip().upper() in ["", "Y", "YES"]:
+            restore_state(state)
+            cprint(f"Session resumed, next NR: {NR_COUNTER}", "GREEN")
+            return
+    
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    for name in (JOURNAL_FILE, JOURNAL_SNAPSHOT):
+        if os.path.exists(name):
+            root, ext = os.path.splitext(name)
+            os.replace(name, f"{root}_{timestamp}{ext}")
+    if state["RECORD"]:
+        cprint(f"Previous journal kept as {os.path.splitext(JOURNAL_FILE)[0]}_{timestamp}.jsonl", "CYAN")
+
+
+def load_bkup() -> None:
+    """
+    
+    The function is called to load from a backup file into RECORD.
+    The session journal is replayed if it holds any records (it is never
+    older than the last SAVE); otherwise the latest backup file is used.
+
+    """
+    
+    try:
+        state = read_journal()
+    except Exception as e:
+        cprint(f"Error reading journal: {e}", "RED")
+        state = None
+    if state is not None and state["RECORD"]:
+        restore_state(state)
+        cprint(f"Replayed journal {JOURNAL_FILE}", "GREEN")
+        cprint(f"Current operator: {OPERATOR}", "CYAN")
+        cprint(f"Records loaded: {len(RECORD)}", "CYAN")
+        return
+    
+    backup_files = [f for f in os.listdir('.') if f.startswith('backup_') and f.endswith('.json')]
+    if not backup_files:
+        cprint("No backup files found.", "YELLOW")
+        return
+    
+    # 按修改时间排序，获取最新的备份文件
+    backup_files.sort(key = lambda x: os.path.getmtime(x), reverse = True)
+    latest_backup = backup_files[0]
+    
+    try:
+        with open(latest_backup, 'r', encoding = 'utf-8') as f:
+            data = json.load(f)
+        restore_state(data)
+        
+        cprint(f"Loaded backup from {latest_backup}", "GREEN")
+        cprint(f"Current operator: {OPERATOR}", "CYAN")
+        cprint(f"Records loaded: {len(RECORD)}", "CYAN")
+    except Exception as e:
+        cprint(f"Error loading backup: {e}", "RED")
+        
+    
+def get_logbook():
+    """
+    Returns
+    -------
+    conn : sqlite3.Connection or None
+        The logbook database (opened and set up on first use), or None when
+        LOGBOOK_DB is empty or the file cannot be opened.
+    
+    Every session is kept in one `qso` table, keyed by (session, nr). WAL
+    mode lets the history queries read while QSOs are being written; the
+    journal already protects the live session, so commits are not fsynced.
+    
+    """
+    
+    global _LOGBOOK, LOGBOOK_DB
+    if not LOGBOOK_DB:
+        return None
+    
+    if _LOGBOOK is None:
+        try:
+            conn = sqlite3.connect(LOGBOOK_DB, check_same_thread = False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS qso (
+                    session TEXT NOT NULL,
+                    nr INTEGER NOT NULL,
+                    date TEXT, utc TEXT, call TEXT, rst TEXT, qth TEXT, rig TEXT,
+                    ant TEXT, pwr TEXT, alt TEXT, rmks TEXT, op TEXT, city TEXT,
+                    PRIMARY KEY (session, nr)
+                );
+                CREATE INDEX IF NOT EXISTS idx_qso_call ON qso (call, date, utc);
+                CREATE INDEX IF NOT EXISTS idx_qso_date ON qso (date, call, session);
+                CREATE INDEX IF NOT EXISTS idx_qso_op ON qso (op, session);
+            """)
+            _LOGBOOK = conn
+        except sqlite3.Error as e:
+            cprint(f"Error opening logbook {LOGBOOK_DB}: {e}", "RED")
+            LOGBOOK_DB = ""
+    return _LOGBOOK
+
+
+def session_key() -> str:
+    """
+    Returns the logbook key of the current session: DATE and UTC of its first
+    record plus a random suffix, made when that record is added, so two
+    sessions started in the same minute never share rows. It is kept in the
+    journal and the backups, so a resumed or reloaded session keeps writing
+    to the same rows.
+    """
+    
+    return SESSION_ID
+
+
+def logbook_put(records) -> None:
+    """
+    Parameters
+    ----------
+    records : iterable of QSORecord
+        Records of the current session to insert or update.
+    
+    Returns
+    -------
+    None.
+    
+    Placeholders still waiting for the AI are skipped; they are written when
+    filled in.
+    
+    """
+    
+    conn = get_logbook()
+    if conn is None:
+        return
+    
+    session = session_key()
+    rows = [(session, int(r.NR), r.DATE, r.UTC, r.CALL.strip().upper(), r.RST, r.QTH, r.RIG,
+             r.ANT, r.PWR, r.ALT, r.RMKS, r.OP.strip().upper(), CITY)
+            for r in records if PENDING_MARK not in (r.CALL, r.RST)]
+    if not rows:
+        return
+    try:
+        with _LOGBOOK_LOCK, conn:
+            conn.executemany("INSERT OR REPLACE INTO qso VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+    except sqlite3.Error as e:
+        cprint(f"Error writing logbook: {e}", "RED")
+
+
+def logbook_sync() -> None:
+    """
+    
+    The function writes every finished record of the session into the logbook.
+    
+    """
+    
+    with RECORD_LOCK:
+        records = list(RECORD)
+    logbook_put(records)
+
+
+def logbook_query(sql: str, params = ()) -> list:
+    """
+    Runs a read-only query on the logbook; returns [] if it is not available.
+    """
+    
+    conn = get_logbook()
+    if conn is None:
+        cprint("Logbook is disabled (LOGBOOK_DB is empty).", "YELLOW")
+        return []
+    try:
+        with _LOGBOOK_LOCK:
+            return conn.execute(sql, params).fetchall()
+    except sqlite3.Error as e:
+        cprint(f"Error reading logbook: {e}", "RED")
+        return []
+
+
+def show_seen(call: str) -> None:
+    """
+    
+    The function is called to show when a station was first and last logged.
+    
+    """
+    
+    call = call.strip().upper()
+    rows = logbook_query("SELECT date, utc, session FROM qso WHERE call = ? "
+                         "ORDER BY date, utc LIMIT 1", (call,))
+    if not rows:
+        cprint(f"{call} is not in the logbook.", "YELLOW")
+        return
+    last = logbook_query("SELECT date, utc, session FROM qso WHERE call = ? "
+                         "ORDER BY date DESC, utc DESC LIMIT 1", (call,))
+    count = logbook_query("SELECT COUNT(*), COUNT(DISTINCT session) FROM qso WHERE call = ?", (call,))
+    cprint(f"{call}: first seen {rows[0][0]} {rows[0][1]}, last seen {last[0][0]} {last[0][1]}", "CYAN", bright = True)
+    cprint(f"{count[0][0]} QSOs in {count[0][1]} sessions", "CYAN")
+
+
+def show_checkins(weeks: int = 4) -> None:
+    """
+    
+    The function is called to show how many sessions each station checked
+    into during the last `weeks` weeks.
+    
+    """
+    
+    since = (datetime.datetime.utcnow() - datetime.timedelta(weeks = weeks)).strftime("%Y-%m-%d")
+    rows = logbook_query("SELECT call, COUNT(DISTINCT session) AS n, MAX(date) FROM qso INDEXED BY idx_qso_date "
+                         "WHERE date >= ? AND call NOT IN ('', 'NULL') "
+                         "GROUP BY call ORDER BY n DESC, call", (since,))
+    if not rows:
+        cprint(f"No check-ins since {since}.", "YELLOW")
+        return
+    
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Check-ins since {since} ({weeks} weeks):{Style.RESET_ALL}")
+    print(f"{Style.BRIGHT}{Fore.WHITE}{'CALL':<10} {'NETS':<6} {'LAST'}{Style.RESET_ALL}")
+    for call, n, last in rows:
+        print(f"{Fore.WHITE}{call:<10} {n:<6} {last}{Style.RESET_ALL}")
+
+
+def show_sessions(op: str) -> None:
+    """
+    
+    The function is called to list all sessions in which `op` was operator.
+    
+    """
+    
+    op = op.strip().upper()
+    rows = logbook_query("SELECT session, COUNT(*), MAX(city) FROM qso WHERE op = ? "
+                         "GROUP BY session ORDER BY session DESC", (op,))
+    if not rows:
+        cprint(f"No sessions by {op or '-'} in the logbook.", "YELLOW")
+        return
+    
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Sessions by {op}:{Style.RESET_ALL}")
+    print(f"{Style.BRIGHT}{Fore.WHITE}{'STARTED (UTC)':<18} {'QSOS':<6} {'CITY'}{Style.RESET_ALL}")
+    for session, n, city in rows:
+        print(f"{Fore.WHITE}{session[:16]:<18} {n:<6} {city}{Style.RESET_ALL}")
+
+
+def finished_records() -> List[dict]:
+    """
+    Returns the records of the session that are no longer waiting for the AI,
+    as dicts, in NR order.
+    """
+    
+    with RECORD_LOCK:
+        return [r.to_dict() for r in RECORD if PENDING_MARK not in (r.CALL, r.RST)]
+
+
+def station_band():
+    """
+    Returns the (ADIF band, Cabrillo frequency) of STATION_FREQ.
+    """
+    
+    mhz = float(STATION_FREQ)
+    for low, high, band, cabrillo in STATION_BANDS:
+        if low <= mhz <= high:
+            return band, cabrillo or str(int(round(mhz * 1000)))
+    return "", str(int(mhz * 1000))
+
+
+def csv_text(values) -> str:
+    """
+    Returns one CSV line (with line terminator) for `values`.
+    """
+    
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def csv_header(first: dict) -> str:
+    # BOM让Excel正确识别中文
+    return "\ufeff" + csv_text(RECORD_FIELDS)
+
+
+def csv_row(record: dict) -> str:
+    return csv_text(record[field] for field in RECORD_FIELDS)
+
+
+def adif_field(name: str, value) -> str:
+    """
+    Returns one ADIF data specifier; the length is counted in UTF-8 bytes,
+    as most loggers expect for non-ASCII text.
+    """
+    
+    value = str(value)
+    return f"<{name}:{len(value.encode('utf-8'))}>{value} "
+
+
+def adif_header(first: dict) -> str:
+    # 不写生成时间，表头不变时重新导出就不必重写整个文件
+    return ("ADIF export by Radio Roll-call AI Logger Assistant\n"
+            + adif_field("ADIF_VER", "3.1.4") + adif_field("PROGRAMID", "AI Logger Assistant") + "<EOH>\n")
+
+
+def adif_row(record: dict) -> str:
+    band, _ = station_band()
+    power = re.match(r"(\d+(?:\.\d+)?)\s*W", record["PWR"], re.IGNORECASE)
+    station = " ".join(f"{field} {record[field]}" for field in ("ANT", "ALT") if record[field] not in ("", "NULL"))
+    fields = [
+        ("CALL", record["CALL"]), ("QSO_DATE", record["DATE"].replace("-", "")),
+        ("TIME_ON", record["UTC"].replace(":", "")), ("BAND", band), ("FREQ", STATION_FREQ),
+        ("MODE", STATION_MODE), ("RST_SENT", record["RST"]), ("QTH", record["QTH"]), ("RIG", record["RIG"]),
+        ("RX_PWR", power.group(1) if power else ""), ("COMMENT", station), ("NOTES", record["RMKS"]),
+        ("OPERATOR", record["OP"]), ("STX", record["NR"]),
+    ]
+    return "".join(adif_field(name, value) for name, value in fields if value not in ("", "NULL")) + "<EOR>\n"
+
+
+def cabrillo_header(first: dict) -> str:
+    call = first["OP"] if first else OPERATOR
+    return (f"START-OF-LOG: 3.0\nCREATED-BY: Radio Roll-call AI Logger Assistant\n"
+            f"CONTEST: {CABRILLO_CONTEST}\nCALLSIGN: {call}\nCATEGORY-MODE: {STATION_MODE}\n")
+
+
+def cabrillo_row(record: dict) -> str:
+    # 点名只有一个信号报告：发出的交换为RST和序号，收到的交换为RST和QTH
+    _, freq = station_band()
+    qth = re.sub(r"\s+", "", record["QTH"]) if record["QTH"] not in ("", "NULL") else "-"
+    return (f"QSO: {freq:>5} {STATION_MODE} {record['DATE']} {record['UTC'].replace(':', '')} "
+            f"{record['OP']:<13} {record['RST']:<3} {record['NR']:>4} {record['CALL']:<13} {record['RST']:<3} {qth}\n")
+
+
+def cabrillo_footer() -> str:
+    return "END-OF-LOG:\n"
+
+
+def no_footer() -> str:
+    return ""
+
+
+EXPORTERS = {    # 扩展名 -> (表头, 每条记录, 结尾)
+    ".csv": (csv_header, csv_row, no_footer),
+    ".adi": (adif_header, adif_row, no_footer),
+    ".adif": (adif_header, adif_row, no_footer),
+    ".log": (cabrillo_header, cabrillo_row, cabrillo_footer),
+    ".cbr": (cabrillo_header, cabrillo_row, cabrillo_footer),
+}
+
+
+def export_path(filename: str) -> str:
+    """
+    Returns `filename` with .csv appended unless it already ends with the
+    extension of one of the EXPORTERS.
+    """
+    
+    filename = filename.strip()
+    return filename if os.path.splitext(filename)[1].lower() in EXPORTERS else filename + ".csv"
+
+
+def export_stream(records, path: str):
+    """
+    Parameters
+    ----------
+    records : iterable of dict
+        Records with the RECORD_FIELDS keys; consumed lazily.
+    path : str
+        The target file name; its extension selects the format.
+    
+    Yields
+    ------
+    chunk : str
+        The header, one chunk per record, then the footer.
+    
+    """
+    
+    header, row, footer = EXPORTERS[os.path.splitext(path)[1].lower()]
+    records = iter(records)
+    first = next(records, None)
+    yield header(first)
+    if first is not None:
+        yield row(first)
+        for record in records:
+            yield row(record)
+    yield footer()
+
+
+class ExportFile:
+    """
+    An export file kept in step with the records of the session. `sync`
+    compares the records with the ones already written and rewrites the file
+    only from the first changed record on, so appending a QSO writes one row
+    and an EDIT rewrites the rows from the edited one to the end. A file that
+    was changed or replaced by another program is written again in full.
+    """
+    
+    __slots__ = ("path", "keys", "chunks", "offsets", "stamp")
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.keys = []        # 已写入的各条记录的字段值
+        self.chunks = []      # 已写入的表头和各条记录的文本
+        self.offsets = [0]    # 各段在文件中的起始字节位置，最后一项为记录部分的结尾
+        self.stamp = None     # 上次写完后文件的 (大小, 修改时间)
+    
+    def file_stamp(self):
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return None
+        return info.st_size, info.st_mtime_ns
+    
+    def sync(self, records: List[dict]) -> int:
+        """
+        Brings the file up to date with `records`; returns the number of
+        chunks (header and rows) written.
+        """
+        
+        header, row, footer = EXPORTERS[os.path.splitext(self.path)[1].lower()]
+        keys = [tuple(record[field] for field in RECORD_FIELDS) for record in records]
+        head = header(records[0] if records else None)
+        
+        # 表头相同且文件未被别的程序改动时，找到第一条变化的记录，只渲染并重写它之后的部分
+        same = 0
+        if self.chunks and self.chunks[0] == head and self.stamp is not None and self.file_stamp() == self.stamp:
+            same = 1
+            for old, new in zip(self.keys, keys):
+                if old != new:
+                    break
+                same += 1
+            if same == len(keys) + 1 == len(self.chunks):
+                return 0
+        
+        chunks = self.chunks[:same] + ([] if same else [head])
+        chunks += [row(record) for record in records[max(same - 1, 0):]]
+        offsets = self.offsets[:same + 1] if same else [0]
+        with open(self.path, "r+b" if same else "wb") as f:
+            f.seek(offsets[-1])
+            f.truncate()
+            for chunk in chunks[same:]:
+                data = chunk.encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+            f.write(footer().encode("utf-8"))
+        self.keys, self.chunks, self.offsets = keys, chunks, offsets
+        self.stamp = self.file_stamp()
+        return len(chunks) - same
+
+
+def live_export() -> None:
+    """
+    
+    The function brings LIVE_EXPORT_FILE up to date after a record was
+    added, filled in, edited or cleared.
+    
+    """
+    
+    global _LIVE_EXPORT
+    if not LIVE_EXPORT_FILE:
+        return
+    
+    with RECORD_LOCK:
+        if _LIVE_EXPORT is None or _LIVE_EXPORT.path != export_path(LIVE_EXPORT_FILE):
+            _LIVE_EXPORT = ExportFile(export_path(LIVE_EXPORT_FILE))
+        try:
+            _LIVE_EXPORT.sync(finished_records())
+        except OSError as e:
+            cprint(f"Error writing {_LIVE_EXPORT.path}: {e}", "RED")
+
+
+def logbook_rows():
+    """
+    Yields every QSO of the logbook as a dict, session by session, reading
+    through a separate connection so that memory use does not grow with the
+    size of the logbook.
+    """
+    
+    conn = sqlite3.connect(LOGBOOK_DB)
+    try:
+        for row in conn.execute("SELECT nr, date, utc, call, rst, qth, rig, ant, pwr, alt, rmks, op "
+                                "FROM qso ORDER BY session, nr"):
+            yield dict(zip(RECORD_FIELDS, ("" if value is None else str(value) for value in row)))
+    finally:
+        conn.close()
+
+
+def export_logbook(filename: str) -> None:
+    """
+    Parameters
+    ----------
+    filename : str
+        The target file; .csv, .adi or .log (Cabrillo). Without one of these
+        extensions, .csv is appended.
+    
+    Returns
+    -------
+    None.
+    
+    The function is called to export every session in the logbook.
+    
+    """
+    
+    if get_logbook() is None:
+        cprint("Logbook is disabled (LOGBOOK_DB is empty).", "YELLOW")
+        return
+    logbook_sync()
+    
+    path = export_path(filename)
+    chunks = 0
+    try:
+        with open(path, "w", encoding = "utf-8", newline = "") as f:
+            for chunk in export_stream(logbook_rows(), path):
+                f.write(chunk)
+                chunks += 1
+    except (OSError, sqlite3.Error) as e:
+        cprint(f"Error exporting logbook: {e}", "RED")
+        return
+    cprint(f"{chunks - 2} QSOs exported to {path}", "GREEN")
+
+
+def append_record(info: List[str], announce: bool = True, pending: bool = False, when: datetime.datetime = None) -> QSORecord:
+    """
+    Parameters
+    ----------
+    info : list
+        A list containing basic info, including:
+            CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS
+            in order.
+    announce : bool
+        Whether to print the "Record #N added" line.
+    pending : bool
+        The record is a placeholder still waiting for the AI.
+    when : datetime, optional
+        UTC time of the QSO, e.g. from a transcript; default now.
+
+    Returns
+    -------
+    record : QSORecord
+        The record just appended.
+    
+    The function is called to append a record into RECORD.
+    Time info DATE and UTC (gets from system), serial number NR and OP will be added.
+
+    """
+    
+    global NR_COUNTER, SESSION_ID
+    
+    # 获取当前日期和UTC时间
+    now = when or datetime.datetime.utcnow()
+    date_str = now.strftime("%Y-%m-%d")
+    utc_str = now.strftime("%H:%M")
+    
+    with RECORD_LOCK:
+        if not SESSION_ID:
+            # 新的一次点名：以时间开头便于排序，随机后缀区分同一分钟开始的点名
+            SESSION_ID = f"{date_str} {utc_str} {uuid.uuid4().hex[:6]}"
+            journal_write("session", id = SESSION_ID)
+        # 构建完整记录 NR, DATE, UTC, CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS, OP
+        record = QSORecord(
+            str(NR_COUNTER),  # NR
+            date_str,         # DATE
+            utc_str,          # UTC
+            info[0] if len(info) > 0 else "",  # CALL
+            info[1] if len(info) > 1 else "",  # RST
+            info[2] if len(info) > 2 else "",  # QTH
+            info[3] if len(info) > 3 else "",  # RIG
+            info[4] if len(info) > 4 else "",  # ANT
+            info[5] if len(info) > 5 else "",  # PWR
+            info[6] if len(info) > 6 else "",  # ALT
+            info[7] if len(info) > 7 else "",  # RMKS
+            OPERATOR          # OP
+        )
+        
+        earlier = RECORD.find_call(record.CALL)
+        RECORD.append(record)
+        NR_COUNTER += 1
+        journal_write("reserve" if pending else "append", rec = record.to_list())
+        notes = []
+        if not pending:
+            logbook_put([record])
+            live_export()
+            notes = check_call(record, earlier)
+            learn_profile(record.to_dict())
+    
+    if announce:
+        cprint(f"Record #{record.NR} added: {record.CALL} - {record.DATE} {record.UTC}", "GREEN")
+        warn_record(record, earlier, notes)
+    return record
+
+
+def warn_record(record: QSORecord, earlier: List[QSORecord], notes: List[str] = ()) -> None:
+    """
+    
+    The function warns when a station has already checked in this session,
+    and prints the callsign check notes of a newly added record.
+    
+    """
+    
+    earlier = [r for r in earlier if r is not record]
+    if earlier:
+        numbers = ", ".join(f"#{r.NR}" for r in earlier)
+        notes = [f"Note: {record.CALL} already logged as {numbers}"] + list(notes)
+    for note in notes:
+        cprint(note, "YELLOW")
+        if _WARNINGS is not None:
+            _WARNINGS.append((int(record.NR), note))
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the shared worker pool for QSO extraction, creating it on first use.
+    At most MAX_CONCURRENT_REQUESTS API calls are in flight at the same time;
+    extra QSOs wait in the pool's FIFO queue, so they are sent in NR order.
+    """
+    
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers = MAX_CONCURRENT_REQUESTS,
+                                       thread_name_prefix = "qso")
+    return _EXECUTOR
+
+
+def submit_qso(raw_text: str, when: datetime.datetime = None) -> None:
+    """
+    Parameters
+    ----------
+    raw_text : str
+        Raw QSO text typed by the operator.
+    when : datetime, optional
+        UTC time of the QSO when it is not now (transcripts).
+
+    Returns
+    -------
+    None.
+    
+    The function is called to queue a QSO for background extraction.
+    A placeholder record takes the next NR at once (raw text kept in RMKS),
+    so the operator can go on typing while the API call is running.
+    The structured fields are filled in by fill_record() when the response arrives.
+
+    """
+    
+    record = append_record([PENDING_MARK] * 7 + [raw_text], announce = False, pending = True, when = when)
+    queue_extraction(record, raw_text)
+
+
+def queue_extraction(record: QSORecord, raw_text: str, announce: bool = True) -> None:
+    """
+    Starts the extraction of a placeholder record (new, re-queued after a
+    recovery, or retried after a failed API call) and marks it as pending.
+    """
+    
+    finished = Future()
+    key = cache_key(raw_text)
+    
+    # 本地能认出呼号时立即显示；否则等流式返回的CALL和RST
+    local, resolved, _ = local_extract(raw_text)
+    with RECORD_LOCK:
+        if "CALL" in resolved:
+            RECORD.update(record, CALL = local["CALL"])
+        else:
+            _EARLY_LISTENERS.setdefault(key, []).append(record)
+        PENDING[record.NR] = (raw_text, time.time())
+        call_hint = f": {record.CALL}" if "CALL" in resolved else ""
+        if announce:
+            cprint(f"Record #{record.NR} queued{call_hint} ({len(PENDING)} pending)", "CYAN")
+        _FUTURES.append(finished)
+    
+    extract_async(raw_text).add_done_callback(lambda f: complete_qso(record, f, finished, key))
+
+
+def notify_early(key: str, field: str, value) -> None:
+    """
+    Called from the streaming parser as fields complete: CALL and RST are
+    written into the waiting placeholder records of `key` and announced
+    once both are known, while the rest of the answer is still generated.
+    """
+    
+    if field not in ("CALL", "RST") or not key:
+        return
+    
+    with RECORD_LOCK:
+        records = _EARLY_LISTENERS.get(key, [])
+        ready = []
+        for record in records:
+            if record.NR not in PENDING or record not in RECORD:
+                continue
+            RECORD.update(record, **{field: str(value)})
+            if PENDING_MARK not in (record.CALL, record.RST):
+                ready.append(record)
+        if not ready:
+            return
+        _EARLY_LISTENERS[key] = [r for r in records if not any(r is x for x in ready)]
+    
+    for record in ready:
+        if PROMPT_SHOWN.is_set():
+            cprint(f"\nRecord #{record.NR}: {record.CALL} {record.RST} ...", "CYAN")
+            print_prompt()
+        else:
+            cprint(f"Record #{record.NR}: {record.CALL} {record.RST} ...", "CYAN")
+
+
+def complete_qso(record: QSORecord, future: Future, finished: Future, key: str = "") -> None:
+    """
+    Done-callback of a queued QSO: fills its placeholder record from the
+    extraction result, then marks `finished` for wait_pending().
+    """
+    
+    with RECORD_LOCK:
+        listeners = _EARLY_LISTENERS.get(key)
+        if listeners is not None:
+            listeners[:] = [r for r in listeners if r is not record]
+            if not listeners:
+                del _EARLY_LISTENERS[key]
+    
+    error = None
+    try:
+        formatted_json = future.result()
+        info_dict = json.loads(formatted_json)
+        if api_failed(info_dict):
+            error = info_dict["RMKS"]
+        
+        # 提取信息
+        info = [
+            info_dict.get("CALL", ""),
+            info_dict.get("RST", ""),
+            info_dict.get("QTH", ""),
+            info_dict.get("RIG", ""),
+            info_dict.get("ANT", ""),
+            info_dict.get("PWR", ""),
+            info_dict.get("ALT", ""),
+            info_dict.get("RMKS", "")
+        ]
+    except Exception as e:
+        error = f"Error processing QSO: {e}"
+    
+    try:
+        if error is None:
+            fill_record(record, info)
+        else:
+            defer_qso(record, error)
+    finally:
+        finished.set_result(None)
+
+
+def defer_qso(record: QSORecord, error: str) -> None:
+    """
+    Parameters
+    ----------
+    record : QSORecord
+        A queued record whose extraction failed.
+    error : str
+        The reason, shown to the operator.
+    
+    Returns
+    -------
+    None.
+    
+    Instead of NULL fields, the record gets what the local parser finds in
+    its raw text, which stays in RMKS, and remains pending: the retry thread
+    queues it again after RETRY_DELAY (doubling up to RETRY_MAX_DELAY), and
+    a recovered session re-queues it like any other pending QSO.
+    
+    """
+    
+    with RECORD_LOCK:
+        if record.NR not in PENDING or record not in RECORD:
+            return
+        raw_text = PENDING[record.NR][0]
+        local, _, _ = local_extract(raw_text)
+        prefill_from_profile(local)
+        RECORD.update(record, **{field: local[field] for field in REQUIRED_FIELDS[:-1]}, RMKS = raw_text)
+        journal_write("defer", rec = record.to_list())
+        live_export()
+        attempts = _RETRY[record.NR][2] + 1 if record.NR in _RETRY else 1
+        delay = min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        _RETRY[record.NR] = [record, raw_text, attempts, time.time() + delay]
+        API_STATS["deferred"] += 1
+    start_retry_thread()
+    
+    background_print(f"Record #{record.NR} kept with local fields: {record.CALL} "
+                     f"({error}; retry in {delay:.0f}s)", "YELLOW")
+
+
+def start_retry_thread() -> None:
+    """
     
+    The function starts retry_loop() in a daemon thread, once.
     
-def load_bkup() -> None:
     """
     
-    The function is called to load from a backup file into RECORD.
+    global _RETRY_THREAD
+    with _BATCH_LOCK:
+        if _RETRY_THREAD is None:
+            _RETRY_THREAD = threading.Thread(target = retry_loop, name = "retry", daemon = True)
+            _RETRY_THREAD.start()
 
+
+def retry_loop() -> None:
     """
     
-    global OPERATOR, RECORD, NR_COUNTER
-    
-    backup_files = [f for f in os.listdir('.') if f.startswith('backup_') and f.endswith('.json')]
-    if not backup_files:
-        cprint("No backup files found.", "YELLOW")
-        return
+    The function queues the deferred QSOs again once their retry time has
+    come and the AI may be called; while the breaker is testing the AI
+    (half-open) only one QSO is sent.
     
-    # 按修改时间排序，获取最新的备份文件
-    backup_files.sort(key = lambda x: os.path.getmtime(x), reverse = True)
-    latest_backup = backup_files[0]
+    """
     
-    try:
-        with open(latest_backup, 'r', encoding = 'utf-8') as f:
-            data = json.load(f)
-            OPERATOR = data.get("OPERATOR", "")
-            RECORD = data.get("RECORD", [])
-            NR_COUNTER = data.get("NR_COUNTER", len(RECORD) + 1)
-        
-        cprint(f"Loaded backup from {latest_backup}", "GREEN")
-        cprint(f"Current operator: {OPERATOR}", "CYAN")
-        cprint(f"Records loaded: {len(RECORD)}", "CYAN")
-    except Exception as e:
-        cprint(f"Error loading backup: {e}", "RED")
+    while True:
+        _RETRY_WAKE.wait(1.0)
+        _RETRY_WAKE.clear()
+        with _BREAKER_LOCK:
+            state = _BREAKER["state"]
+            waiting = state == "open" and time.monotonic() - _BREAKER["opened"] < BREAKER_COOLDOWN
+            probing = _BREAKER["probe"]
+        if waiting or probing:
+            continue
         
-    
-def append_record(info: List[str]) -> None:
+        now = time.time()
+        with RECORD_LOCK:
+            due = sorted((nr for nr, item in _RETRY.items() if item[3] <= now), key = int)
+            if state != "closed":
+                due = due[:1]
+            for nr in due:
+                record, raw_text, attempts, _ = _RETRY[nr]
+                if record not in RECORD:
+                    del _RETRY[nr]
+                    continue
+                _RETRY[nr][3] = float("inf")    # 处理中
+                queue_extraction(record, raw_text, announce = False)
+
+
+def fill_record(record: QSORecord, info: List[str]) -> None:
     """
     Parameters
     ----------
+    record : QSORecord
+        The placeholder record created by submit_qso().
     info : list
-        A list containing basic info, including:
-            CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS
-            in order.
+        CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS in order.
 
     Returns
     -------
     None.
     
-    The function is called to append a record into RECORD.
-    Time info DATE and UTC (gets from system), serial number NR and OP will be added.
+    The function is called to write the extracted fields into a placeholder record.
+    If the record has been dropped meanwhile (CLEAR or LOAD) or corrected by
+    hand (EDIT of a record kept with local fields), the result is discarded.
 
     """
     
-    global NR_COUNTER
+    begin = time.perf_counter()
+    with RECORD_LOCK:
+        raw_text, submitted = PENDING.pop(record.NR, (None, 0))
+        if _RETRY.pop(record.NR, None) is not None:
+            API_STATS["recovered"] += 1
+        # 不再待处理：主控已用EDIT更正了这条记录，AI的结果不能覆盖更正
+        if raw_text is None or record not in RECORD:
+            return
+        RECORD.update(record, **dict(zip(REQUIRED_FIELDS, info)))
+        journal_write("fill", rec = record.to_list())
+        logbook_put([record])
+        live_export()
+        earlier = [r for r in RECORD.find_call(record.CALL) if r is not record]
+        notes = check_call(record, earlier)
+        learn_profile(record.to_dict(), raw_text)
+    record_stage("record", time.perf_counter() - begin)
+    if submitted:
+        record_stage("qso_total", time.time() - submitted)
     
-    # 获取当前日期和UTC时间
-    now = datetime.datetime.utcnow()
-    date_str = now.strftime("%Y-%m-%d")
-    utc_str = now.strftime("%H:%M")
+    if PROMPT_SHOWN.is_set():
+        # 主控正在输入，另起一行打印结果后重绘提示符
+        cprint(f"\nRecord #{record.NR} added: {record.CALL} - {record.DATE} {record.UTC}", "GREEN")
+        warn_record(record, earlier, notes)
+        print_prompt()
+    else:
+        cprint(f"Record #{record.NR} added: {record.CALL} - {record.DATE} {record.UTC}", "GREEN")
+        warn_record(record, earlier, notes)
+
+
+def wait_pending() -> None:
+    """
     
-    # 构建完整记录 [NR, DATE, UTC, CALL, RST, QTH, RIG, ANT, PWR, ALT, RMKS, OP]
-    record = [
-        str(NR_COUNTER),  # NR
-        date_str,         # DATE
-        utc_str,          # UTC
-        info[0] if len(info) > 0 else "",  # CALL
-        info[1] if len(info) > 1 else "",  # RST
-        info[2] if len(info) > 2 else "",  # QTH
-        info[3] if len(info) > 3 else "",  # RIG
-        info[4] if len(info) > 4 else "",  # ANT
-        info[5] if len(info) > 5 else "",  # PWR
-        info[6] if len(info) > 6 else "",  # ALT
-        info[7] if len(info) > 7 else "",  # RMKS
-        OPERATOR          # OP
-    ]
+    The function blocks until every queued QSO has been processed.
+    
+    """
     
-    RECORD.append(record)
-    NR_COUNTER += 1
-    cprint(f"Record #{record[0]} added: {record[3]} - {record[1]} {record[2]}", "GREEN")
+    with RECORD_LOCK:
+        futures = list(_FUTURES)
+        _FUTURES.clear()
+    
+    if len(PENDING) > len(_RETRY):
+        cprint(f"Waiting for {len(PENDING) - len(_RETRY)} pending QSO(s)...", "YELLOW")
+    for future in futures:
+        future.result()
+    if _RETRY:
+        # 仅本地模式下不等待：这些记录已有本地识别的字段，程序运行期间会继续重试
+        cprint(f"{len(_RETRY)} QSO(s) have local fields only (AI unavailable); "
+               f"they are retried in the background, see PENDING", "YELLOW")
     
 
 def edit_record(call: str) -> None:
@@ -431,71 +3554,86 @@ def edit_record(call: str) -> None:
     """
     global RECORD
     
-    # 查找指定呼号的记录
-    found_records = []
-    for i, record in enumerate(RECORD):
-        if record[3].upper() == call.upper():  # 比较CALL字段
-            found_records.append((i, record))
-    
+    # 通过呼号索引查找指定呼号的记录
+    with RECORD_LOCK:
+        found_records = RECORD.find_call(call)
+
     if not found_records:
         cprint(f"未找到呼号为 {call} 的记录", "RED")
         return
     
     if len(found_records) > 1:
         cprint(f"找到多个呼号为 {call} 的记录:", "YELLOW")
-        for i, record in found_records:
-            cprint(f"  #{record[0]} - {record[3]} - {record[1]} {record[2]} - {record[5]}", "WHITE")
+        for record in found_records:
+            cprint(f"  #{record.NR} - {record.CALL} - {record.DATE} {record.UTC} - {record.QTH}", "WHITE")
         record_index = input("请输入要编辑的记录编号: ").strip()
         try:
             record_index = int(record_index)
-            record_to_edit = None
-            for i, record in found_records:
-                if int(record[0]) == record_index:
-                    record_to_edit = (i, record)
+            original_record = None
+            for record in found_records:
+                if int(record.NR) == record_index:
+                    original_record = record
                     break
-            if record_to_edit is None:
+            if original_record is None:
                 cprint("未找到指定编号的记录", "RED")
                 return
         except ValueError:
             cprint("无效的编号", "RED")
             return
     else:
-        record_to_edit = found_records[0]
+        original_record = found_records[0]
+    
+    # 识别结果到达时会重写整条记录，此时的更正会丢失，AI也只能看到占位符
+    with RECORD_LOCK:
+        in_flight = original_record.NR in PENDING and original_record.NR not in _RETRY
+    if in_flight:
+        cprint(f"记录 #{original_record.NR} 仍在等待AI识别，请识别完成后再编辑", "YELLOW")
+        return
     
-    original_record = record_to_edit[1]
-    cprint(f"原始记录: #{original_record[0]} - {original_record[3]} - {original_record[5]}", "CYAN")
+    cprint(f"原始记录: #{original_record.NR} - {original_record.CALL} - {original_record.QTH}", "CYAN")
     
     correction = input("请输入更正内容: ").strip()
     if not correction:
         cprint("更正内容不能为空", "RED")
         return
     
-    # 调用AI API获取格式化信息
     try:
-        # 构建原始记录字符串用于AI处理
-        original_str = f"CALL: {original_record[3]}, RST: {original_record[4]}, QTH: {original_record[5]}, RIG: {original_record[6]}, ANT: {original_record[7]}, PWR: {original_record[8]}, ALT: {original_record[9]}, RMKS: {original_record[10]}"
-        formatted_json = get_respond_for_edit(original_str, correction)
-        info_dict = json.loads(formatted_json)
-        
-        # 提取信息并更新记录
-        updated_record = [
-            original_record[0],  # NR保持不变
-            original_record[1],  # DATE保持不变
-            original_record[2],  # UTC保持不变
-            info_dict.get("CALL", original_record[3]),  # 使用AI返回的值或保持原值
-            info_dict.get("RST", original_record[4]),
-            info_dict.get("QTH", original_record[5]),
-            info_dict.get("RIG", original_record[6]),
-            info_dict.get("ANT", original_record[7]),
-            info_dict.get("PWR", original_record[8]),
-            info_dict.get("ALT", original_record[9]),
-            info_dict.get("RMKS", original_record[10]),
-            original_record[11]  # OP保持不变
-        ]
-        
-        # 更新记录
-        RECORD[record_to_edit[0]] = updated_record
-        cprint(f"记录 #{updated_record[0]} 已更新: {updated_record[3]} - {updated_record[1]} {updated_record[2]}", "GREEN")
+        begin = time.perf_counter()
+        # “字段 新值”形式的更正在本地直接修改对应字段，其余交给AI
+        changes = parse_edit(correction)
+        if changes is not None:
+            EDIT_STATS["local"] += 1
+        else:
+            EDIT_STATS["model"] += 1
+            # 构建原始记录字符串用于AI处理
+            original_str = ", ".join(f"{field}: {getattr(original_record, field)}" for field in REQUIRED_FIELDS)
+            formatted_json = get_respond_for_edit(original_str, correction)
+            info_dict = json.loads(formatted_json)
+            if api_failed(info_dict):
+                cprint("AI暂时不可用，记录未修改；“字段 新值”形式的更正仍可在本地完成", "YELLOW")
+                return
+            
+            # 更新记录：NR、DATE、UTC、OP保持不变，其余字段使用AI返回的值或保持原值
+            changes = {field: info_dict.get(field, getattr(original_record, field)) for field in REQUIRED_FIELDS}
+        with RECORD_LOCK:
+            before = original_record.to_dict()
+            old_qth = original_record.QTH
+            RECORD.update(original_record, **changes)
+            if _RETRY.pop(original_record.NR, None) is not None:
+                # 主控已手动更正识别失败的记录，不再等AI重新处理
+                PENDING.pop(original_record.NR, None)
+            journal_write("edit", rec = original_record.to_list())
+            logbook_put([original_record])
+            live_export()
+            earlier = [r for r in RECORD.find_call(original_record.CALL) if r is not original_record]
+            notes = check_call(original_record, earlier)
+            learn_profile(original_record.to_dict(), old_qth = old_qth)
+        record_stage("edit_total", time.perf_counter() - begin)
+        cprint(f"记录 #{original_record.NR} 已更新: {original_record.CALL} - {original_record.DATE} {original_record.UTC}", "GREEN")
+        for field in REQUIRED_FIELDS:
+            if before[field] != getattr(original_record, field):
+                cprint(f"  {field}: {before[field]} -> {getattr(original_record, field)}", "CYAN")
+        warn_record(original_record, [], notes)
     except Exception as e:
         cprint(f"Error processing edit: {e}", "RED")
         cprint("Please try again or use 'H' for help.", "YELLOW")
@@ -509,7 +3647,9 @@ def modify_op(call: str) -> None:
     """
     
     global OPERATOR
-    OPERATOR = call
+    with RECORD_LOCK:
+        OPERATOR = call
+        journal_write("op", call = call)
     cprint(f"Operator changed to: {OPERATOR}", "GREEN")
     
     
@@ -527,15 +3667,238 @@ def get_input():
     
     """
     
-    global NR_COUNTER
+    global TYPEAHEAD_MODE
+    
+    editor = get_line_editor() if TYPEAHEAD_MODE else None
+    if editor is not None:
+        return read_line(editor)
+    if TYPEAHEAD_MODE:
+        TYPEAHEAD_MODE = False
+        cprint("Type-ahead off: it needs prompt_toolkit (pip install prompt_toolkit) and a terminal", "YELLOW")
+    
+    print_prompt()
+    PROMPT_SHOWN.set()
+    try:
+        return input().strip().upper()
+    finally:
+        PROMPT_SHOWN.clear()
+
+
+def prompt_text() -> str:
+    """
+    Returns the input prompt, [OP][Nr. x] > , with its colours.
+    """
     
     if OPERATOR == "":
-        cprint("[OP NOT SET!]", "RED", end_str = "")
+        op = f"{Style.NORMAL}{Fore.RED}[OP NOT SET!]{Style.RESET_ALL}"
+    else:
+        op = f"{Style.NORMAL}{Fore.GREEN}[{OPERATOR}]{Style.RESET_ALL}"
+    return f"{op}{Style.BRIGHT}{Fore.WHITE}[Nr. {NR_COUNTER}] > {Style.RESET_ALL}"
+
+
+def print_prompt() -> None:
+    """
+    
+    The function is called to print the input prompt, [OP][Nr. x] >
+    
+    """
+    
+    print(prompt_text(), end = "", flush = True)
+
+
+def get_line_editor():
+    """
+    Returns the prompt_toolkit session used for input in TYPEAHEAD_MODE,
+    creating it on first use; None when prompt_toolkit is not installed or
+    the input is not a terminal.
+    """
+    
+    global _LINE_EDITOR
+    if _LINE_EDITOR is None:
+        try:
+            from prompt_toolkit import PromptSession
+        except ImportError:
+            _LINE_EDITOR = False
+        else:
+            if sys.stdin.isatty() and sys.stdout.isatty():
+                _LINE_EDITOR = PromptSession()
+                _LINE_EDITOR.default_buffer.on_text_changed += lambda buffer: typeahead_changed(buffer.text)
+            else:
+                _LINE_EDITOR = False
+    return _LINE_EDITOR or None
+
+
+def read_line(editor) -> str:
+    """
+    get_input() with the line editor: messages from the workers are printed
+    above the line being typed, and speculate() runs whenever typing pauses.
+    """
+    
+    from prompt_toolkit.formatted_text import ANSI
+    from prompt_toolkit.patch_stdout import patch_stdout
+    
+    line = ""
+    try:
+        with patch_stdout(raw = True):
+            line = editor.prompt(ANSI(prompt_text())).strip().upper()
+        return line
+    finally:
+        typeahead_enter(line)
+
+
+def typeahead_changed(text: str) -> None:
+    """
+    Called by the line editor on every change of the input line: drops the
+    speculative request once the line no longer matches it, and restarts
+    the TYPEAHEAD_PAUSE timer of speculate().
+    """
+    
+    text = text.strip().upper()
+    with _TYPEAHEAD_LOCK:
+        _TYPEAHEAD["edits"] += 1
+        if _TYPEAHEAD["timer"] is not None:
+            _TYPEAHEAD["timer"].cancel()
+        request = _TYPEAHEAD["request"]
+        if request is not None and normalize_raw_text(text) != request["text"]:
+            _TYPEAHEAD["request"] = None
+        else:
+            request = None
+        timer = threading.Timer(TYPEAHEAD_PAUSE, speculate, (text, _TYPEAHEAD["edits"]))
+        timer.daemon = True
+        _TYPEAHEAD["timer"] = timer
+        timer.start()
+    if request is not None:
+        drop_speculation(request)
+
+
+def speculate(text: str, edits: int) -> None:
+    """
+    Parameters
+    ----------
+    text : str
+        The input line, as typed so far.
+    edits : int
+        _TYPEAHEAD["edits"] when the timer was started; if the line was
+        changed (or entered) since, nothing is sent.
+    
+    Returns
+    -------
+    None.
+    
+    The function runs once typing pauses for TYPEAHEAD_PAUSE and sends the
+    line for extraction ahead of Enter. The request is registered in the
+    in-flight table and its answer goes to the cache, under the line's cache
+    key: if Enter is pressed on the same line, submit_qso() waits for it or
+    finds the answer instead of sending another request. Commands, short
+    lines, lines without a callsign or fully parsed locally, and known
+    answers are not sent; nor is anything in local-only mode or while all
+    MAX_CONCURRENT_REQUESTS slots are busy with entered QSOs.
+    
+    """
+    
+    words = text.split()
+    if (not OPERATOR or len(text) < TYPEAHEAD_MIN_CHARS or words[0] in COMMAND_WORDS
+            or _BREAKER["state"] != "closed"):
+        return
+    _, resolved, leftover, _ = resolve_local(text)
+    if "CALL" not in resolved or not leftover:
+        return
+    
+    key = cache_key(text)
+    if not _BATCH_SLOTS.acquire(blocking = False):
+        return
+    request = None
+    with _TYPEAHEAD_LOCK:
+        if _TYPEAHEAD["edits"] == edits and _TYPEAHEAD["request"] is None:
+            with _CACHE_LOCK:
+                if key not in load_cache() and key not in _INFLIGHT:
+                    future, _ = claim_inflight(key)
+                    request = {"text": normalize_raw_text(text), "raw": text, "key": key, "future": future,
+                               "cancel": threading.Event()}
+                    _TYPEAHEAD["request"] = request
+    if request is None:
+        _BATCH_SLOTS.release()
+        return
+    
+    with _STATS_LOCK:
+        TYPEAHEAD_STATS["requests"] += 1
+    get_executor().submit(run_speculation, request)
+
+
+def run_speculation(request: dict) -> None:
+    """
+    Worker of speculate(): sends the line and resolves its in-flight future
+    like any other extraction (with RequestCancelled when it was dropped).
+    """
+    
+    try:
+        result = request_extraction(request["raw"], request["key"], request["cancel"])
+    except BaseException as e:
+        resolve_inflight(request["key"], request["future"], error = e)
     else:
-        cprint(f"[{OPERATOR}]", "GREEN", end_str = "")
+        resolve_inflight(request["key"], request["future"], result)
+    finally:
+        _BATCH_SLOTS.release()
+
 
-    cprint(f"[Nr. {NR_COUNTER}] > ", "WHITE", bright = True, end_str = "")    
-    return input().strip().upper()
+def drop_speculation(request: dict) -> None:
+    """
+    Counts a speculative request as wasted and cancels it if still running.
+    """
+    
+    with _STATS_LOCK:
+        TYPEAHEAD_STATS["wasted"] += 1
+        TYPEAHEAD_STATS["stopped"] += not request["future"].done()
+    request["cancel"].set()
+    # 立即从正在请求的表中去掉：同样的内容再次输入时重新发送，而不是等这个被取消的请求
+    with _CACHE_LOCK:
+        if _INFLIGHT.get(request["key"]) is request["future"]:
+            del _INFLIGHT[request["key"]]
+
+
+def typeahead_enter(line: str) -> None:
+    """
+    Called when Enter is pressed, before the line is handled. A speculative
+    request for the same line is left for submit_qso() and counted as a hit
+    ("ready" when its answer is already there); any other is dropped.
+    """
+    
+    with _TYPEAHEAD_LOCK:
+        _TYPEAHEAD["edits"] += 1
+        if _TYPEAHEAD["timer"] is not None:
+            _TYPEAHEAD["timer"].cancel()
+            _TYPEAHEAD["timer"] = None
+        request, _TYPEAHEAD["request"] = _TYPEAHEAD["request"], None
+    if request is None:
+        return
+    
+    if normalize_raw_text(line) == request["text"]:
+        with _CACHE_LOCK:
+            ready = request["key"] in load_cache()
+        if ready or not request["future"].done():    # 已完成却不在缓存中说明识别失败，回车后重新请求
+            with _STATS_LOCK:
+                TYPEAHEAD_STATS["hits"] += 1
+                TYPEAHEAD_STATS["ready"] += ready
+            return
+    drop_speculation(request)
+
+
+def set_typeahead(arg: str) -> None:
+    """
+    TYPEAHEAD ON|OFF switches the line editor with speculative extraction
+    (see speculate()); without an argument, shows whether it is on.
+    """
+    
+    global TYPEAHEAD_MODE
+    if arg not in ("", "ON", "OFF"):
+        cprint("Usage: TYPEAHEAD [ON|OFF]", "RED")
+        return
+    if arg == "ON" and get_line_editor() is None:
+        cprint("Error: type-ahead needs prompt_toolkit (pip install prompt_toolkit) and a terminal", "RED")
+        return
+    if arg:
+        TYPEAHEAD_MODE = arg == "ON"
+    cprint(f"Type-ahead: {'on' if TYPEAHEAD_MODE else 'off'}", "CYAN")
 
 
 def do_action(cmd):
@@ -558,11 +3921,21 @@ def do_action(cmd):
     `FINAL` or `SF`: save the final record.
     `OP`: set current OPERATOR.
     `EDIT` or `E`: edit a record.
-    Default: the QSO info text, which needed to be processed.
+    `SHOW`: show the last page of records; `SHOW LAST n`, `SHOW PAGE n`,
+    `SHOW CALL x` and `SHOW ALL` for others.
+    `PENDING`: show QSOs still waiting for the AI.
+    `BATCH` or `B`: paste a block of QSO lines, one per line.
+    `SEEN`: first and last time a station was logged (logbook).
+    `CHECKINS`: check-ins per station over the last N weeks (logbook).
+    `SESSIONS`: all sessions of an operator (logbook).
+    `EXPORT`: export the whole logbook to .csv, .adi or .log.
+    `STATS`: per-stage timings, token use and estimated cost.
+    `TYPEAHEAD`: switch speculative extraction while typing on or off.
+    Default: the QSO info text, which needed to be processed (queued in background).
 
     """
     
-    global OPERATOR, NR_COUNTER
+    global OPERATOR, NR_COUNTER, SESSION_ID
     
     cmd_upper = cmd.strip().upper()
     
@@ -573,7 +3946,8 @@ def do_action(cmd):
     elif cmd_upper in ["LOAD", "L"]:
         load_bkup()
     elif cmd_upper in ["FINAL", "SF"]:
-        filename = input("Enter filename for final record (without extension): ")
+        filename = input("Enter filename for final record (.csv by default; .adi or .log for ADIF or Cabrillo): ")
+        wait_pending()
         save_final(filename)
     elif cmd_upper.startswith("OP "):
         op_call = cmd[3:].strip()
@@ -583,38 +3957,57 @@ def do_action(cmd):
         edit_record(call)
     elif cmd_upper == "QUIT":
         cprint("Quitting...", "RED")
-    elif cmd_upper == "SHOW":
-        show_records()
+        wait_pending()
+    elif cmd_upper == "SHOW" or cmd_upper.startswith("SHOW "):
+        show_records(cmd[4:].strip())
+    elif cmd_upper == "PENDING":
+        show_pending()
+    elif cmd_upper in ["BATCH", "B"]:
+        if not OPERATOR:
+            cprint("Error: Please set operator first using 'OP [call]' command", "RED")
+            return
+        cprint("Paste QSO lines, one per line; finish with an empty line:", "CYAN")
+        line = input().strip()
+        while line:
+            submit_qso(line)
+            line = input().strip()
     elif cmd_upper == "CLEAR":
-        RECORD.clear()
-        NR_COUNTER = 1
+        with RECORD_LOCK:
+            RECORD.clear()
+            PENDING.clear()
+            _RETRY.clear()
+            NR_COUNTER = 1
+            SESSION_ID = ""
+            journal_write("clear")
+            live_export()
         cprint("Records cleared.", "YELLOW")
     elif cmd_upper == "STATUS":
         show_status()
+    elif cmd_upper == "STATS":
+        show_stats()
+    elif cmd_upper == "TYPEAHEAD" or cmd_upper.startswith("TYPEAHEAD "):
+        set_typeahead(cmd_upper[9:].strip())
+    elif cmd_upper.startswith("SEEN "):
+        show_seen(cmd[5:])
+    elif cmd_upper == "CHECKINS" or cmd_upper.startswith("CHECKINS "):
+        weeks = cmd_upper[8:].strip()
+        if weeks and not weeks.isdigit():
+            cprint("Usage: CHECKINS [weeks]", "RED")
+            return
+        show_checkins(int(weeks) if weeks else 4)
+    elif cmd_upper == "SESSIONS" or cmd_upper.startswith("SESSIONS "):
+        show_sessions(cmd[8:].strip() or OPERATOR)
+    elif cmd_upper.startswith("EXPORT "):
+        export_logbook(cmd[7:])
     else:
         # 默认处理为QSO信息
         if not OPERATOR:
             cprint("Error: Please set operator first using 'OP [call]' command", "RED")
             return
             
-        # 调用AI API获取格式化信息
+        # 交给后台线程调用AI API，主控可以继续输入
         try:
-            formatted_json = get_respond(cmd)
-            info_dict = json.loads(formatted_json)
-            
-            # 提取信息并添加到记录
-            info = [
-                info_dict.get("CALL", ""),
-                info_dict.get("RST", ""),
-                info_dict.get("QTH", ""),
-                info_dict.get("RIG", ""),
-                info_dict.get("ANT", ""),
-                info_dict.get("PWR", ""),
-                info_dict.get("ALT", ""),
-                info_dict.get("RMKS", "")
-            ]
-            
-            append_record(info)
+            submit_qso(cmd)
         except Exception as e:
             cprint(f"Error processing QSO: {e}", "RED")
             cprint("Please try again or use 'H' for help.", "YELLOW")
@@ -634,12 +4027,20 @@ def print_help() -> None:
   {Fore.GREEN}HELP{Style.RESET_ALL} or {Fore.GREEN}H{Style.RESET_ALL}     - {Fore.YELLOW}Show this help{Style.RESET_ALL}
   {Fore.GREEN}SAVE{Style.RESET_ALL} or {Fore.GREEN}S{Style.RESET_ALL}     - {Fore.YELLOW}Save backup{Style.RESET_ALL}
   {Fore.GREEN}LOAD{Style.RESET_ALL} or {Fore.GREEN}L{Style.RESET_ALL}     - {Fore.YELLOW}Load from backup{Style.RESET_ALL}
-  {Fore.GREEN}FINAL{Style.RESET_ALL} or {Fore.GREEN}SF{Style.RESET_ALL}   - {Fore.YELLOW}Save final record to CSV{Style.RESET_ALL}
+  {Fore.GREEN}FINAL{Style.RESET_ALL} or {Fore.GREEN}SF{Style.RESET_ALL}   - {Fore.YELLOW}Save final record (.csv, .adi or .log){Style.RESET_ALL}
   {Fore.GREEN}OP [call]{Style.RESET_ALL}     - {Fore.YELLOW}Set current operator call sign{Style.RESET_ALL}
   {Fore.GREEN}EDIT [call]{Style.RESET_ALL}   - {Fore.YELLOW}Edit a record by call sign{Style.RESET_ALL}
-  {Fore.GREEN}SHOW{Style.RESET_ALL}          - {Fore.YELLOW}Show current records{Style.RESET_ALL}
+  {Fore.GREEN}SHOW [x]{Style.RESET_ALL}      - {Fore.YELLOW}Last page of records; LAST n, PAGE n, CALL x or ALL{Style.RESET_ALL}
+  {Fore.GREEN}PENDING{Style.RESET_ALL}       - {Fore.YELLOW}Show QSOs still being processed by AI{Style.RESET_ALL}
+  {Fore.GREEN}BATCH{Style.RESET_ALL} or {Fore.GREEN}B{Style.RESET_ALL}    - {Fore.YELLOW}Paste several QSO lines at once{Style.RESET_ALL}
   {Fore.GREEN}CLEAR{Style.RESET_ALL}         - {Fore.YELLOW}Clear all records{Style.RESET_ALL}
   {Fore.GREEN}STATUS{Style.RESET_ALL}        - {Fore.YELLOW}Show current status{Style.RESET_ALL}
+  {Fore.GREEN}STATS{Style.RESET_ALL}         - {Fore.YELLOW}Stage timings, tokens and cost{Style.RESET_ALL}
+  {Fore.GREEN}TYPEAHEAD [x]{Style.RESET_ALL} - {Fore.YELLOW}ON/OFF: send QSO lines to AI while still typing{Style.RESET_ALL}
+  {Fore.GREEN}SEEN [call]{Style.RESET_ALL}   - {Fore.YELLOW}First/last time a station was logged{Style.RESET_ALL}
+  {Fore.GREEN}CHECKINS [n]{Style.RESET_ALL}  - {Fore.YELLOW}Check-ins per station over the last n weeks{Style.RESET_ALL}
+  {Fore.GREEN}SESSIONS [op]{Style.RESET_ALL} - {Fore.YELLOW}All sessions by an operator{Style.RESET_ALL}
+  {Fore.GREEN}EXPORT [file]{Style.RESET_ALL} - {Fore.YELLOW}Export the whole logbook (.csv, .adi or .log){Style.RESET_ALL}
   {Fore.GREEN}QUIT{Style.RESET_ALL}          - {Fore.YELLOW}Exit program{Style.RESET_ALL}
 
 {Style.BRIGHT}Default:{Style.RESET_ALL}
@@ -653,19 +4054,156 @@ def print_help() -> None:
     print(help_text)
 
 
-def show_records() -> None:
+def text_width(text: str) -> int:
+    """
+    Returns the number of terminal columns `text` takes: East Asian wide and
+    full-width characters (汉字, full-width punctuation) take two, combining
+    marks none.
+    """
+    
+    width = 0
+    for ch in text:
+        if unicodedata.combining(ch):
+            continue
+        width += 2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1
+    return width
+
+
+def fit_width(text: str, width: int) -> str:
+    """
+    Pads `text` with spaces to exactly `width` columns, cutting it and
+    marking the cut with "~" when it is wider.
+    """
+    
+    text = str(text).replace("\n", " ")
+    used = text_width(text)
+    if used <= width:
+        return text + " " * (width - used)
+    kept, used = [], 0
+    for ch in text:
+        w = text_width(ch)
+        if used + w > width - 1:
+            break
+        kept.append(ch)
+        used += w
+    return "".join(kept) + "~" + " " * (width - 1 - used)
+
+
+def show_layout() -> tuple:
+    """
+    Returns the (field, width) columns of SHOW for the current terminal:
+    SHOW_COLUMNS with RMKS widened to use the rest of the line.
+    """
+    
+    columns = shutil.get_terminal_size((120, 24)).columns
+    fixed = sum(width + 1 for field, width in SHOW_COLUMNS if field != "RMKS")
+    return tuple((field, max(width, columns - 1 - fixed) if field == "RMKS" else width)
+                 for field, width in SHOW_COLUMNS)
+
+
+def record_line(record: QSORecord, layout: tuple) -> str:
+    """
+    Returns the SHOW line of a record, formatting it only if it is not in
+    RECORD.rendered for this layout. Callers hold RECORD_LOCK.
+    """
+    
+    cached = RECORD.rendered.get(record.NR)
+    if cached is not None and cached[0] == layout:
+        return cached[1]
+    text = " ".join(fit_width(getattr(record, field), width) for field, width in layout).rstrip()
+    RECORD.rendered[record.NR] = (layout, text)
+    return text
+
+
+def show_records(arg: str = "") -> None:
+    """
+    Parameters
+    ----------
+    arg : str
+        What follows SHOW: "" for the last page, "LAST n", "PAGE n",
+        "CALL x" or "ALL".
+    
+    Returns
+    -------
+    None.
+    
+    The function is called to show records. Only the records shown are
+    formatted, and a record is formatted again only after it changed, so
+    SHOW stays quick on a log of hundreds of QSOs.
+    
+    """
+    
+    words = arg.upper().split()
+    layout = show_layout()
+    with RECORD_LOCK:
+        total = len(RECORD)
+        if not total:
+            cprint("No records yet.", "YELLOW")
+            return
+        pages = (total + SHOW_PAGE_SIZE - 1) // SHOW_PAGE_SIZE
+        if not words or words == ["ALL"] or (len(words) == 2 and words[0] in ("LAST", "PAGE") and words[1].isdigit()):
+            if not words:
+                start, stop = max(0, total - SHOW_PAGE_SIZE), total
+            elif words[0] == "ALL":
+                start, stop = 0, total
+            elif words[0] == "LAST":
+                start, stop = max(0, total - int(words[1])), total
+            else:
+                page = int(words[1])
+                if not 1 <= page <= pages:
+                    cprint(f"Error: No page {page}, there are {pages} page(s) of {SHOW_PAGE_SIZE} records", "RED")
+                    return
+                start, stop = (page - 1) * SHOW_PAGE_SIZE, min(total, page * SHOW_PAGE_SIZE)
+            records = RECORD.rows[start:stop]
+            title = f"Records {start + 1}-{stop} of {total}" if records else f"No records shown ({total} in total)"
+        elif len(words) == 2 and words[0] == "CALL":
+            # 先查呼号索引，没有完全相同的呼号时再按包含查找
+            records = RECORD.find_call(words[1]) or [r for r in RECORD.rows if words[1] in str(r.CALL).upper()]
+            if not records:
+                cprint(f"No records of {words[1]}.", "YELLOW")
+                return
+            start, stop = 0, total
+            title = f"Records of {words[1]}: {len(records)}"
+        else:
+            cprint("Error: Usage: SHOW [LAST n | PAGE n | CALL x | ALL]", "RED")
+            return
+        lines = [record_line(record, layout) for record in records]
+    
+    header = " ".join(fit_width(field, width) for field, width in layout).rstrip()
+    out = [f"\n{Style.BRIGHT}{Fore.CYAN}{title}:{Style.RESET_ALL}",
+           f"{Style.BRIGHT}{Fore.WHITE}{header}{Style.RESET_ALL}",
+           f"{Fore.CYAN}{'-' * sum(width + 1 for field, width in layout)}{Style.RESET_ALL}"]
+    out.extend(f"{Fore.WHITE}{line}{Style.RESET_ALL}" for line in lines)
+    if words[:1] != ["CALL"] and (start > 0 or stop < total):
+        out.append(f"{Fore.YELLOW}{pages} page(s) of {SHOW_PAGE_SIZE}: SHOW PAGE n, SHOW LAST n, SHOW CALL x "
+                   f"or SHOW ALL for the others{Style.RESET_ALL}")
+    print("\n".join(out))
+
+
+def show_pending() -> None:
     """
-    The function is called to show all records.
+    The function is called to show the QSOs still waiting for the AI.
     """
-    if not RECORD:
-        cprint("No records yet.", "YELLOW")
+    with RECORD_LOCK:
+        items = sorted(PENDING.items(), key = lambda x: int(x[0]))
+    
+    if not items:
+        cprint("No pending QSOs.", "GREEN")
         return
     
-    print(f"\n{Style.BRIGHT}{Fore.CYAN}Current Records:{Style.RESET_ALL}")
-    print(f"{Style.BRIGHT}{Fore.WHITE}{'NR':<3} {'DATE':<10} {'UTC':<8} {'CALL':<8} {'RST':<5} {'QTH':<15} {'RIG':<15} {'ANT':<15} {'PWR':<8} {'ALT':<8} {'RMKS':<20}{Style.RESET_ALL}")
-    print(f"{Fore.CYAN}{'-' * 120}{Style.RESET_ALL}")
-    for record in RECORD:
-        print(f"{Fore.WHITE}{record[0]:<3} {record[1]:<10} {record[2]:<8} {record[3]:<8} {record[4]:<5} {record[5]:<15} {record[6]:<15} {record[7]:<15} {record[8]:<8} {record[9]:<8} {record[10]:<20}{Style.RESET_ALL}")
+    now = time.time()
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Pending QSOs:{Style.RESET_ALL}")
+    print(f"{Style.BRIGHT}{Fore.WHITE}{'NR':<5} {'WAIT':<7} {'STATE':<18} {'RAW TEXT'}{Style.RESET_ALL}")
+    for nr, (raw_text, start) in items:
+        wait = f"{now - start:.1f}s"
+        retry = _RETRY.get(nr)
+        if retry is None:
+            state = "queued"
+        elif retry[3] == float("inf"):
+            state = f"retry #{retry[2]} sent"
+        else:
+            state = f"retry #{retry[2]} in {max(0, retry[3] - now):.0f}s"
+        print(f"{Fore.WHITE}{nr:<5} {wait:<7} {state:<18} {raw_text}{Style.RESET_ALL}")
 
 
 def show_status() -> None:
@@ -677,18 +4215,379 @@ def show_status() -> None:
     cprint(f"Current Operator: {OPERATOR}", "CYAN", bright=True)
     cprint(f"Records Count: {len(RECORD)}", "CYAN", bright=True)
     cprint(f"Next NR: {NR_COUNTER}", "CYAN", bright=True)
+    cprint(f"Pending QSOs: {len(PENDING)}", "CYAN", bright=True)
+    if _BREAKER["state"] == "closed":
+        cprint(f"AI: online ({_BREAKER['trips']} outage(s) this session)", "CYAN", bright = True)
+    else:
+        left = max(0.0, BREAKER_COOLDOWN - (time.monotonic() - _BREAKER["opened"]))
+        cprint(f"AI: local-only mode, next trial in {left:.0f}s; {len(_RETRY)} QSO(s) to retry", "YELLOW", bright = True)
+    if any(API_STATS.values()):
+        cprint(f"Resilience: {API_STATS['retries']} retries, {API_STATS['hedged']} hedged "
+               f"({API_STATS['hedge_won']} won), {API_STATS['timeouts']} timeouts, {API_STATS['deferred']} deferred, "
+               f"{API_STATS['recovered']} recovered", "CYAN", bright = True)
+    cprint(f"Cache: {CACHE_STATS['hits']} hits, {CACHE_STATS['misses']} misses, "
+           f"{CACHE_STATS['coalesced']} coalesced", "CYAN", bright=True)
+    
+    if _BATCH_STATE["batches"]:
+        cprint(f"Batches: {_BATCH_STATE['batches']} requests for {_BATCH_STATE['lines']} lines, "
+               f"{_BATCH_STATE['retried']} retried, next size {_BATCH_STATE['size']}", "CYAN", bright=True)
+    
+    if TYPEAHEAD_STATS["requests"]:
+        n = TYPEAHEAD_STATS["requests"]
+        cprint(f"Type-ahead: {n} speculative requests, {TYPEAHEAD_STATS['hits']} used ({TYPEAHEAD_STATS['hits'] / n:.0%}), "
+               f"{TYPEAHEAD_STATS['ready']} answered before Enter; {TYPEAHEAD_STATS['wasted']} wasted "
+               f"({TYPEAHEAD_STATS['stopped']} stopped early)", "CYAN", bright = True)
+    
+    if STREAM_STATS["requests"]:
+        n = STREAM_STATS["requests"]
+        cprint(f"Streaming: first field after {STREAM_STATS['first_field'] / n:.2f}s, "
+               f"complete after {STREAM_STATS['total'] / n:.2f}s (mean of {n})", "CYAN", bright=True)
+    
+    lines = FASTPATH_STATS["full"] + FASTPATH_STATS["partial"] + FASTPATH_STATS["none"]
+    if lines:
+        cprint(f"Fast path: {FASTPATH_STATS['full']}/{lines} lines parsed locally "
+               f"({FASTPATH_STATS['full'] / lines:.0%}), {FASTPATH_STATS['partial']} partly", "CYAN", bright=True)
+    if PROFILE_STATS["known"]:
+        cprint(f"Station profiles: {PROFILE_STATS['known']} lines from known stations, {PROFILE_STATS['prefilled']} fields "
+               f"pre-filled, {PROFILE_STATS['places']} QTHs resolved locally", "CYAN", bright = True)
+    if GAZETTEER_STATS["resolved"] or GAZETTEER_STATS["corrected"]:
+        cprint(f"Gazetteer: {GAZETTEER_STATS['resolved']} QTHs resolved locally, "
+               f"{GAZETTEER_STATS['corrected']} AI answers normalized", "CYAN", bright = True)
+    if EDIT_STATS["local"] or EDIT_STATS["model"]:
+        cprint(f"Edits: {EDIT_STATS['local']} applied locally, {EDIT_STATS['model']} sent to AI", "CYAN", bright = True)
+    if FASTPATH_STATS["compared"]:
+        cprint(f"Fast path vs AI: {FASTPATH_STATS['agreed']}/{FASTPATH_STATS['compared']} fields agree", "CYAN", bright=True)
+        for field, local_value, ai_value in FASTPATH_MISMATCHES[-5:]:
+            cprint(f"  {field}: local {local_value} / AI {ai_value}", "YELLOW")
+    
+
+
+def percentile(values, pct: float) -> float:
+    """
+    Nearest-rank percentile of a sorted list of numbers (0 for an empty list).
+    """
+    
+    if not values:
+        return 0.0
+    return values[max(0, min(len(values) - 1, int(round(pct / 100 * len(values))) - 1))]
+
+
+def token_cost(stats: dict) -> float:
+    """
+    Estimated cost of the tokens in one TOKEN_STATS entry, from TOKEN_PRICES.
+    """
+    
+    uncached = stats["prompt"] - stats["cached"]
+    return (uncached * TOKEN_PRICES["prompt"] + stats["cached"] * TOKEN_PRICES["cached"]
+            + stats["completion"] * TOKEN_PRICES["completion"]) / 1e6
+
+
+def stats_summary() -> dict:
+    """
+    Returns the per-stage latency percentiles (milliseconds) and the token
+    use and estimated cost of the session.
+    """
+    
+    with _STATS_LOCK:
+        samples = {stage: sorted(times) for stage, times in STAGE_TIMES.items()}
+        tokens = {kind: dict(stats) for kind, stats in TOKEN_STATS.items()}
+        typeahead = dict(TYPEAHEAD_STATS)
+    
+    stages = {}
+    for stage in STATS_STAGES + sorted(set(samples) - set(STATS_STAGES)):
+        ms = [t * 1000 for t in samples.get(stage, [])]
+        if ms:
+            stages[stage] = {"n": len(ms), "mean": sum(ms) / len(ms), "p50": percentile(ms, 50),
+                             "p95": percentile(ms, 95), "p99": percentile(ms, 99)}
+    for stats in tokens.values():
+        stats["cost"] = token_cost(stats)
+    with RECORD_LOCK:
+        qsos = len(RECORD)
+    backends = {}
+    with _ROUTE_LOCK:
+        for backend in (_BACKENDS or {"backends": {}})["backends"].values():
+            backends[backend.name] = {"model": backend.model, "requests": backend.requests, "errors": backend.errors,
+                                      "latency_ms": None if backend.latency is None else backend.latency * 1000,
+                                      "error_rate": backend.error_rate}
+    return {"qsos": qsos, "stages": stages, "tokens": tokens, "backends": backends, "typeahead": typeahead,
+            "cost": sum(stats["cost"] for stats in tokens.values())}
+
+
+def show_stats() -> None:
+    """
+    
+    The function is called to show per-stage timings and token use.
+    
+    """
+    
+    summary = stats_summary()
+    if not summary["stages"]:
+        cprint("No timings yet.", "YELLOW")
+        return
+    
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Stage timings (ms):{Style.RESET_ALL}")
+    print(f"{Style.BRIGHT}{Fore.WHITE}{'STAGE':<12} {'N':>6} {'P50':>9} {'P95':>9} {'P99':>9}{Style.RESET_ALL}")
+    for stage, m in summary["stages"].items():
+        print(f"{Fore.WHITE}{stage:<12} {m['n']:>6} {m['p50']:>9.2f} {m['p95']:>9.2f} {m['p99']:>9.2f}{Style.RESET_ALL}")
+    
+    if len(summary["backends"]) > 1:
+        routes = {kind: [b.name for b in route(kind)] for kind in ("qso", "edit")}
+        print(f"\n{Style.BRIGHT}{Fore.CYAN}Backends:{Style.RESET_ALL}")
+        print(f"{Style.BRIGHT}{Fore.WHITE}{'NAME':<12} {'MODEL':<20} {'USED FOR':<9} {'REQ':>6} {'ERR':>5} "
+              f"{'AVG MS':>9} {'ERR RATE':>9}{Style.RESET_ALL}")
+        for name, b in summary["backends"].items():
+            used = "/".join(kind for kind in ("qso", "edit") if name in routes[kind])
+            latency = "-" if b["latency_ms"] is None else f"{b['latency_ms']:.0f}"
+            print(f"{Fore.WHITE}{name:<12} {b['model']:<20} {used:<9} {b['requests']:>6} {b['errors']:>5} "
+                  f"{latency:>9} {b['error_rate']:>9.0%}{Style.RESET_ALL}")
+    
+    for kind, name in (("qso", "QSO extraction"), ("edit", "Edits")):
+        stats = summary["tokens"][kind]
+        if stats["requests"]:
+            cprint(f"{name}: {stats['requests']} requests, {stats['prompt']} prompt tokens ({stats['cached']} cached, "
+                   f"{stats['cached'] / max(stats['prompt'], 1):.0%}), "
+                   f"{stats['completion']} completion tokens, about {stats['cost']:.4f} CNY", "CYAN")
+    typeahead, qso = summary["typeahead"], summary["tokens"]["qso"]
+    if typeahead["wasted"] and qso["requests"]:
+        # 中途取消的请求不一定报告用量，按QSO请求的平均费用估算
+        cprint(f"Type-ahead: {typeahead['hits']}/{typeahead['requests']} speculative requests used, "
+               f"{typeahead['wasted']} wasted, about {qso['cost'] / qso['requests'] * typeahead['wasted']:.4f} CNY",
+               "CYAN")
+    if summary["qsos"]:
+        cprint(f"Estimated cost: {summary['cost']:.4f} CNY for {summary['qsos']} QSOs "
+               f"({summary['cost'] / summary['qsos']:.5f} per QSO)", "CYAN", bright = True)
+
+
+def dump_stats(filename: str) -> None:
+    """
+    Writes the STATS summary and the raw samples (milliseconds) to `filename`.
+    """
+    
+    with _STATS_LOCK:
+        samples = {stage: [round(t * 1000, 3) for t in times] for stage, times in STAGE_TIMES.items()}
+    with open(filename, 'w', encoding = 'utf-8') as f:
+        json.dump({"OPERATOR": OPERATOR, "CITY": CITY, "MODELS": {kind: [b.model for b in route(kind)] for kind in ("qso", "edit")},
+                   "summary": stats_summary(),
+                   "samples_ms": samples}, f, ensure_ascii = False, indent = 2)
+
+
+def read_transcript(source: str) -> List[str]:
+    """
+    Returns the QSO lines of a notes file ('-' reads stdin), without blank
+    lines and lines starting with '#'.
+    """
+    
+    if source == "-":
+        text = sys.stdin.read()
+    else:
+        with open(source, 'r', encoding = 'utf-8-sig') as f:
+            text = f.read()
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+
+
+def transcript_time(line: str, date: datetime.date, utc_offset: float):
+    """
+    Returns (raw text, UTC datetime or None) of one transcript line. A
+    leading HH:MM or HH:MM:SS is the time of the QSO on `date`, in local time
+    UTC+`utc_offset`.
+    """
     
+    match = TRANSCRIPT_TIME.fullmatch(line)
+    if match is None or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        return line, None
+    local = datetime.datetime.combine(date, datetime.time(int(match.group(1)), int(match.group(2)),
+                                                          int(match.group(3) or 0)))
+    return match.group(4), local - datetime.timedelta(hours = utc_offset)
+
+
+def write_log(records: List[dict], output: str, stdout = None) -> str:
+    """
+    Writes the finished records to `output`: CSV to `stdout` (default
+    sys.stdout) for '-', a JSON array for .json, otherwise the format of its
+    extension (see EXPORTERS). Returns the name written.
+    """
+    
+    if output == "-":
+        (stdout or sys.stdout).write("".join(export_stream(records, "stdout.csv")).lstrip("\ufeff"))
+        return "stdout"
+    if output.lower().endswith(".json"):
+        with open(output, 'w', encoding = 'utf-8') as f:
+            json.dump(records, f, ensure_ascii = False, indent = 2)
+        return output
+    path = export_path(output)
+    with open(path, 'w', encoding = 'utf-8', newline = '') as f:
+        for chunk in export_stream(records, path):
+            f.write(chunk)
+    return path
+
+
+def process_transcript(argv: List[str]) -> int:
+    """
+    Parameters
+    ----------
+    argv : list
+        Command line arguments, see --help.
+    
+    Returns
+    -------
+    status : int
+        Exit status: 0 when every QSO was extracted, 1 when some only have
+        their local fields (AI unavailable; run again to retry them). An
+        interrupted run exits at once with 130.
+    
+    The function turns a notes file (or stdin) with one raw QSO per line
+    into a finished log without the interactive prompt. The lines go through
+    the same path as typed QSOs (fast path, cache, batched requests with at
+    most --concurrency in flight), so the log keeps the order of the file.
+    Progress is kept in a journal next to the output; after an interruption
+    the same command resumes where it stopped.
+    
+    """
+    
+    global OPERATOR, MAX_CONCURRENT_REQUESTS, JOURNAL_FILE, JOURNAL_SNAPSHOT, _BATCH_SLOTS, _WARNINGS
+    
+    parser = argparse.ArgumentParser(
+        prog = "AI Logger Assistant.py",
+        description = "Turn a notes file with one raw QSO per line into a finished log (no interactive prompt).")
+    parser.add_argument("input", help = "notes file, '-' for stdin; a line may start with the time, HH:MM")
+    parser.add_argument("-o", "--output", default = "",
+                        help = "log file: .csv (default), .json, .adi or .log; '-' writes CSV to stdout")
+    parser.add_argument("--op", default = "", help = "operator callsign")
+    parser.add_argument("--date", default = "", help = "date of the net for the times in the file, YYYY-MM-DD "
+                                                       "(default: today, UTC)")
+    parser.add_argument("--utc-offset", type = float, default = 0.0,
+                        help = "time zone of the times in the file, e.g. 8 for Beijing time")
+    parser.add_argument("--concurrency", type = int, default = MAX_CONCURRENT_REQUESTS,
+                        help = "API requests in flight at the same time")
+    parser.add_argument("--restart", action = "store_true", help = "ignore the progress of an interrupted run")
+    args = parser.parse_args(argv)
+    
+    try:
+        lines = read_transcript(args.input)
+        date = (datetime.datetime.strptime(args.date, "%Y-%m-%d").date() if args.date
+                else datetime.datetime.utcnow().date())
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        cprint(f"Error: {e}", "RED")
+        return 2
+    output = args.output or (os.path.splitext(args.input)[0] + ".csv" if args.input != "-" else "-")
+    base = output if output != "-" else (args.input if args.input != "-" else "stdin")
+    
+    # 必须在第一次请求之前设置
+    MAX_CONCURRENT_REQUESTS = max(1, args.concurrency)
+    _BATCH_SLOTS = threading.Semaphore(MAX_CONCURRENT_REQUESTS)
+    JOURNAL_FILE = base + ".progress.jsonl"
+    JOURNAL_SNAPSHOT = base + ".progress.json"
+    _WARNINGS = []
+    
+    # 输出写到stdout时，过程信息改写到stderr
+    stdout = sys.stdout
+    chatter = contextlib.redirect_stdout(sys.stderr) if output == "-" else contextlib.nullcontext()
+    with chatter:
+        if args.restart:
+            for name in (JOURNAL_FILE, JOURNAL_SNAPSHOT):
+                if os.path.exists(name):
+                    os.remove(name)
+        try:
+            state = read_journal()
+        except Exception as e:
+            cprint(f"Error reading {JOURNAL_FILE}, starting over: {e}", "YELLOW")
+            state = None
+        done = finished = 0    # 已有记录的行数 / 其中已识别完的
+        hashes = [hashlib.sha1(line.encode('utf-8')).hexdigest()[:16] for line in lines]
+        if state is not None and state["LINES"][:len(state["RECORD"])] == hashes[:len(state["RECORD"])]:
+            done = len(state["RECORD"])
+            finished = done - len(state["PENDING"])
+            with contextlib.redirect_stdout(io.StringIO()):
+                restore_state(state)
+            cprint(f"Resuming: {finished} of {len(lines)} QSOs already done", "CYAN")
+        elif state is not None:
+            # 续跑时按行核对：之前的行被改动、插入或删除时，跳过的就不再是已处理的那些行
+            changed = next((i for i, (old, new) in enumerate(zip(state["LINES"], hashes)) if old != new),
+                           min(len(state["LINES"]), len(hashes)))
+            cprint(f"{JOURNAL_FILE} does not match {args.input} (line {changed + 1} differs from the last run); "
+                   f"use --restart to start over", "RED")
+            return 2
+        
+        with RECORD_LOCK:
+            if args.op and args.op.upper() != OPERATOR:
+                OPERATOR = args.op.upper()
+                journal_write("op", call = OPERATOR)
+        
+        start = time.perf_counter()
+        total = len(lines)
+        try:
+            # 每条记录的提示先收起来，最后统一列出；屏幕上只显示进度
+            with contextlib.redirect_stdout(io.StringIO()):
+                # 没写时间的行沿用上一行的时间
+                last = None
+                for i, line in enumerate(lines):
+                    raw_text, when = transcript_time(line, date, args.utc_offset)
+                    last = when or last
+                    if i >= done:
+                        with RECORD_LOCK:
+                            SOURCE_LINES.append(hashes[i])
+                            journal_write("line", sha = hashes[i])
+                        submit_qso(raw_text, last)
+                shown = None
+                while True:
+                    with RECORD_LOCK:
+                        waiting = len(PENDING) - sum(1 for item in _RETRY.values() if item[3] != float("inf"))
+                    if waiting != shown:
+                        elapsed = time.perf_counter() - start
+                        print(f"\r{total - waiting}/{total} QSOs  {elapsed:6.1f}s", end = "", file = sys.stderr, flush = True)
+                        shown = waiting
+                    if waiting <= 0:
+                        break
+                    time.sleep(0.2)
+            print(file = sys.stderr)
+        except KeyboardInterrupt:
+            # 已完成的记录都已写入日志；正在进行的请求直接放弃，续跑时重新排队
+            with RECORD_LOCK:
+                print(file = sys.stderr)
+                cprint(f"Interrupted; run the same command again to resume ({JOURNAL_FILE}).", "YELLOW")
+                sys.stdout.flush()
+                os._exit(130)
+        
+        for nr, note in sorted(_WARNINGS):
+            cprint(f"#{nr} {note}", "YELLOW")
+        try:
+            written = write_log(finished_records(), output, stdout)
+        except OSError as e:
+            cprint(f"Error writing {output}: {e}", "RED")
+            return 2
+        rate = (total - finished) / max(time.perf_counter() - start, 1e-9)
+        cprint(f"{total} QSOs written to {written} ({rate:.1f} QSO/s)", "GREEN")
+        
+        if _RETRY:
+            cprint(f"{len(_RETRY)} QSO(s) only have the locally parsed fields (AI unavailable); "
+                   f"run the same command again to retry them.", "YELLOW")
+            return 1
+        if _JOURNAL is not None:
+            _JOURNAL.close()
+        for name in (JOURNAL_FILE, JOURNAL_SNAPSHOT):
+            if os.path.exists(name):
+                os.remove(name)
+    return 0
+
 
 if __name__ == "__main__":
     
+    if len(sys.argv) > 1:
+        # 带参数运行时为无人值守模式，处理笔记文件后退出
+        sys.exit(process_transcript(sys.argv[1:]))
+    
+    start_warm_up()
     cprint("Radio Roll-call AI Logger Assistant", "GREEN", bright=True)
     cprint("Type 'H' or 'HELP' for help", "YELLOW", bright=True)
+    recover_session()
     
     cmd = get_input()
     
-    while cmd.upper() != "QUIT":
+    while cmd.strip().upper() != "QUIT":
         do_action(cmd)
         
         cmd = get_input()
     
+    # 退出前等待排队和批量请求中的QSO处理完毕
+    do_action("QUIT")
     cprint("Program ended.", "RED", bright=True)
\ No newline at end of file
@@ -0,0 +1,601 @@
+# -*- coding: utf-8 -*-
+"""
+Statistics over the archived logs of many roll-call sessions
+
+Reads final CSV files (FINAL / SF, or a whole logbook written with EXPORT)
+and backup_*.json files into columns: one NumPy array per field, with
+CALL, QTH, RIG, ANT and OP stored as integer codes into a sorted array of
+their distinct values, and PWR (watts), ALT (metres) and RST
+(readability * 10 + strength) as numbers, NaN when unknown. The reports are
+computed on these arrays with vectorized NumPy operations.
+
+The parsed columns are cached in CACHE_FILE together with the size and
+modification time of each file read, so a later run over the same files
+only reads the ones that changed.
+
+Usage:
+    python analytics.py                                  (files in this folder)
+    python analytics.py logs/ --report nets,rigs --top 15
+    python analytics.py logs/ archive.csv --since 2025-01-01 --op BG5CVB
+
+Needs NumPy (pip install numpy).
+
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from colorama import init, Fore, Style
+    init()
+except ImportError:
+    class Fore:
+        RED = GREEN = YELLOW = CYAN = WHITE = ''
+
+    class Style:
+        BRIGHT = RESET_ALL = ''
+
+RECORD_FIELDS = ('NR', 'DATE', 'UTC', 'CALL', 'RST', 'QTH', 'RIG', 'ANT', 'PWR', 'ALT', 'RMKS', 'OP')   # 与AI Logger Assistant.py相同
+CODED_FIELDS = ("CALL", "QTH", "RIG", "ANT", "OP")   # 按取值编码的字段
+UPPER_FIELDS = ("CALL", "RIG", "ANT", "OP")          # 编码前转为大写，"uv-k5"与"UV-K5"算同一种
+MISSING = {"", "NULL", "NONE", "N/A", "-", "..."}    # 视为未知的写法（"..."为尚在处理中的占位）
+CACHE_FILE = "analytics_cache.npz"
+CACHE_VERSION = 1              # 修改解析或换算方法后加1，旧的缓存就不再使用
+FLOOR_HEIGHT = 3.0             # ALT记为楼层时，每层按这么多米换算
+POWER_BINS = [0, 1, 5, 10, 25, 50, 100, float("inf")]   # 功率分布的分组（瓦）
+HEIGHT_BINS = [0, 10, 30, 60, 100, float("inf")]         # 高度分布的分组（米）
+PAIR_TABLE_LIMIT = 1 << 26     # 统计不同组合（如每场的呼号）时，组合数不超过这么多就用查表代替排序
+POWER_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(千瓦|毫瓦|瓦|KW|MW|W)?")
+POWER_UNITS = {None: 1.0, "W": 1.0, "瓦": 1.0, "KW": 1000.0, "千瓦": 1000.0, "MW": 0.001, "毫瓦": 0.001}
+HEIGHT_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(楼|层|米|F|L|M)?")
+GROUND_WORDS = ("地面", "GND", "GROUND")
+
+
+def power_watts(text: str) -> float:
+    """
+    PWR in watts: "5W", "5 瓦", "500mW", "1.5KW" or a bare number (watts);
+    the first number of a range such as "5-10W". NaN when there is none.
+    """
+
+    match = POWER_PATTERN.search(text.upper())
+    if match is None:
+        return float("nan")
+    return float(match.group(1)) * POWER_UNITS[match.group(2)]
+
+
+def height_metres(text: str) -> float:
+    """
+    ALT in metres: "20米", "20m" or a bare number; floors ("30楼", "12F")
+    times FLOOR_HEIGHT; 0 for ground level. NaN when there is no number.
+    """
+
+    text = text.upper()
+    if any(word in text for word in GROUND_WORDS):
+        return 0.0
+    match = HEIGHT_PATTERN.search(text)
+    if match is None:
+        return float("nan")
+    value = float(match.group(1))
+    return value * FLOOR_HEIGHT if match.group(2) in ("楼", "层", "F", "L") else value
+
+
+def rst_number(text: str) -> float:
+    """
+    RST as readability * 10 + strength ("59", "599" and "5/9" give 59);
+    NaN when it is not a valid report.
+    """
+
+    digits = re.sub(r"\D", "", text)
+    if len(digits) < 2 or not ("1" <= digits[0] <= "5" and "1" <= digits[1] <= "9"):
+        return float("nan")
+    return float(digits[:2])
+
+
+def utc_minute(text: str) -> int:
+    """
+    Minutes after midnight of a UTC time "HH:MM[:SS]" or "HHMM"; -1 if not a time.
+    """
+
+    match = re.fullmatch(r"(\d{1,2}):?(\d{2})(?::\d{2})?", text.strip())
+    if match is None or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        return -1
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+def qso_date(text: str):
+    """DATE "YYYY-MM-DD" as datetime64[D]; NaT if not a date."""
+    try:
+        return np.datetime64(datetime.date.fromisoformat(text.strip()), "D")
+    except ValueError:
+        return np.datetime64("NaT", "D")
+
+
+def coded_value(field: str):
+    """
+    Returns the function that cleans a value of `field` before it is coded.
+    """
+
+    def clean(text: str) -> str:
+        text = " ".join(text.split())
+        if text.upper() in MISSING:
+            return ""
+        return text.upper() if field in UPPER_FIELDS else text
+    return clean
+
+
+def per_value(strings, convert, dtype):
+    """
+    Applies `convert` once per distinct value of `strings` and spreads the
+    results back to every row (a log repeats the same few values a lot).
+    """
+
+    distinct, inverse = np.unique(strings, return_inverse = True)
+    return np.array([convert(str(v)) for v in distinct], dtype = dtype)[inverse.reshape(-1)]
+
+
+class LogColumns:
+    """
+    QSOs of many files as parallel arrays, one row per QSO, the rows of each
+    file together and in file order.
+
+    `columns` holds the arrays: source (index into `sources`), nr, date
+    (datetime64[D]), minute (UTC, -1 unknown), rst, pwr and alt (float32,
+    NaN unknown), and for each of CODED_FIELDS the code of the value in
+    `vocab[field]`, a sorted array of the distinct values ("" = unknown).
+    `sources` is a list of [path, size, mtime_ns] of the files read.
+    """
+
+    def __init__(self, columns: dict, vocab: dict, sources: list):
+        self.columns = columns
+        self.vocab = vocab
+        self.sources = sources
+
+    def __len__(self):
+        return len(self.columns["source"])
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    def values(self, field: str):
+        """The values of a coded field, one per row."""
+        return self.vocab[field][self.columns[field]]
+
+    def code(self, field: str, value: str) -> int:
+        """The code of `value` in a coded field, -1 if it never occurs."""
+        index = int(np.searchsorted(self.vocab[field], value))
+        return index if index < len(self.vocab[field]) and self.vocab[field][index] == value else -1
+
+    @classmethod
+    def from_rows(cls, rows: list, source: list, sources: list) -> "LogColumns":
+        """
+        Builds the columns of `rows` (lists of strings in RECORD_FIELDS
+        order), row i coming from sources[source[i]].
+        """
+
+        def text(field):
+            index = RECORD_FIELDS.index(field)
+            return np.array([row[index] for row in rows], dtype = str)
+
+        columns = {
+            "source": np.array(source, dtype = np.int32),
+            "nr": per_value(text("NR"), lambda v: int(v) if v.strip().isdigit() else 0, np.int32),
+            "date": per_value(text("DATE"), qso_date, "datetime64[D]"),
+            "minute": per_value(text("UTC"), utc_minute, np.int16),
+            "rst": per_value(text("RST"), rst_number, np.float32),
+            "pwr": per_value(text("PWR"), power_watts, np.float32),
+            "alt": per_value(text("ALT"), height_metres, np.float32),
+        }
+        vocab = {}
+        for field in CODED_FIELDS:
+            cleaned = per_value(text(field), coded_value(field), str)
+            vocab[field], codes = np.unique(cleaned, return_inverse = True)
+            columns[field] = codes.reshape(-1).astype(np.int32)
+        return cls(columns, vocab, sources)
+
+    @classmethod
+    def concat(cls, parts: list) -> "LogColumns":
+        """
+        Joins several LogColumns into one, re-coding the coded fields over
+        the union of their values.
+        """
+
+        columns, vocab, sources = {}, {}, []
+        offsets = np.cumsum([0] + [len(part.sources) for part in parts])
+        columns["source"] = np.concatenate([part["source"] + offset for part, offset in zip(parts, offsets)])
+        for name in ("nr", "date", "minute", "rst", "pwr", "alt"):
+            columns[name] = np.concatenate([part[name] for part in parts])
+        for field in CODED_FIELDS:
+            vocab[field], codes = np.unique(np.concatenate([part.values(field) for part in parts]),
+                                            return_inverse = True)
+            columns[field] = codes.reshape(-1).astype(np.int32)
+        for part in parts:
+            sources.extend(part.sources)
+        return cls(columns, vocab, sources)
+
+    def take(self, rows) -> "LogColumns":
+        """
+        The selected rows (boolean mask or indices), with the same vocab and
+        sources.
+        """
+
+        return LogColumns({name: array[rows] for name, array in self.columns.items()}, self.vocab, self.sources)
+
+    def keep_sources(self, keep: list) -> "LogColumns":
+        """
+        The rows of the sources whose indexes are in `keep`, with the
+        sources renumbered in that order.
+        """
+
+        renumber = np.full(len(self.sources), -1, dtype = np.int32)
+        renumber[keep] = np.arange(len(keep), dtype = np.int32)
+        part = self.take(renumber[self["source"]] >= 0)
+        part.columns["source"] = renumber[part["source"]]
+        part.sources = [self.sources[i] for i in keep]
+        return part
+
+    def save(self, path: str) -> None:
+        arrays = {f"col_{name}": array for name, array in self.columns.items()}
+        arrays.update({f"vocab_{field}": values for field, values in self.vocab.items()})
+        tmp_name = path + ".tmp"
+        with open(tmp_name, "wb") as f:
+            np.savez(f, version = CACHE_VERSION, sources = np.array(json.dumps(self.sources)), **arrays)
+        os.replace(tmp_name, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LogColumns":
+        with np.load(path, allow_pickle = False) as data:
+            if int(data["version"]) != CACHE_VERSION:
+                raise ValueError(f"cache version {int(data['version'])}")
+            columns = {key[4:]: data[key] for key in data.files if key.startswith("col_")}
+            vocab = {key[6:]: data[key] for key in data.files if key.startswith("vocab_")}
+            return cls(columns, vocab, json.loads(str(data["sources"])))
+
+
+def find_sources(paths: list) -> list:
+    """
+    Returns [path, size, mtime_ns] of the files to read: the files named, and
+    the *.csv and backup_*.json files under the folders named.
+    """
+
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                found.extend(os.path.join(folder, name) for name in names
+                             if name.lower().endswith(".csv") or (name.startswith("backup_") and name.endswith(".json")))
+        elif os.path.exists(path):
+            found.append(path)
+        else:
+            print(f"{Fore.YELLOW}Not found: {path}{Style.RESET_ALL}")
+    sources = []
+    for path in sorted(set(os.path.abspath(p) for p in found)):
+        stat = os.stat(path)
+        sources.append([path, stat.st_size, stat.st_mtime_ns])
+    return sources
+
+
+def read_source(path: str) -> list:
+    """
+    Returns the QSO rows (lists of strings in RECORD_FIELDS order) of a final
+    CSV or backup JSON file, without placeholders of QSOs still pending;
+    [] for other files (station profiles, CSVs of other programs, ...).
+    """
+
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding = "utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get("RECORD"), list):
+            return []
+        # 早期的备份没有OP一列
+        rows = [[str(v) for v in row] + [""] * (len(RECORD_FIELDS) - len(row))
+                for row in data["RECORD"] if isinstance(row, list)]
+    else:
+        with open(path, "r", newline = "", encoding = "utf-8-sig") as f:
+            reader = csv.reader(f)
+            if tuple(next(reader, ())) != RECORD_FIELDS:
+                return []
+            rows = [row for row in reader if len(row) >= len(RECORD_FIELDS)]
+    call = RECORD_FIELDS.index("CALL")
+    return [row[:len(RECORD_FIELDS)] for row in rows if row[call].strip().upper() not in MISSING]
+
+
+def load_columns(paths: list, cache_file: str = CACHE_FILE) -> LogColumns:
+    """
+    Returns the columns of all files under `paths`, reading only the files
+    that are new or changed since the cache was written (cache_file "" for
+    no cache), and updates the cache.
+    """
+
+    begin = time.perf_counter()
+    sources = find_sources(paths)
+    cached = None
+    if cache_file and os.path.exists(cache_file):
+        try:
+            cached = LogColumns.load(cache_file)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"{Fore.YELLOW}Ignoring {cache_file}: {e}{Style.RESET_ALL}")
+
+    parts, reused = [], {}
+    if cached is not None:
+        index = {tuple(source): i for i, source in enumerate(cached.sources)}
+        reused = {i: index[tuple(source)] for i, source in enumerate(sources) if tuple(source) in index}
+        if reused:
+            parts.append(cached.keep_sources(list(reused.values())))
+
+    rows, source, read = [], [], []
+    for i, source_info in enumerate(sources):
+        if i in reused:
+            continue
+        try:
+            found = read_source(source_info[0])
+        except (OSError, UnicodeDecodeError, csv.Error, ValueError) as e:
+            print(f"{Fore.YELLOW}Skipped {source_info[0]}: {e}{Style.RESET_ALL}")
+            found = []
+        # 读不出记录的文件也记下来，下次不必再读
+        rows.extend(found)
+        source.extend([len(read)] * len(found))
+        read.append(source_info)
+    if read:
+        parts.append(LogColumns.from_rows(rows, source, read))
+
+    if not parts:
+        table = LogColumns.from_rows([], [], [])
+    elif len(parts) == 1:
+        table = parts[0]
+    else:
+        table = LogColumns.concat(parts)
+    if cache_file and (read or cached is None or len(reused) != len(cached.sources)):
+        try:
+            table.save(cache_file)
+        except OSError as e:
+            print(f"{Fore.RED}Error saving {cache_file}: {e}{Style.RESET_ALL}")
+    print(f"{len(sources)} files ({len(read)} read, {len(reused)} cached), {len(table)} QSOs "
+          f"in {(time.perf_counter() - begin) * 1000:.0f} ms")
+    return table
+
+
+def mark_sessions(table: LogColumns) -> LogColumns:
+    """
+    Adds the "session" column and drops the sessions found in more than one
+    file (the backups and the final CSV of the same net), keeping the copy
+    with the most QSOs; then adds "first", true on the first QSO of each
+    callsign in the remaining rows.
+
+    A session starts with each file and wherever NR does not increase, so a
+    whole logbook written with EXPORT splits into its sessions. Two sessions
+    are the same net when their first QSOs have the same date, UTC and CALL.
+    """
+
+    n = len(table)
+    start = np.ones(n, dtype = bool)
+    start[1:] = (table["source"][1:] != table["source"][:-1]) | (table["nr"][1:] <= table["nr"][:-1])
+    session = np.cumsum(start) - 1
+    first_rows = np.flatnonzero(start)
+    sizes = np.diff(np.append(first_rows, n))
+    keys = [table["date"][first_rows].astype(np.int64), table["minute"][first_rows], table["CALL"][first_rows]]
+
+    # 相同的场次排在一起，QSO最多的一份在前
+    order = np.lexsort([-sizes] + keys[::-1])
+    same = np.ones(max(0, len(order) - 1), dtype = bool)
+    for key in keys:
+        same &= key[order][1:] == key[order][:-1]
+    keep = np.ones(len(first_rows), dtype = bool)
+    keep[order[1:][same]] = False
+    table = LogColumns(dict(table.columns, session = session), table.vocab, table.sources).take(keep[session])
+
+    # 按日期、时间排序后，每个呼号第一次出现的那一行；日期不明的排在最后
+    days = table["date"].astype(np.int64)
+    days[np.isnat(table["date"])] = np.iinfo(np.int64).max
+    order = np.lexsort((table["nr"], table["minute"], days))
+    first = np.zeros(len(table), dtype = bool)
+    first[order[np.unique(table["CALL"][order], return_index = True)[1]]] = True
+    table.columns["first"] = first
+    return table
+
+
+def share(count: int, total: int) -> str:
+    return f"{count / total * 100:5.1f}%" if total else "    -"
+
+
+def pair_counts(a, b, size: int):
+    """
+    For each value of `a` (0 .. size-1), the number of distinct values of
+    `b` seen with it; e.g. the distinct stations of each month.
+    """
+
+    width = int(b.max()) + 1 if len(b) else 1
+    pairs = a.astype(np.int64) * width + b
+    if size * width <= PAIR_TABLE_LIMIT:
+        # 组合不多时用一张是否出现过的表，比排序去重快
+        seen = np.zeros(size * width, dtype = bool)
+        seen[pairs] = True
+        return seen.reshape(size, width).sum(axis = 1)
+    return np.bincount(np.unique(pairs) // width, minlength = size)
+
+
+def net_starts(table: LogColumns):
+    """
+    Returns (session number 0 .. nets-1 of each row, first row of each net);
+    the rows of a net are always together.
+    """
+
+    session = np.unique(table["session"], return_inverse = True)[1].reshape(-1)
+    return session, np.flatnonzero(np.diff(session, prepend = -1))
+
+
+def report_nets(table: LogColumns, top: int) -> None:
+    """Check-ins per net, overall and for the latest `top` months."""
+
+    session, starts = net_starts(table)
+    counts = np.bincount(session)
+    busiest = starts[counts.argmax()]
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Nets{Style.RESET_ALL}")
+    print(f"{len(starts)} nets, {len(table)} QSOs, {len(table.vocab['CALL'][np.unique(table['CALL'])])} stations; "
+          f"check-ins per net: mean {counts.mean():.1f}, median {np.median(counts):.0f}, "
+          f"max {counts.max()} ({table['date'][busiest]} {table.vocab['OP'][table['OP'][busiest]] or '?'})")
+
+    # 日期不明的行排在所有月份之后（下标为len(months)），不计入各月
+    row_month = table["date"].astype("datetime64[M]")
+    months = np.unique(row_month[~np.isnat(row_month)])
+    month = np.searchsorted(months, row_month)
+    size = len(months) + 1
+    nets = np.bincount(month[starts], minlength = size)
+    qsos = np.bincount(month, minlength = size)
+    stations = pair_counts(month, table["CALL"], size)
+    new = np.bincount(month[table["first"]], minlength = size)
+    print(f"{Style.BRIGHT}{Fore.WHITE}{'MONTH':<8} {'NETS':>5} {'QSOS':>6} {'PER NET':>8} {'STATIONS':>9} {'NEW':>5}{Style.RESET_ALL}")
+    for i in range(max(0, len(months) - top), len(months)):
+        print(f"{Fore.WHITE}{str(months[i]):<8} {nets[i]:>5} {qsos[i]:>6} {qsos[i] / nets[i] if nets[i] else 0:>8.1f} "
+              f"{stations[i]:>9} {new[i]:>5}{Style.RESET_ALL}")
+
+
+def report_stations(table: LogColumns, top: int) -> None:
+    """New stations and the `top` stations that joined the most nets."""
+
+    session, starts = net_starts(table)
+    calls = len(table.vocab["CALL"])
+    nets = pair_counts(table["CALL"], session, calls)
+    qsos = np.bincount(table["CALL"], minlength = calls)
+    days = table["date"].astype(np.int64)
+    dated = ~np.isnat(table["date"])
+    first_day = np.full(calls, np.iinfo(np.int64).max)
+    last_day = np.full(calls, np.iinfo(np.int64).min)
+    np.minimum.at(first_day, table["CALL"][dated], days[dated])
+    np.maximum.at(last_day, table["CALL"][dated], days[dated])
+
+    seen = np.flatnonzero(qsos)
+    regulars = seen[np.lexsort((-qsos[seen], -nets[seen]))][:top]
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Stations{Style.RESET_ALL}")
+    print(f"{len(seen)} stations, {int(table['first'].sum())} new in these nets, "
+          f"{int((nets[seen] == 1).sum())} joined only one net")
+    print(f"{Style.BRIGHT}{Fore.WHITE}{'NETS':>5} {'SHARE':>6} {'QSOS':>5} {'FIRST':<10} {'LAST':<10} {'CALL'}{Style.RESET_ALL}")
+    for call in regulars:
+        first = str(np.datetime64(int(first_day[call]), "D")) if last_day[call] >= first_day[call] else "?"
+        last = str(np.datetime64(int(last_day[call]), "D")) if last_day[call] >= first_day[call] else "?"
+        print(f"{Fore.WHITE}{nets[call]:>5} {share(nets[call], len(starts)):>6} {qsos[call]:>5} {first:<10} {last:<10} "
+              f"{table.vocab['CALL'][call]}{Style.RESET_ALL}")
+
+
+def value_shares(table: LogColumns, field: str, top: int) -> None:
+    """The `top` values of a coded field by QSOs, with their stations."""
+
+    size = len(table.vocab[field])
+    qsos = np.bincount(table[field], minlength = size)
+    stations = pair_counts(table[field], table["CALL"], size)
+    unknown = table.code(field, "")
+    if unknown >= 0:
+        qsos[unknown] = 0
+    known = int(qsos.sum())
+    print(f"{Style.BRIGHT}{Fore.WHITE}{'QSOS':>6} {'SHARE':>6} {'STATIONS':>9} {field}{Style.RESET_ALL}")
+    for code in np.argsort(-qsos, kind = "stable")[:top]:
+        if qsos[code]:
+            print(f"{Fore.WHITE}{qsos[code]:>6} {share(qsos[code], known):>6} {stations[code]:>9} "
+                  f"{table.vocab[field][code]}{Style.RESET_ALL}")
+    print(f"{Fore.YELLOW}{len(np.flatnonzero(qsos))} kinds; {field} unknown in {share(len(table) - known, len(table)).strip()} "
+          f"of the QSOs{Style.RESET_ALL}")
+
+
+def report_rigs(table: LogColumns, top: int) -> None:
+    """Share of rigs and antennas."""
+
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Rigs and antennas{Style.RESET_ALL}")
+    value_shares(table, "RIG", top)
+    print()
+    value_shares(table, "ANT", top)
+
+
+def distribution(values, bins: list, unit: str) -> None:
+    """Prints a histogram of `values` (NaN = unknown) over `bins`."""
+
+    known = values[~np.isnan(values)]
+    counts = np.histogram(known, bins = bins)[0]
+    if len(known):
+        print(f"known in {share(len(known), len(values)).strip()} of the QSOs; median {np.median(known):g} {unit}, "
+              f"mean {known.mean():.1f} {unit}, p90 {np.percentile(known, 90):g} {unit}")
+    for low, high, count in zip(bins, bins[1:], counts):
+        label = f"{low:g}-{high:g} {unit}" if high != float("inf") else f">= {low:g} {unit}"
+        bar = "#" * int(round(count / len(known) * 40)) if len(known) else ""
+        print(f"{Fore.WHITE}{label:>12} {count:>7} {share(count, len(known)):>6} {bar}{Style.RESET_ALL}")
+
+
+def report_power(table: LogColumns, top: int) -> None:
+    """Distribution of PWR, ALT and RST."""
+
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Power (PWR){Style.RESET_ALL}")
+    distribution(table["pwr"], POWER_BINS, "W")
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}Height (ALT, {FLOOR_HEIGHT:g} m per floor){Style.RESET_ALL}")
+    distribution(table["alt"], HEIGHT_BINS, "m")
+    rst = table["rst"][~np.isnan(table["rst"])]
+    values, counts = np.unique(rst, return_counts = True)
+    reports = ", ".join(f"{values[i]:.0f}: {share(counts[i], len(rst)).strip()}" for i in np.argsort(-counts, kind = "stable")[:top])
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}RST{Style.RESET_ALL} {reports}")
+
+
+def report_qth(table: LogColumns, top: int) -> None:
+    """The `top` places by QSOs, and the distinct places of each year."""
+
+    print(f"\n{Style.BRIGHT}{Fore.CYAN}QTH coverage{Style.RESET_ALL}")
+    value_shares(table, "QTH", top)
+    dated = ~np.isnat(table["date"])
+    years, year = np.unique(table["date"][dated].astype("datetime64[Y]"), return_inverse = True)
+    qth = table["QTH"][dated]
+    unknown = table.code("QTH", "")
+    places = pair_counts(year.reshape(-1)[qth != unknown], qth[qth != unknown], len(years))
+    print(", ".join(f"{years[i]}: {places[i]} places" for i in range(len(years))))
+
+
+REPORTS = {"nets": report_nets, "stations": report_stations, "rigs": report_rigs, "power": report_power, "qth": report_qth}
+
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(description = "Statistics over archived roll-call logs (final CSVs and backups)")
+    parser.add_argument("paths", nargs = "*", default = ["."], help = "files or folders (default: this folder)")
+    parser.add_argument("--report", default = "all", help = f"comma-separated: {', '.join(REPORTS)} (default: all)")
+    parser.add_argument("--top", type = int, default = 10, help = "rows in each list")
+    parser.add_argument("--since", type = datetime.date.fromisoformat, help = "first date (YYYY-MM-DD)")
+    parser.add_argument("--until", type = datetime.date.fromisoformat, help = "last date (YYYY-MM-DD)")
+    parser.add_argument("--op", default = "", help = "only QSOs logged by this operator")
+    parser.add_argument("--cache", default = CACHE_FILE, help = "cache of the parsed columns")
+    parser.add_argument("--no-cache", action = "store_true", help = "read every file, do not use or write the cache")
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print(f"{Fore.RED}Error: analytics.py needs NumPy: pip install numpy{Style.RESET_ALL}")
+        return 1
+    names = list(REPORTS) if args.report == "all" else [name.strip().lower() for name in args.report.split(",")]
+    unknown = [name for name in names if name not in REPORTS]
+    if unknown:
+        print(f"{Fore.RED}Error: Unknown report {', '.join(unknown)}; choose from {', '.join(REPORTS)}{Style.RESET_ALL}")
+        return 1
+
+    begin = time.perf_counter()
+    table = mark_sessions(load_columns(args.paths, "" if args.no_cache else args.cache))
+    mask = np.ones(len(table), dtype = bool)
+    if args.since:
+        mask &= table["date"] >= np.datetime64(args.since, "D")
+    if args.until:
+        mask &= table["date"] <= np.datetime64(args.until, "D")
+    if args.op:
+        mask &= table["OP"] == table.code("OP", args.op.strip().upper())
+    table = table.take(mask)
+    if not len(table):
+        print(f"{Fore.YELLOW}No QSOs found.{Style.RESET_ALL}")
+        return 0
+    for name in names:
+        REPORTS[name](table, args.top)
+    print(f"\n{Fore.CYAN}Done in {(time.perf_counter() - begin) * 1000:.0f} ms{Style.RESET_ALL}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,988 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the AI Logger Assistant, run against the local mock server
+
+Usage:
+    python benchmark.py client --requests 50
+    python benchmark.py client --certfile cert.pem --keyfile key.pem   # include TLS handshakes
+    python benchmark.py stream --latency 0.3 --token-delay 0.03
+    python benchmark.py logbook --sessions 1000 --qsos 50
+    python benchmark.py export --sessions 2000 --qsos 50
+    python benchmark.py replay --latency 0.8 --jitter 0.4 --out results.json
+    python benchmark.py replay --latency 0.8 --jitter 0.4 --compare results.json
+    python benchmark.py route --backends 0.4,0.05,0.02:0.5 --requests 200
+    python benchmark.py session --consoles 4 --qsos 50
+    python benchmark.py typeahead --qsos 20 --cps 10
+    python benchmark.py startup --repeat 5
+    python benchmark.py show --records 1000
+    python benchmark.py analytics --sessions 2000 --qsos 50
+
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import importlib.util
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_server import start_server
+
+LOGGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "AI Logger Assistant.py")
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+EDIT_CORRECTION = "刚才听错了，他其实在西湖边，功率10瓦"    # 交给AI处理的自由格式更正
+ACCURACY_FIELDS = ["CALL", "RST", "QTH", "RIG", "ANT", "PWR", "ALT"]
+COMPARED_METRICS = [    # (指标, 是否越大越好)
+    ("p50_ms", False), ("p95_ms", False), ("p99_ms", False), ("throughput", True),
+    ("prompt_tokens_per_qso", False), ("uncached_tokens_per_qso", False), ("errors", False), ("accuracy", True),
+]
+
+
+def load_logger(path: str = LOGGER_PATH):
+    """
+    Returns the logger script imported as a module (its name contains spaces,
+    so it cannot be imported with a plain import statement).
+    """
+
+    spec = importlib.util.spec_from_file_location("ai_logger", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["ai_logger"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values, pct: float) -> float:
+    """
+    Nearest-rank percentile of a list of numbers (0 for an empty list).
+    """
+
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(name: str, samples) -> None:
+    """
+    Prints first-request, mean, p50 and p95 latency (milliseconds) of one run.
+    """
+
+    ms = [x * 1000 for x in samples]
+    print(f"{name:<10} first {ms[0]:8.2f}  mean {statistics.mean(ms):8.2f}  "
+          f"p50 {percentile(ms, 50):8.2f}  p95 {percentile(ms, 95):8.2f}  (ms)")
+
+
+def bench_client(args) -> None:
+    """
+    Compares per-request latency of a fresh OpenAI() client per call (the old
+    get_client behaviour) against the shared, pooled and pre-warmed client.
+    """
+
+    server = start_server(latency = args.latency, certfile = args.certfile, keyfile = args.keyfile)
+    os.environ["LOGGER_BASE_URL"] = server.base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "mock-key")
+    if args.certfile:
+        os.environ["SSL_CERT_FILE"] = args.certfile    # 信任自签名证书
+    logger = load_logger()
+    from openai import OpenAI
+
+    def timed(client) -> float:
+        start = time.perf_counter()
+        client.chat.completions.create(
+            model = logger.MODEL_NAME,
+            messages = [{"role": "user", "content": "输入文本：BG5AAA 59 uvk6 5w"}],
+        )
+        return time.perf_counter() - start
+
+    fresh = []
+    for _ in range(args.requests):
+        fresh.append(timed(OpenAI(api_key = "mock-key", base_url = server.base_url)))
+
+    logger.warm_up_client()
+    pooled = [timed(logger.get_client()) for _ in range(args.requests)]
+
+    print(f"{args.requests} sequential requests against {server.base_url}, "
+          f"server latency {args.latency * 1000:.0f} ms")
+    summarize("per-call", fresh)
+    summarize("pooled", pooled)
+    server.shutdown()
+
+
+def bench_stream(args) -> None:
+    """
+    Measures time to the first complete field (CALL) against total latency,
+    streaming and non-streaming, and checks both give the same record.
+    """
+
+    server = start_server(latency = args.latency, token_delay = args.token_delay)
+    os.environ["LOGGER_BASE_URL"] = server.base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "mock-key")
+    logger = load_logger()
+    logger.warm_up_client()
+    usr_prompt = "输入文本：BG5AAA 59 laoheshan uvk6 30l 3eleyagi 5w"
+
+    results = {}
+    for stream in (False, True):
+        logger.STREAM_MODE = stream
+        first, total, contents = [], [], set()
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            seen = []
+
+            def on_field(obj, key, value):
+                if key == "CALL" and not seen:
+                    seen.append(time.perf_counter() - start)
+
+            content = logger.call_model(logger.get_sys_prompt(), usr_prompt, on_field)
+            total.append(time.perf_counter() - start)
+            first.append(seen[0] if seen else total[-1])
+            contents.add(json.dumps(logger.parse_record(content), sort_keys = True))
+        results[stream] = contents
+        name = "stream" if stream else "blocking"
+        print(f"{name:<10} CALL shown p50 {percentile(first, 50) * 1000:8.1f} ms   "
+              f"complete p50 {percentile(total, 50) * 1000:8.1f} ms")
+
+    print("records identical:", results[False] == results[True])
+    server.shutdown()
+
+
+def fill_logbook(logger, args, rng, workdir: str):
+    """
+    Points the logger at a new logbook in `workdir` and fills it with weekly
+    sessions; returns the (callsigns, operators) used.
+    """
+
+    logger.JOURNAL_FILE = ""
+    logger.LOGBOOK_DB = os.path.join(workdir, "logbook.db")
+    calls = [f"B{rng.choice('AGDH')}{rng.randint(1, 9)}{''.join(rng.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k = 3))}"
+             for _ in range(args.stations)]
+    ops = [f"BG5OP{c}" for c in "ABCDEFGH"]
+    start = datetime.datetime.utcnow() - datetime.timedelta(weeks = args.sessions)
+
+    begin = time.perf_counter()
+    for s in range(args.sessions):
+        day = (start + datetime.timedelta(weeks = s)).strftime("%Y-%m-%d")
+        op = ops[s % len(ops)]
+        logger.RECORD = logger.RecordStore(
+            [str(nr), day, "12:00", call, "59", "杭州", "UV-K6", "NULL", "5W", "NULL", "NULL", op]
+            for nr, call in enumerate(rng.sample(calls, args.qsos), 1))
+        logger.logbook_sync()
+    insert = time.perf_counter() - begin
+    total = logger.logbook_query("SELECT COUNT(*) FROM qso")[0][0]
+    print(f"{total} QSOs in {args.sessions} sessions written in {insert:.2f} s")
+    return calls, ops
+
+
+def bench_logbook(args) -> None:
+    """
+    Fills a temporary logbook with weekly sessions and times the SEEN,
+    CHECKINS and SESSIONS commands (output discarded).
+    """
+
+    logger = load_logger()
+    workdir = tempfile.mkdtemp(prefix = "logbook_bench_")
+    rng = random.Random(1)
+    calls, ops = fill_logbook(logger, args, rng, workdir)
+
+    queries = {
+        "SEEN": lambda: logger.show_seen(rng.choice(calls)),
+        "CHECKINS": lambda: logger.show_checkins(4),
+        "SESSIONS": lambda: logger.show_sessions(rng.choice(ops)),
+    }
+    for name, query in queries.items():
+        samples = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                query()
+            samples.append(time.perf_counter() - begin)
+        summarize(name, samples)
+    logger.get_logbook().close()
+    shutil.rmtree(workdir, ignore_errors = True)
+
+
+def bench_export(args) -> None:
+    """
+    Exports a large logbook to CSV, ADIF and Cabrillo (time and peak Python
+    memory), then compares saving a session from scratch with re-saving it
+    after an edit three quarters of the way down.
+    """
+
+    logger = load_logger()
+    workdir = tempfile.mkdtemp(prefix = "export_bench_")
+    rng = random.Random(1)
+    fill_logbook(logger, args, rng, workdir)
+    logger.RECORD = logger.RecordStore()
+
+    for ext in (".csv", ".adi", ".log"):
+        path = os.path.join(workdir, "archive" + ext)
+        begin = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            logger.export_logbook(path)
+        elapsed = time.perf_counter() - begin
+        # tracemalloc拖慢很多，内存峰值另跑一次测量
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            logger.export_logbook(path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"archive{ext:<5} {os.path.getsize(path) / 1e6:6.1f} MB in {elapsed:5.2f} s, "
+              f"peak memory {peak / 1e6:5.2f} MB")
+
+    records = [dict(zip(logger.RECORD_FIELDS, [str(nr), "2025-12-04", "12:00", f"BG5A{nr:03d}", "59", "杭州",
+                                                "UV-K6", "NULL", "5W", "NULL", "NULL", "BG5OPA"]))
+               for nr in range(1, args.session_size + 1)]
+    path = os.path.join(workdir, "final.csv")
+    full, patch = [], []
+    for i in range(args.repeat):
+        if os.path.exists(path):
+            os.remove(path)
+        exporter = logger.ExportFile(path)
+        begin = time.perf_counter()
+        exporter.sync(records)
+        full.append(time.perf_counter() - begin)
+        records[len(records) * 3 // 4]["RMKS"] = f"edit {i}"
+        begin = time.perf_counter()
+        exporter.sync(records)
+        patch.append(time.perf_counter() - begin)
+    print(f"session of {args.session_size} QSOs, one edit at 3/4:")
+    summarize("full save", full)
+    summarize("re-save", patch)
+    logger.get_logbook().close()
+    shutil.rmtree(workdir, ignore_errors = True)
+
+
+def load_corpus(path: str) -> list:
+    """
+    Returns the entries of a corpus: a JSONL file of {"t", "raw", "record"}
+    objects (only "raw" is required), or a text file with one raw QSO line
+    per line. Lines starting with # are comments.
+    """
+
+    entries = []
+    with open(path, encoding = "utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entries.append(json.loads(line) if path.endswith(".jsonl") else {"raw": line})
+    return entries
+
+
+def fresh_logger(workdir: str):
+    """
+    Loads a new copy of the logger (empty caches and state) whose cache,
+    profiles and logbook files live in `workdir`.
+    """
+
+    logger = load_logger()
+    logger.JOURNAL_FILE = ""
+    logger.LIVE_EXPORT_FILE = ""
+    logger.CACHE_FILE = os.path.join(workdir, "extract_cache.json")
+    logger.PROFILE_FILE = os.path.join(workdir, "station_profiles.json")
+    logger.LOGBOOK_DB = os.path.join(workdir, "logbook.db")
+    return logger
+
+
+def is_error(result: dict) -> bool:
+    rmks = str(result.get("RMKS", ""))
+    return rmks.startswith("API调用错误") or rmks.startswith("Error processing QSO")
+
+
+def field_matches(result: dict, expected: dict) -> int:
+    """
+    Counts the ACCURACY_FIELDS of `result` equal to the expected record
+    (case and spacing ignored).
+    """
+
+    def canon(value):
+        return "".join(str(value).split()).upper()
+
+    return sum(canon(result.get(field, "")) == canon(expected.get(field, "")) for field in ACCURACY_FIELDS)
+
+
+def replay_qso(logger, corpus: list, args):
+    """
+    Feeds the corpus through do_action() as the operator would type it, paced
+    by the recorded offsets when --speed is set; returns per-QSO latency
+    (typed to record filled in) and the finished records in corpus order.
+    """
+
+    done = {}
+    fill_record = logger.fill_record
+
+    def timed_fill(record, info):
+        fill_record(record, info)
+        done[record.NR] = time.perf_counter()
+
+    logger.fill_record = timed_fill
+    logger.do_action("OP BG5OPA")
+    submitted = []
+    start = time.perf_counter()
+    for entry in corpus:
+        if args.speed and "t" in entry:
+            time.sleep(max(0.0, start + entry["t"] / args.speed - time.perf_counter()))
+        submitted.append((str(logger.NR_COUNTER), time.perf_counter()))
+        logger.do_action(entry["raw"])
+    logger.wait_pending()
+    wall = time.perf_counter() - start
+
+    records = {record.NR: record.to_dict() for record in logger.RECORD}
+    latencies = [done[nr] - typed for nr, typed in submitted if nr in done]
+    return latencies, [records.get(nr, {}) for nr, _ in submitted], wall
+
+
+def replay_calls(logger, corpus: list, args, edit: bool = False):
+    """
+    Calls get_respond() (or get_respond_for_edit() with EDIT_CORRECTION) for
+    every corpus line from --concurrency threads; returns the latencies, the
+    results in corpus order and the wall time.
+    """
+
+    def one(entry):
+        begin = time.perf_counter()
+        if edit:
+            original = entry.get("record") or {"CALL": "NULL", "RMKS": entry["raw"]}
+            result = logger.get_respond_for_edit(", ".join(f"{k}: {v}" for k, v in original.items()),
+                                                 EDIT_CORRECTION)
+        else:
+            result = logger.get_respond(entry["raw"])
+        return time.perf_counter() - begin, json.loads(result)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = args.concurrency) as pool:
+        outcomes = list(pool.map(one, corpus))
+    return [t for t, _ in outcomes], [r for _, r in outcomes], time.perf_counter() - start
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process (logger and mock server) in MB, or
+    None where the resource module is not available (Windows).
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def code_version() -> str:
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output = True, text = True,
+                             cwd = os.path.dirname(LOGGER_PATH), timeout = 10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        out = ""
+    return out or "unknown"
+
+
+def phase_summary(latencies, results, expected, wall, used) -> dict:
+    """
+    Returns the metrics of one phase; `used` holds the mock server counters
+    consumed by it.
+    """
+
+    ms = [x * 1000 for x in latencies] or [0.0]
+    n = len(results)
+    checked = [(r, e) for r, e in zip(results, expected) if e]
+    return {
+        "n": n,
+        "errors": sum(is_error(r) for r in results),
+        "wall_s": round(wall, 3),
+        "throughput": round(n / wall, 2) if wall else 0.0,
+        "mean_ms": round(statistics.mean(ms), 1),
+        "p50_ms": round(percentile(ms, 50), 1),
+        "p95_ms": round(percentile(ms, 95), 1),
+        "p99_ms": round(percentile(ms, 99), 1),
+        "max_ms": round(max(ms), 1),
+        "requests": used["requests"],
+        "server_errors": used["errors"],
+        "prompt_tokens": used["prompt_tokens"],
+        "completion_tokens": used["completion_tokens"],
+        "cached_tokens": used["cached_tokens"],
+        "prompt_tokens_per_qso": round(used["prompt_tokens"] / n, 1) if n else 0.0,
+        "uncached_tokens_per_qso": round((used["prompt_tokens"] - used["cached_tokens"]) / n, 1) if n else 0.0,
+        "accuracy": (round(sum(field_matches(r, e) for r, e in checked) / (len(checked) * len(ACCURACY_FIELDS)), 3)
+                     if checked else None),
+    }
+
+
+def compare_results(old: dict, new: dict, tolerance: float) -> int:
+    """
+    Prints the COMPARED_METRICS of two result files side by side and returns
+    the number of metrics that got worse by more than `tolerance`.
+    """
+
+    if old.get("config") != new.get("config"):
+        print("warning: mock settings or corpus differ, the runs are not directly comparable")
+    print(f"\ncompared with {old.get('version')} ({old.get('label') or old.get('timestamp')}):")
+    regressions = 0
+    for phase, metrics in new["phases"].items():
+        before = old.get("phases", {}).get(phase)
+        if not before:
+            continue
+        for metric, higher_better in COMPARED_METRICS:
+            a, b = before.get(metric), metrics.get(metric)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a if a else (0.0 if b == a else float("inf"))
+            worse = change < -tolerance if higher_better else change > tolerance
+            regressions += worse
+            print(f"  {phase:<8} {metric:<22} {a:>10} -> {b:>10}  {change:+8.1%}  {'REGRESSION' if worse else ''}")
+    return regressions
+
+
+def bench_replay(args) -> None:
+    """
+    Replays a recorded net corpus against the mock server through the QSO
+    path (do_action), get_respond and get_respond_for_edit; prints latency
+    percentiles, throughput, tokens and memory, and optionally saves them as
+    JSON or compares them with an earlier run.
+    """
+
+    corpus = load_corpus(args.corpus)
+    server = start_server(latency = args.latency, token_delay = args.token_delay, jitter = args.jitter,
+                          error_rate = args.error_rate, seed = args.seed,
+                          fixtures = args.corpus if args.corpus.endswith(".jsonl") else "")
+    os.environ["LOGGER_BASE_URL"] = server.base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "mock-key")
+    expected = [entry.get("record") for entry in corpus]
+    home = os.getcwd()
+
+    phases = {}
+    for phase in args.phases.split(","):
+        latencies, results, wall = [], [], 0.0
+        before = server.counters()
+        for _ in range(args.repeat):
+            workdir = tempfile.mkdtemp(prefix = "replay_bench_")
+            os.chdir(workdir)    # 档案会导入当前目录下的CSV，在空目录中运行
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    logger = fresh_logger(workdir)
+                    logger.warm_up_client()
+                    if phase == "qso":
+                        run = replay_qso(logger, corpus, args)
+                    else:
+                        run = replay_calls(logger, corpus, args, edit = phase == "edit")
+                    if logger.get_logbook() is not None:
+                        logger.get_logbook().close()
+            finally:
+                os.chdir(home)
+                shutil.rmtree(workdir, ignore_errors = True)
+            latencies += run[0]
+            results += run[1]
+            wall += run[2]
+        after = server.counters()
+        used = {key: after[key] - before[key] for key in after}
+        phases[phase] = phase_summary(latencies, results, expected * args.repeat if phase != "edit" else [],
+                                      wall, used)
+    server.shutdown()
+
+    result = {
+        "version": code_version(),
+        "label": args.label,
+        "timestamp": datetime.datetime.now().isoformat(timespec = "seconds"),
+        "python": sys.version.split()[0],
+        "config": {"corpus": os.path.basename(args.corpus), "lines": len(corpus), "latency": args.latency,
+                   "jitter": args.jitter, "error_rate": args.error_rate, "token_delay": args.token_delay,
+                   "speed": args.speed, "concurrency": args.concurrency, "repeat": args.repeat, "seed": args.seed},
+        "phases": phases,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    print(f"{len(corpus)} lines from {os.path.basename(args.corpus)}, mock latency {args.latency * 1000:.0f} ms "
+          f"+ up to {args.jitter * 1000:.0f} ms, error rate {args.error_rate:.0%}")
+    for phase, m in phases.items():
+        accuracy = f"{m['accuracy']:.1%}" if m["accuracy"] is not None else "-"
+        print(f"{phase:<8} p50 {m['p50_ms']:8.1f}  p95 {m['p95_ms']:8.1f}  p99 {m['p99_ms']:8.1f} ms  "
+              f"{m['throughput']:6.2f} QSO/s  {m['requests']:4d} requests  {m['prompt_tokens_per_qso']:7.1f} "
+              f"prompt tokens/QSO ({m['uncached_tokens_per_qso']:.1f} uncached)  errors {m['errors']}  "
+              f"accuracy {accuracy}")
+    print(f"peak RSS {result['peak_rss_mb']} MB    version {result['version']}")
+
+    if args.out:
+        with open(args.out, "w", encoding = "utf-8") as f:
+            json.dump(result, f, ensure_ascii = False, indent = 2)
+        print(f"results written to {args.out}")
+    if args.compare:
+        with open(args.compare, encoding = "utf-8") as f:
+            regressions = compare_results(json.load(f), result, args.tolerance)
+        if regressions:
+            print(f"{regressions} metric(s) worse by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+def bench_route(args) -> None:
+    """
+    Starts one mock server per --backends entry (latency[:error rate]) and
+    sends --requests calls through a backend registry of all of them, then
+    through the first one alone; prints latency, errors and where the
+    requests went. With --outage, the busiest backend starts failing
+    halfway through.
+    """
+
+    specs = [spec.split(":") for spec in args.backends.split(",")]
+    servers = [start_server(latency = float(spec[0]), seed = args.seed) for spec in specs]
+    names = [f"mock{i}" for i in range(len(servers))]
+    os.environ.setdefault("DEEPSEEK_API_KEY", "mock-key")
+    workdir = tempfile.mkdtemp(prefix = "route_bench_")
+    registry = os.path.join(workdir, "backends.json")
+
+    for label, routed in (("routed", names), ("single", names[:1])):
+        for spec, server in zip(specs, servers):
+            server.error_rate = float(spec[1]) if len(spec) > 1 else 0.0
+        with open(registry, "w", encoding = "utf-8") as f:
+            json.dump({"backends": [{"name": name, "base_url": server.base_url, "model": f"model-{name}"}
+                                    for name, server in zip(names, servers)],
+                       "routes": {"qso": routed, "edit": routed}}, f)
+        before = [server.counters()["requests"] for server in servers]
+        latencies, errors = [], 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            logger = load_logger()
+            logger.BACKENDS_FILE = registry
+            logger.BREAKER_THRESHOLD = args.requests    # 只看路由，不进入仅本地模式
+            sys_prompt = logger.get_sys_prompt()
+            for i in range(args.requests):
+                if args.outage and i == args.requests // 2:
+                    busiest = max(range(len(servers)), key = lambda k: servers[k].counters()["requests"] - before[k])
+                    servers[busiest].error_rate = 1.0
+                start = time.perf_counter()
+                try:
+                    logger.call_model(sys_prompt, f"输入文本：BG5A{chr(65 + i % 26)}A 59")
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+        used = "  ".join(f"{name} {server.counters()['requests'] - start_count}"
+                         for name, server, start_count in zip(names, servers, before))
+        ms = [x * 1000 for x in latencies]
+        print(f"{label:<7} p50 {percentile(ms, 50):8.1f}  p95 {percentile(ms, 95):8.1f}  p99 {percentile(ms, 99):8.1f} ms"
+              f"  errors {errors:3d}   requests: {used}")
+
+    for server in servers:
+        server.shutdown()
+    shutil.rmtree(workdir, ignore_errors = True)
+
+
+def bench_session(args) -> None:
+    """
+    Starts a session server on localhost and --consoles consoles that submit
+    --qsos QSO lines each (corpus texts, new callsigns), all at the same
+    time; checks that every NR is used exactly once and that all consoles
+    received the same events in the same order, and prints the command round
+    trip and the time until every record is finished. Exits with 1 when a
+    check fails.
+    """
+
+    from session_server import SessionClient, start_session_server
+
+    texts = [entry["raw"].split(None, 1)[-1] for entry in load_corpus(os.path.join(CORPUS_DIR, "sample_net.jsonl"))]
+    server = start_server(latency = args.latency, jitter = args.jitter, seed = args.seed)
+    os.environ["LOGGER_BASE_URL"] = server.base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "mock-key")
+    total = args.consoles * args.qsos
+    round_trips = []
+    home = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix = "session_bench_")
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            logger = fresh_logger(workdir)
+            session = start_session_server(logger, "127.0.0.1", 0)
+            consoles = [SessionClient("127.0.0.1", session.port) for _ in range(args.consoles)]
+            consoles[0].command("OP BG5OPA")
+
+            def operator(k):
+                for i in range(args.qsos):
+                    call = f"BG{k % 10}{chr(65 + k // 10 % 26)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}"
+                    start = time.perf_counter()
+                    consoles[k].command(f"{call} {texts[(k + i) % len(texts)]}")
+                    round_trips.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers = args.consoles) as pool:
+                list(pool.map(operator, range(args.consoles)))
+            submitted = time.perf_counter() - start
+            while time.perf_counter() - start < 120 and any(
+                    sum(e["event"] in ("fill", "defer") for e in list(c.events)) < total for c in consoles):
+                time.sleep(0.01)
+            finished = time.perf_counter() - start
+            time.sleep(0.1)
+            session.shutdown()
+            for console in consoles:
+                console.close()
+            if logger.get_logbook() is not None:
+                logger.get_logbook().close()
+    finally:
+        os.chdir(home)
+        shutil.rmtree(workdir, ignore_errors = True)
+    server.shutdown()
+
+    numbers = [int(e["rec"]["NR"]) for e in consoles[0].events if e["event"] == "reserve"]
+    orders = [[e["seq"] for e in console.events] for console in consoles]
+    unique = sorted(numbers) == list(range(1, total + 1))
+    same = all(order == orders[0] for order in orders) and orders[0] == sorted(orders[0])
+    ms = [x * 1000 for x in round_trips]
+    print(f"{args.consoles} consoles x {args.qsos} QSOs, mock latency {args.latency * 1000:.0f} ms "
+          f"+ up to {args.jitter * 1000:.0f} ms")
+    print(f"NRs: {len(numbers)} reserved, " + ("each used once" if unique else "DUPLICATE OR MISSING NRs"))
+    print(f"events: {len(orders[0])} per console, " + ("same order on every console" if same else "ORDER DIFFERS"))
+    print(f"command round trip p50 {percentile(ms, 50):6.1f}  p95 {percentile(ms, 95):6.1f}  "
+          f"p99 {percentile(ms, 99):6.1f} ms")
+    print(f"{total} QSOs submitted in {submitted:.2f} s ({total / submitted:.0f} QSO/s), "
+          f"all finished after {finished:.2f} s")
+    if not (unique and same):
+        sys.exit(1)
+
+
+def type_line(logger, line: str, rng, args, typeahead: bool) -> None:
+    """
+    Types `line` one character at a time at --cps, pausing --think seconds
+    after a word with probability --hesitate and --review seconds before
+    Enter; with `typeahead`, the line editor callbacks are called as
+    prompt_toolkit would.
+    """
+
+    for i in range(1, len(line) + 1):
+        if typeahead:
+            logger.typeahead_changed(line[:i])
+        time.sleep(1 / args.cps)
+        if line[i - 1] == " " and rng.random() < args.hesitate:
+            time.sleep(args.think)
+    time.sleep(args.review)
+    if typeahead:
+        logger.typeahead_enter(line.strip().upper())
+
+
+def bench_typeahead(args) -> None:
+    """
+    Types --qsos corpus lines into the logger (see type_line), without and
+    with type-ahead, and prints the time from Enter to the finished record,
+    the requests the mock server received and the type-ahead counters.
+    """
+
+    corpus = load_corpus(os.path.join(CORPUS_DIR, "sample_net.jsonl"))[:args.qsos]
+    server = start_server(latency = args.latency, jitter = args.jitter, seed = args.seed)
+    os.environ["LOGGER_BASE_URL"] = server.base_url
+    os.environ.setdefault("DEEPSEEK_API_KEY", "mock-key")
+    print(f"{len(corpus)} lines typed at {args.cps:g} chars/s, mock latency {args.latency * 1000:.0f} ms "
+          f"+ up to {args.jitter * 1000:.0f} ms, pause {args.pause * 1000:.0f} ms")
+
+    for label, typeahead in (("plain", False), ("typeahead", True)):
+        rng = random.Random(args.seed)
+        workdir = tempfile.mkdtemp(prefix = "typeahead_bench_")
+        before = server.counters()["requests"]
+        done = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            logger = fresh_logger(workdir)
+            logger.TYPEAHEAD_PAUSE = args.pause
+            fill_record = logger.fill_record
+
+            def timed_fill(record, info):
+                fill_record(record, info)
+                done[record.NR] = time.perf_counter()
+
+            logger.fill_record = timed_fill
+            logger.do_action("OP BG5OPA")
+            entered = []
+            for entry in corpus:
+                type_line(logger, entry["raw"], rng, args, typeahead)
+                entered.append((str(logger.NR_COUNTER), time.perf_counter()))
+                logger.do_action(entry["raw"].strip().upper())
+            logger.wait_pending()
+            if logger.get_logbook() is not None:
+                logger.get_logbook().close()
+        shutil.rmtree(workdir, ignore_errors = True)
+
+        ms = [(done[nr] - start) * 1000 for nr, start in entered if nr in done]
+        local = logger.FASTPATH_STATS["full"]
+        line = (f"{label:<10} Enter to record p50 {percentile(ms, 50):7.1f}  p95 {percentile(ms, 95):7.1f}  "
+                f"mean {statistics.mean(ms):7.1f} ms  ({local} lines parsed locally)  "
+                f"requests {server.counters()['requests'] - before}")
+        if typeahead:
+            stats = logger.TYPEAHEAD_STATS
+            line += (f"\n{'':<10} speculative {stats['requests']}: used {stats['hits']} "
+                     f"({stats['ready']} answered before Enter), wasted {stats['wasted']} "
+                     f"({stats['stopped']} stopped early)")
+        print(line)
+    server.shutdown()
+
+
+def read_until(stream, marker: bytes, limit: float) -> float:
+    """
+    Reads `stream` until `marker` appears; returns the time it appeared
+    (perf_counter), or inf after `limit` seconds or at end of output.
+    """
+
+    seen = b""
+    deadline = time.perf_counter() + limit
+    while marker not in seen:
+        chunk = stream.read1(4096) if hasattr(stream, "read1") else stream.read(1)
+        if not chunk or time.perf_counter() > deadline:
+            return float("inf")
+        seen = seen[-len(marker):] + chunk
+    return time.perf_counter()
+
+
+def import_times(script: str) -> list:
+    """
+    Loads `script` as a module under python -X importtime; returns the
+    top-level imports as (cumulative microseconds, module), slowest first.
+    """
+
+    loader = (f"import importlib.util; spec = importlib.util.spec_from_file_location('ai_logger', {script!r}); "
+              f"spec.loader.exec_module(importlib.util.module_from_spec(spec))")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", loader], capture_output = True, text = True)
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2][1:].startswith(" "):
+            imports.append((int(parts[1]), parts[2].strip()))
+    return sorted(imports, reverse = True)
+
+
+def bench_startup(args) -> None:
+    """
+    Starts the program --repeat times (in an empty directory, against the
+    mock server) and measures the time until the first prompt and until a
+    first QSO typed at once is finished; then lists the slowest imports
+    reported by python -X importtime.
+    """
+
+    server = start_server(latency = args.latency, seed = args.seed)
+    env = dict(os.environ, LOGGER_BASE_URL = server.base_url, DEEPSEEK_API_KEY = "mock-key")
+    script = os.path.abspath(args.script)
+    prompts, firsts = [], []
+    for _ in range(args.repeat):
+        workdir = tempfile.mkdtemp(prefix = "startup_bench_")
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, script], cwd = workdir, env = env,
+                                   stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+        prompt = read_until(process.stdout, b"[OP NOT SET!]", 60)
+        process.stdin.write("OP BG5OPA\nBG5AAA 信号59 在西溪 手台 5瓦\n".encode("utf-8"))
+        process.stdin.flush()
+        first = read_until(process.stdout, b"Record #1 added", 60)
+        process.stdin.write(b"QUIT\n")
+        process.stdin.close()
+        process.wait(timeout = 60)
+        shutil.rmtree(workdir, ignore_errors = True)
+        prompts.append((prompt - start) * 1000)
+        firsts.append((first - start) * 1000)
+    server.shutdown()
+
+    imports = import_times(script)
+    print(f"{os.path.basename(script)}, {args.repeat} starts, mock latency {args.latency * 1000:.0f} ms")
+    print(f"first prompt  median {statistics.median(prompts):7.0f}  min {min(prompts):7.0f} ms")
+    print(f"first QSO     median {statistics.median(firsts):7.0f}  min {min(firsts):7.0f} ms  (typed at once)")
+    print(f"imports while loading the script: {sum(us for us, _ in imports) / 1000:.0f} ms, slowest:")
+    for us, name in imports[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+def bench_show(args) -> None:
+    """
+    Times SHOW on a long session built from the corpus records (output
+    discarded): repeated SHOW, SHOW after editing the last record, and the
+    LAST, PAGE, CALL and ALL forms when the script has them.
+    """
+
+    logger = load_logger(args.script)
+    logger.JOURNAL_FILE = ""
+    entries = [e for e in load_corpus(args.corpus) if "record" in e]
+    rows = []
+    for nr in range(1, args.records + 1):
+        record = entries[(nr - 1) % len(entries)]["record"]
+        rows.append([str(nr), "2025-12-04", "12:00"] + [str(record.get(f, "NULL")) for f in logger.REQUIRED_FIELDS]
+                    + ["BG5OPA"])
+    logger.RECORD = logger.RecordStore(rows)
+    middle = logger.RECORD.get(args.records // 2)
+
+    def edit_and_show(i):
+        logger.RECORD.update(logger.RECORD.get(args.records), RMKS = f"edit {i}")
+        logger.do_action("SHOW")
+
+    commands = {"SHOW": lambda i: logger.do_action("SHOW"), "edit + SHOW": edit_and_show}
+    if hasattr(logger, "record_line"):
+        commands.update({
+            "SHOW LAST 50": lambda i: logger.do_action("SHOW LAST 50"),
+            f"SHOW PAGE {args.records // 40}": lambda i: logger.do_action(f"SHOW PAGE {args.records // 40}"),
+            "SHOW CALL": lambda i: logger.do_action(f"SHOW CALL {middle.CALL}"),
+            "SHOW ALL": lambda i: logger.do_action("SHOW ALL"),
+        })
+    print(f"{os.path.basename(args.script)}, {args.records} records")
+    for name, command in commands.items():
+        samples = []
+        for i in range(args.repeat):
+            begin = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                command(i)
+            samples.append(time.perf_counter() - begin)
+        summarize(name, samples)
+
+
+def bench_analytics(args) -> None:
+    """
+    Writes a final CSV per weekly session (corpus records, random callsigns)
+    and times analytics.py over them: without cache, with the cache, and
+    after one file changed.
+    """
+
+    import analytics    # 需要NumPy
+
+    workdir = tempfile.mkdtemp(prefix = "analytics_bench_")
+    rng = random.Random(args.seed)
+    entries = [e["record"] for e in load_corpus(args.corpus) if "record" in e]
+    calls = [f"B{rng.choice('AGDH')}{rng.randint(1, 9)}{''.join(rng.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k = 3))}"
+             for _ in range(args.stations)]
+    start = datetime.date(2010, 1, 6)
+    begin = time.perf_counter()
+    for s in range(args.sessions):
+        day = (start + datetime.timedelta(weeks = s)).isoformat()
+        with open(os.path.join(workdir, f"final_{day}.csv"), "w", encoding = "utf-8", newline = "") as f:
+            f.write("\ufeff")
+            writer = csv.writer(f)
+            writer.writerow(analytics.RECORD_FIELDS)
+            for nr, call in enumerate(rng.sample(calls, args.qsos), 1):
+                record = rng.choice(entries)
+                writer.writerow([nr, day, f"12:{nr % 60:02d}", call] +
+                                [record.get(field, "NULL") for field in ("RST", "QTH", "RIG", "ANT", "PWR", "ALT", "RMKS")] +
+                                ["BG5CVB"])
+    print(f"{args.sessions} sessions, {args.sessions * args.qsos} QSOs written in {time.perf_counter() - begin:.1f} s")
+
+    cache = os.path.join(workdir, "analytics_cache.npz")
+    changed = os.path.join(workdir, f"final_{start.isoformat()}.csv")
+    runs = [("no cache", ["--no-cache"], None), ("cache built", [], None), ("cached", [], None),
+            ("1 file changed", [], lambda: os.utime(changed))]
+    for name, extra, prepare in runs:
+        samples = []
+        for _ in range(1 if name == "cache built" else args.repeat):
+            if prepare:
+                prepare()
+            begin = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                analytics.main([workdir, "--cache", cache] + extra)
+            samples.append(time.perf_counter() - begin)
+        print(f"{name:<15} median {statistics.median(samples) * 1000:7.0f} ms  min {min(samples) * 1000:7.0f} ms")
+    shutil.rmtree(workdir, ignore_errors = True)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "AI Logger Assistant benchmarks")
+    sub = parser.add_subparsers(dest = "bench", required = True)
+
+    p_client = sub.add_parser("client", help = "fresh client per request vs. pooled client")
+    p_client.add_argument("--requests", type = int, default = 50)
+    p_client.add_argument("--latency", type = float, default = 0.0, help = "mock server latency (s)")
+    p_client.add_argument("--certfile", default = "", help = "serve the mock over HTTPS")
+    p_client.add_argument("--keyfile", default = "")
+    p_client.set_defaults(func = bench_client)
+
+    p_stream = sub.add_parser("stream", help = "time to first field, streaming vs. blocking")
+    p_stream.add_argument("--requests", type = int, default = 10)
+    p_stream.add_argument("--latency", type = float, default = 0.3, help = "mock time to first token (s)")
+    p_stream.add_argument("--token-delay", type = float, default = 0.03, help = "mock seconds per chunk")
+    p_stream.set_defaults(func = bench_stream)
+
+    p_logbook = sub.add_parser("logbook", help = "history queries on a large logbook")
+    p_logbook.add_argument("--sessions", type = int, default = 1000)
+    p_logbook.add_argument("--qsos", type = int, default = 50, help = "QSOs per session")
+    p_logbook.add_argument("--stations", type = int, default = 3000, help = "distinct callsigns")
+    p_logbook.add_argument("--repeat", type = int, default = 50)
+    p_logbook.set_defaults(func = bench_logbook)
+
+    p_export = sub.add_parser("export", help = "archive export and incremental re-save")
+    p_export.add_argument("--sessions", type = int, default = 2000)
+    p_export.add_argument("--qsos", type = int, default = 50, help = "QSOs per session")
+    p_export.add_argument("--stations", type = int, default = 3000, help = "distinct callsigns")
+    p_export.add_argument("--session-size", type = int, default = 200, help = "QSOs in the re-saved session")
+    p_export.add_argument("--repeat", type = int, default = 50)
+    p_export.set_defaults(func = bench_export)
+
+    p_replay = sub.add_parser("replay", help = "replay a recorded net under load, save or compare results")
+    p_replay.add_argument("--corpus", default = os.path.join(CORPUS_DIR, "sample_net.jsonl"),
+                          help = "JSONL corpus (raw, t, record) or text file, one QSO per line")
+    p_replay.add_argument("--phases", default = "qso,respond,edit", help = "comma-separated: qso, respond, edit")
+    p_replay.add_argument("--latency", type = float, default = 0.8, help = "mock time to first token (s)")
+    p_replay.add_argument("--jitter", type = float, default = 0.4, help = "up to this many extra seconds")
+    p_replay.add_argument("--error-rate", type = float, default = 0.0, help = "fraction answered with HTTP 503")
+    p_replay.add_argument("--token-delay", type = float, default = 0.0, help = "mock seconds per chunk")
+    p_replay.add_argument("--speed", type = float, default = 0.0,
+                          help = "replay at this multiple of the recorded pace (0: all lines at once)")
+    p_replay.add_argument("--concurrency", type = int, default = 4, help = "threads for respond and edit")
+    p_replay.add_argument("--repeat", type = int, default = 1)
+    p_replay.add_argument("--seed", type = int, default = 1)
+    p_replay.add_argument("--label", default = "", help = "free text stored with the results")
+    p_replay.add_argument("--out", default = "", help = "write the results to this JSON file")
+    p_replay.add_argument("--compare", default = "", help = "earlier results JSON to compare with")
+    p_replay.add_argument("--tolerance", type = float, default = 0.10, help = "allowed relative change")
+    p_replay.set_defaults(func = bench_replay)
+
+    p_route = sub.add_parser("route", help = "latency- and error-aware routing over several mock backends")
+    p_route.add_argument("--backends", default = "0.4,0.05,0.02:0.5",
+                         help = "comma-separated latency[:error rate] of each mock backend")
+    p_route.add_argument("--requests", type = int, default = 200)
+    p_route.add_argument("--outage", action = "store_true", help = "the busiest backend fails after half the requests")
+    p_route.add_argument("--seed", type = int, default = 1)
+    p_route.set_defaults(func = bench_route)
+
+    p_session = sub.add_parser("session", help = "shared session server with several concurrent consoles")
+    p_session.add_argument("--consoles", type = int, default = 4)
+    p_session.add_argument("--qsos", type = int, default = 50, help = "QSOs typed at each console")
+    p_session.add_argument("--latency", type = float, default = 0.8, help = "mock time to first token (s)")
+    p_session.add_argument("--jitter", type = float, default = 0.4, help = "up to this many extra seconds")
+    p_session.add_argument("--seed", type = int, default = 1)
+    p_session.set_defaults(func = bench_session)
+
+    p_typeahead = sub.add_parser("typeahead", help = "Enter to finished record, with and without type-ahead")
+    p_typeahead.add_argument("--qsos", type = int, default = 20, help = "corpus lines typed")
+    p_typeahead.add_argument("--cps", type = float, default = 10.0, help = "typing speed (characters per second)")
+    p_typeahead.add_argument("--hesitate", type = float, default = 0.2, help = "chance of a pause after a word")
+    p_typeahead.add_argument("--think", type = float, default = 1.0, help = "length of such a pause (s)")
+    p_typeahead.add_argument("--review", type = float, default = 0.6, help = "pause before Enter (s)")
+    p_typeahead.add_argument("--pause", type = float, default = 0.4, help = "TYPEAHEAD_PAUSE of the logger (s)")
+    p_typeahead.add_argument("--latency", type = float, default = 0.8, help = "mock time to first token (s)")
+    p_typeahead.add_argument("--jitter", type = float, default = 0.4, help = "up to this many extra seconds")
+    p_typeahead.add_argument("--seed", type = int, default = 1)
+    p_typeahead.set_defaults(func = bench_typeahead)
+
+    p_startup = sub.add_parser("startup", help = "time to the first prompt and import times (-X importtime)")
+    p_startup.add_argument("--repeat", type = int, default = 5)
+    p_startup.add_argument("--latency", type = float, default = 0.3, help = "mock time to first token (s)")
+    p_startup.add_argument("--top", type = int, default = 8, help = "number of imports listed")
+    p_startup.add_argument("--script", default = LOGGER_PATH, help = "logger script to start (e.g. an older copy)")
+    p_startup.add_argument("--seed", type = int, default = 1)
+    p_startup.set_defaults(func = bench_startup)
+
+    p_show = sub.add_parser("show", help = "SHOW on a long session")
+    p_show.add_argument("--records", type = int, default = 1000)
+    p_show.add_argument("--corpus", default = os.path.join(CORPUS_DIR, "sample_net.jsonl"),
+                        help = "JSONL corpus whose records fill the session")
+    p_show.add_argument("--repeat", type = int, default = 50)
+    p_show.add_argument("--script", default = LOGGER_PATH, help = "logger script to time (e.g. an older copy)")
+    p_show.set_defaults(func = bench_show)
+
+    p_analytics = sub.add_parser("analytics", help = "analytics.py reports over many session files")
+    p_analytics.add_argument("--sessions", type = int, default = 2000)
+    p_analytics.add_argument("--qsos", type = int, default = 50, help = "QSOs per session")
+    p_analytics.add_argument("--stations", type = int, default = 3000, help = "distinct callsigns")
+    p_analytics.add_argument("--corpus", default = os.path.join(CORPUS_DIR, "sample_net.jsonl"),
+                             help = "JSONL corpus whose records fill the sessions")
+    p_analytics.add_argument("--repeat", type = int, default = 5)
+    p_analytics.add_argument("--seed", type = int, default = 1)
+    p_analytics.set_defaults(func = bench_analytics)
+
+    args = parser.parse_args()
+    args.func(args)
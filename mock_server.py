@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Local OpenAI-compatible stand-in server for the AI Logger Assistant
+
+Serves GET /v1/models and POST /v1/chat/completions with canned QSO records,
+so the logger can be exercised without an API key or network access.
+Latency, jitter and an error rate can be set; answers can be taken from a
+fixture file (the JSONL corpora under corpus/ carry the expected records).
+Provider-side prefix caching is simulated: prompt tokens repeating the start
+of an earlier prompt are reported as cached, as DeepSeek does.
+
+Usage:
+    python mock_server.py --port 8765 --latency 0.5
+    python mock_server.py --latency 0.8 --jitter 0.6 --error-rate 0.05 --fixtures corpus/sample_net.jsonl
+    set LOGGER_BASE_URL=http://127.0.0.1:8765/v1 before starting the logger
+
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import ssl
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CALL_PATTERN = re.compile(r"\b([A-Z]{1,2}\d[A-Z]{1,4})\b", re.IGNORECASE)
+BATCH_LINE = re.compile(r"^\[(\d+)\] (.*)$", re.MULTILINE)
+CHUNK_CHARS = 4    # 每个“token”包含的字符数
+CACHE_BLOCK = 64   # 模拟服务端的前缀缓存：与之前请求相同的开头按这么多token为一块计为命中（同DeepSeek）
+
+
+def fixture_key(raw_text: str) -> str:
+    """
+    Returns the fixture lookup key of a raw text (case and spacing ignored).
+    """
+
+    return " ".join(raw_text.split()).upper()
+
+
+def load_fixtures(path: str) -> dict:
+    """
+    Reads a JSONL corpus and returns {fixture_key(raw): record} for the lines
+    that carry a "record"; other lines are ignored.
+    """
+
+    fixtures = {}
+    with open(path, encoding = "utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            if entry.get("record"):
+                fixtures[fixture_key(entry["raw"])] = entry["record"]
+    return fixtures
+
+
+def fake_record(raw_text: str, fixtures: dict = None) -> dict:
+    """
+    Parameters
+    ----------
+    raw_text : str
+        Raw QSO text found in the user prompt.
+    fixtures : dict, optional
+        Recorded answers by fixture_key(); used when the text is found there.
+
+    Returns
+    -------
+    record : dict
+        A plausible record with the eight required fields.
+
+    """
+
+    if fixtures and fixture_key(raw_text) in fixtures:
+        return dict(fixtures[fixture_key(raw_text)])
+    match = CALL_PATTERN.search(raw_text)
+    return {
+        "CALL": match.group(1).upper() if match else "NULL",
+        "RST": "59",
+        "QTH": "NULL",
+        "RIG": "NULL",
+        "ANT": "NULL",
+        "PWR": "NULL",
+        "ALT": "NULL",
+        "RMKS": "NULL",
+    }
+
+
+def fake_answer(usr_prompt: str, fixtures: dict = None) -> dict:
+    """
+    Returns the answer object for a user prompt: one record, or for batched
+    prompts ("[n] text" lines) a {"records": [...]} list with IDs. The text
+    follows "输入文本：" (or "原始记录：" for edits), at the end of the prompt.
+    """
+
+    text = re.split("输入文本：|原始记录：", usr_prompt, maxsplit = 1)[-1]
+    lines = BATCH_LINE.findall(text)
+    if lines:
+        return {"records": [dict(ID = int(i), **fake_record(raw, fixtures)) for i, raw in lines]}
+    return fake_record(text.strip().split("\n", 1)[0], fixtures)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Request handler; behaviour is read from the server object (latency etc.).
+    """
+
+    protocol_version = "HTTP/1.1"    # 支持keep-alive，与真实服务一致
+    disable_nagle_algorithm = True   # 否则keep-alive连接上每个响应会多出约40ms的延迟确认
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii = False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [
+                {"id": "deepseek-chat", "object": "model", "owned_by": "mock"}]})
+        else:
+            self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "not found"}})
+            return
+
+        delay, fail = self.server.draw()
+        time.sleep(delay)
+        if fail:
+            self.server.count_request(error = True)
+            self.send_json(503, {"error": {"message": "mock server overloaded", "type": "server_error"}})
+            return
+
+        messages = request.get("messages", [])
+        usr_prompt = messages[-1]["content"] if messages else ""
+        content = json.dumps(fake_answer(usr_prompt, self.server.fixtures), ensure_ascii = False)
+        prompt = "".join(m.get("content", "") for m in messages)
+        prompt_tokens = len(prompt)
+        cached_tokens = self.server.cached_prefix(prompt)
+        pieces = [content[i:i + CHUNK_CHARS] for i in range(0, len(content), CHUNK_CHARS)]
+        self.server.count_request(prompt_tokens, len(pieces), cached_tokens = cached_tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "prompt_cache_hit_tokens": cached_tokens,    # DeepSeek的写法
+            "prompt_cache_miss_tokens": prompt_tokens - cached_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},    # OpenAI的写法
+            "completion_tokens": len(pieces),
+            "total_tokens": prompt_tokens + len(pieces),
+        }
+        head = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "created": int(time.time()),
+            "model": request.get("model", "deepseek-chat"),
+        }
+
+        if request.get("stream"):
+            self.stream_answer(head, pieces, usage)
+            return
+
+        # 非流式：等待全部内容“生成”完毕再一次返回
+        time.sleep(self.server.token_delay * len(pieces))
+        self.send_json(200, dict(head, **{
+            "object": "chat.completion",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }))
+
+    def stream_answer(self, head: dict, pieces: list, usage: dict) -> None:
+        """
+        Sends the answer as server-sent events, one piece per token_delay,
+        using chunked transfer encoding so the connection stays reusable.
+        """
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload) -> None:
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii = False)
+            body = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(body):X}\r\n".encode("ascii") + body + b"\r\n")
+            self.wfile.flush()
+
+        for i, piece in enumerate(pieces):
+            time.sleep(self.server.token_delay)
+            event(dict(head, object = "chat.completion.chunk", choices = [{
+                "index": 0,
+                "delta": {"role": "assistant", "content": piece} if i == 0 else {"content": piece},
+                "finish_reason": None,
+            }]))
+        event(dict(head, object = "chat.completion.chunk", choices = [{
+            "index": 0, "delta": {}, "finish_reason": "stop"}], usage = usage))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the mock behaviour settings and counters.
+    Tokens are counted as the mock's usage reports them: one per prompt
+    character, one per CHUNK_CHARS of the answer.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, token_delay: float = 0.0, verbose: bool = False,
+                 jitter: float = 0.0, error_rate: float = 0.0, fixtures: dict = None, seed = None):
+        super().__init__(address, MockHandler)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.fixtures = fixtures or {}
+        self.verbose = verbose
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self._prefixes = set()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """
+        Returns (delay, fail) for the next completion: latency plus a uniform
+        0..jitter extra, and whether to answer with an error (error_rate).
+        """
+
+        with self._lock:
+            return self.latency + self._rng.uniform(0, self.jitter), self._rng.random() < self.error_rate
+
+    def handle_error(self, request, client_address):
+        # 客户端中途断开（如被取消的请求）属于正常情况，不打印
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def cached_prefix(self, prompt: str) -> int:
+        """
+        Returns how many leading tokens of `prompt` (whole CACHE_BLOCK blocks)
+        repeat the start of an earlier prompt, and remembers its blocks.
+        """
+
+        hit = 0
+        with self._lock:
+            for end in range(CACHE_BLOCK, len(prompt) + 1, CACHE_BLOCK):
+                digest = hashlib.sha1(prompt[:end].encode("utf-8")).digest()
+                if digest in self._prefixes and hit == end - CACHE_BLOCK:
+                    hit = end
+                self._prefixes.add(digest)
+        return hit
+
+    def count_request(self, prompt_tokens: int = 0, completion_tokens: int = 0, error: bool = False,
+                      cached_tokens: int = 0) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += error
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.completion_tokens += completion_tokens
+
+    def counters(self) -> dict:
+        """
+        Returns a snapshot of the request, error and token counters.
+        """
+
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "prompt_tokens": self.prompt_tokens,
+                    "cached_tokens": self.cached_tokens, "completion_tokens": self.completion_tokens}
+
+    @property
+    def base_url(self) -> str:
+        scheme = "https" if isinstance(self.socket, ssl.SSLSocket) else "http"
+        host, port = self.server_address[:2]
+        return f"{scheme}://{host}:{port}/v1"
+
+
+def start_server(port: int = 0, latency: float = 0.0, certfile: str = "",
+                 keyfile: str = "", verbose: bool = False, token_delay: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, fixtures: str = "", seed = None) -> MockServer:
+    """
+    Parameters
+    ----------
+    port : int
+        Port to listen on (0 picks a free one).
+    latency : float
+        Seconds to wait before answering each completion (time to first token).
+    token_delay : float
+        Seconds per generated chunk of CHUNK_CHARS characters.
+    certfile, keyfile : str
+        Optional TLS certificate, to include the handshake cost in measurements.
+    jitter : float
+        Up to this many extra seconds, drawn uniformly for each completion.
+    error_rate : float
+        Fraction of completions answered with HTTP 503 instead.
+    fixtures : str
+        Optional JSONL corpus whose "record" entries are returned for matching texts.
+    seed : int, optional
+        Seed for jitter and errors, so that runs can be repeated.
+
+    Returns
+    -------
+    server : MockServer
+        The running server (served from a daemon thread); call shutdown() to stop.
+
+    """
+
+    server = MockServer(("127.0.0.1", port), latency = latency, token_delay = token_delay, verbose = verbose,
+                        jitter = jitter, error_rate = error_rate,
+                        fixtures = load_fixtures(fixtures) if fixtures else None, seed = seed)
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile or None)
+        server.socket = context.wrap_socket(server.socket, server_side = True)
+    threading.Thread(target = server.serve_forever, name = "mock-server", daemon = True).start()
+    return server
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "OpenAI-compatible stand-in server")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--latency", type = float, default = 0.0, help = "seconds to first token")
+    parser.add_argument("--token-delay", type = float, default = 0.0, help = "seconds per generated chunk")
+    parser.add_argument("--jitter", type = float, default = 0.0, help = "up to this many extra seconds")
+    parser.add_argument("--error-rate", type = float, default = 0.0, help = "fraction answered with HTTP 503")
+    parser.add_argument("--fixtures", default = "", help = "JSONL corpus with recorded answers")
+    parser.add_argument("--seed", type = int, default = None)
+    parser.add_argument("--certfile", default = "", help = "serve HTTPS with this certificate")
+    parser.add_argument("--keyfile", default = "")
+    parser.add_argument("--verbose", action = "store_true")
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.certfile, args.keyfile, args.verbose, args.token_delay,
+                          args.jitter, args.error_rate, args.fixtures, args.seed)
+    print(f"Mock server listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
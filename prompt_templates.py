@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt templates of the AI Logger Assistant
+
+Every prompt starts with a static prefix that is the same, byte for byte,
+on every request: the system prompt, then the instructions and answer
+format of the task. The variable parts (city, input text) come last.
+Providers that cache prompt prefixes (DeepSeek, OpenAI) bill the repeated
+prefix at the cached price and answer it sooner.
+
+Keep anything that changes between requests out of the static parts, and
+change TEMPLATE_ID whenever any text here is changed: it is part of the
+extraction cache key, so answers to the old prompts are not reused.
+
+"""
+
+TEMPLATE_ID = "qso-v2"
+
+RECORD_FORMAT = ('{"CALL": "呼号", "RST": "信号报告", "QTH": "地点", "RIG": "设备", "ANT": "天线", '
+                 '"PWR": "功率", "ALT": "高度", "RMKS": "备注"}')
+
+SYSTEM_PROMPT = (
+    "你是一名资深业余无线电爱好者，现在需要帮助新手将杂乱的信息整理成一条有序的QSO记录。"
+    "你需要从中提取相关信息，推测地点、设备、高度、天线等。除了设备（如UV-K6等）需要用字母，其他信息请使用数字和中文表述。"
+    "需要提取的字段，分别是CALL（呼号）, RST（信号报告）, QTH（地址）, RIG（设备）, ANT（天线）, PWR（功率）, ALT（高度，通常为几米或几楼）, RMKS（备注）。"
+    "推测地点时需要优先考虑“所在城市”以及附近地区的地名。"
+    "一些可能的缩写，供你参考：“3ele yagi”表示“3单元八木”，“orgn”表示“原装（天线）”，“gnd”表示“地面高度（ground）”，等。"
+    "请返回JSON格式的内容，不要输出其他任何多余的内容！"
+)
+
+EXTRACT_TASK = (
+    "请根据输入文本推测相关信息，如果遇到无法辨别的字段，请使用字符串NULL表示。信号报告默认为59。"
+    "\n请严格按照以下JSON格式返回：" + RECORD_FORMAT
+)
+
+BATCH_TASK = (
+    "输入文本的每一行是一条独立的QSO记录，行首方括号内为编号。请分别推测每一条的相关信息，如果遇到无法辨别的字段，请使用字符串NULL表示。信号报告默认为59。"
+    "\n请严格按照以下JSON格式返回，records中每条记录对应一行输入，ID为该行的编号："
+    '{"records": [{"ID": 1, "CALL": "呼号", "RST": "信号报告", "QTH": "地点", "RIG": "设备", "ANT": "天线", '
+    '"PWR": "功率", "ALT": "高度", "RMKS": "备注"}]}'
+)
+
+EDIT_TASK = (
+    "请根据更正内容对原始记录进行修正，如果更正内容中没有提到的字段，保持原记录的值不变。"
+    "\n请严格按照以下JSON格式返回：" + RECORD_FORMAT
+)
+
+
+def extraction_prompt(raw_text: str, city: str) -> str:
+    """
+    Returns the user prompt asking for the record of one raw QSO text.
+    """
+
+    return f"{EXTRACT_TASK}\n\n所在城市：{city}\n\n输入文本：{raw_text}"
+
+
+def batch_prompt(raw_texts, city: str) -> str:
+    """
+    Returns the user prompt asking for the records of several raw QSO texts,
+    numbered from 1 in the given order.
+    """
+
+    lines = "\n".join(f"[{i}] {raw_text}" for i, raw_text in enumerate(raw_texts, 1))
+    return f"{BATCH_TASK}\n\n所在城市：{city}\n\n输入文本：\n{lines}"
+
+
+def edit_prompt(original_record: str, correction: str, city: str) -> str:
+    """
+    Returns the user prompt asking to apply a free-form correction to a
+    record (JSON text).
+    """
+
+    return f"{EDIT_TASK}\n\n所在城市：{city}\n\n原始记录：{original_record}\n\n更正内容：{correction}"
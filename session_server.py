@@ -0,0 +1,610 @@
+# -*- coding: utf-8 -*-
+"""
+Shared roll-call session for several operators
+
+One laptop runs the session server, which holds the only RECORD, NR counter,
+journal and logbook; the other operators connect thin consoles over the
+local network and type the usual commands (QSO lines, OP, EDIT, SHOW, ...).
+NRs are allocated in one place, so concurrent submissions never share a
+number, and every reserved, finished or edited record is broadcast to all
+consoles in journal order. The operator is shared as well: OP on any
+console changes the operator of the whole session (one net, one log).
+
+A server listening on more than the loopback address only accepts consoles
+that know its token (--token, or LOGGER_SESSION_TOKEN; one is made up and
+printed when neither is set), since its commands clear the log and write
+files on the server.
+
+Usage:
+    python session_server.py                              (this laptop only)
+    python session_server.py --host 0.0.0.0 --port 8770   (other laptops may connect)
+    python session_server.py --connect 192.168.1.10:8770 --token ...   (a console)
+
+Protocol: one JSON object per line over TCP.
+    console -> server   {"token": token}        first line, before the hello
+                        {"cmd": line}, {"answer": line}
+    server -> console   {"hello": name, "you": console, "op": ..., "nr": ...}
+                        {"out": text}           output of the console's command
+                        {"ask": prompt}         the command asks for a line (EDIT, FINAL, BATCH)
+                        {"done": true, "op": ..., "nr": ...}
+                        {"event": op, "seq": n, "rec": {...}, "from": console}
+                                                broadcast, in journal order; "from" names the
+                                                console whose command made the change
+
+"""
+import argparse
+import asyncio
+import hmac
+import importlib.util
+import ipaddress
+import json
+import os
+import queue
+import secrets
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from colorama import init, Fore, Style
+    init()
+except ImportError:
+    class Fore:
+        RED = GREEN = YELLOW = CYAN = WHITE = ''
+
+    class Style:
+        BRIGHT = RESET_ALL = ''
+
+LOGGER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "AI Logger Assistant.py")
+SERVER_NAME = "AI Logger Assistant session"
+DEFAULT_PORT = 8770
+TOKEN_ENV = "LOGGER_SESSION_TOKEN"  # 环境变量名，未指定--token时使用
+TOKEN_TIMEOUT = 10             # 连接后必须在这么多秒内发来token
+MAX_CONSOLES = 32              # 同时连接的控制台数量上限（每个控制台的命令占用一个线程）
+LINE_LIMIT = 1 << 20           # 单条消息的长度上限
+SEND_BUFFER_LIMIT = 4 << 20    # 控制台积压的未发送数据超过这么多字节就断开它，免得拖慢其他控制台
+
+_CONTEXT = threading.local()   # .console：当前线程正在为哪个控制台执行命令
+
+
+def is_loopback(host: str) -> bool:
+    """
+    Returns True when `host` only accepts connections from this computer.
+    """
+
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False    # 主机名可能解析到任何地址
+
+
+def load_logger():
+    """
+    Returns the logger script imported as a module (its name contains spaces,
+    so it cannot be imported with a plain import statement).
+    """
+
+    spec = importlib.util.spec_from_file_location("ai_logger", LOGGER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["ai_logger"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class ConsoleOutput:
+    """
+    Stands in for sys.stdout on the server: what a console's command prints
+    goes back to that console, line by line; everything else (worker threads,
+    the server's own messages) goes to the real stdout.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text: str) -> int:
+        console = getattr(_CONTEXT, "console", None)
+        if console is None:
+            return self.stream.write(text)
+        console.buffer.append(text)
+        if "\n" in text:
+            console.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        console = getattr(_CONTEXT, "console", None)
+        if console is None:
+            self.stream.flush()
+        else:
+            console.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def console_input(prompt: str = "") -> str:
+    """
+    Replaces input() in the logger: a command run for a console asks that
+    console; anything else reads the server's own terminal.
+    """
+
+    console = getattr(_CONTEXT, "console", None)
+    if console is None:
+        return input(prompt)
+    return console.ask(prompt)
+
+
+class Console:
+    """
+    One connected console on the server side: its stream, the output of the
+    running command and the answers to its prompts.
+    """
+
+    def __init__(self, server: "SessionServer", writer: asyncio.StreamWriter):
+        self.server = server
+        self.writer = writer
+        self.buffer = []
+        self.answers = queue.Queue()
+        peer = writer.get_extra_info("peername") or ("?", 0)
+        self.name = f"{peer[0]}:{peer[1]}"
+
+    def send(self, message: dict) -> None:
+        """
+        Sends a message to the console; may be called from any thread.
+        """
+
+        data = (json.dumps(message, ensure_ascii = False) + "\n").encode("utf-8")
+        self.server.loop.call_soon_threadsafe(self.write, data)
+
+    def write(self, data: bytes) -> None:
+        # 只在事件循环线程中调用
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > SEND_BUFFER_LIMIT:
+            print(f"Console {self.name} is not reading, disconnected")
+            self.writer.close()
+            return
+        self.writer.write(data)
+
+    def flush(self) -> None:
+        if self.buffer:
+            text, self.buffer = "".join(self.buffer), []
+            self.send({"out": text})
+
+    def ask(self, prompt: str) -> str:
+        self.flush()
+        self.send({"ask": str(prompt)})
+        answer = self.answers.get()
+        if answer is None:
+            raise EOFError("console disconnected")
+        return answer
+
+
+class SessionServer:
+    """
+    The asyncio server. Commands run in a thread pool (the logger is
+    blocking code), one at a time per console; consoles run in parallel.
+    """
+
+    def __init__(self, logger, host: str = "127.0.0.1", port: int = DEFAULT_PORT, token: str = ""):
+        self.logger = logger
+        self.host = host
+        self.port = port
+        self.token = token
+        self.consoles = set()
+        self.handlers = set()
+        self.loop = None
+        self.stopped = None
+        self.ready = threading.Event()
+        self.pool = ThreadPoolExecutor(max_workers = MAX_CONSOLES, thread_name_prefix = "console")
+
+    async def serve(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handle, self.host, self.port, limit = LINE_LIMIT)
+        self.port = server.sockets[0].getsockname()[1]
+        self.logger.JOURNAL_LISTENERS.append(self.journal_event)
+        self.ready.set()
+        try:
+            await self.stopped.wait()
+        finally:
+            self.logger.JOURNAL_LISTENERS.remove(self.journal_event)
+            server.close()
+            for console in list(self.consoles):
+                console.writer.close()
+            if self.handlers:
+                await asyncio.wait(self.handlers, timeout = 5)
+            await server.wait_closed()
+
+    def shutdown(self) -> None:
+        """
+        Stops accepting consoles and disconnects the connected ones.
+        """
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    def journal_event(self, entry: dict) -> None:
+        """
+        Called by journal_write() with RECORD_LOCK held, so entries arrive in
+        journal order; call_soon_threadsafe keeps that order.
+        """
+
+        message = {"event": entry["op"], "seq": entry["seq"]}
+        origin = getattr(_CONTEXT, "console", None)
+        if origin is not None:
+            message["from"] = origin.name    # 该控制台已看到命令本身的输出
+        if "rec" in entry:
+            message["rec"] = dict(zip(self.logger.RECORD_FIELDS, entry["rec"]))
+        for key in ("call", "nr"):
+            if key in entry:
+                message[key] = entry[key]
+        self.loop.call_soon_threadsafe(self.broadcast, message)
+
+    def broadcast(self, message: dict) -> None:
+        data = (json.dumps(message, ensure_ascii = False) + "\n").encode("utf-8")
+        for console in list(self.consoles):
+            console.write(data)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        console = Console(self, writer)
+        if len(self.consoles) >= MAX_CONSOLES:
+            writer.write((json.dumps({"out": f"Too many consoles (at most {MAX_CONSOLES}).\n"}) + "\n").encode())
+            writer.close()
+            return
+        if self.token and not await self.check_token(reader):
+            print(f"Console {console.name} rejected: wrong token")
+            writer.write((json.dumps({"out": "Wrong session token (see --token).\n"}) + "\n").encode())
+            writer.close()
+            return
+        self.consoles.add(console)
+        self.handlers.add(asyncio.current_task())
+        print(f"Console {console.name} connected ({len(self.consoles)} in total)")
+        console.send({"hello": SERVER_NAME, "you": console.name, "op": self.logger.OPERATOR,
+                      "nr": self.logger.NR_COUNTER})
+
+        # 读取与执行分开：命令执行期间仍要接收它所需的回答
+        commands = asyncio.Queue()
+        worker = asyncio.create_task(self.run_commands(console, commands))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    break
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if "answer" in message:
+                    console.answers.put(str(message["answer"]))
+                elif "cmd" in message:
+                    commands.put_nowait(str(message["cmd"]))
+        finally:
+            self.consoles.discard(console)
+            self.handlers.discard(asyncio.current_task())
+            console.answers.put(None)    # 正在等待回答的命令不再等下去
+            worker.cancel()
+            writer.close()
+            print(f"Console {console.name} disconnected")
+
+    async def check_token(self, reader: asyncio.StreamReader) -> bool:
+        """
+        Reads the console's first line and compares its token with ours.
+        """
+
+        try:
+            line = await asyncio.wait_for(reader.readline(), TOKEN_TIMEOUT)
+            token = str(json.loads(line).get("token", ""))
+        except (asyncio.TimeoutError, ConnectionError, ValueError, AttributeError):
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    async def run_commands(self, console: Console, commands: asyncio.Queue) -> None:
+        while True:
+            cmd = await commands.get()
+            if cmd.strip().upper() == "QUIT":
+                # 退出的只是这个控制台，会话继续
+                console.writer.close()
+                return
+            if cmd.strip():
+                print(f"{console.name}: {cmd}")
+            await self.loop.run_in_executor(self.pool, self.run_command, console, cmd)
+
+    def run_command(self, console: Console, cmd: str) -> None:
+        """
+        Runs one command for a console, in a pool thread, with its output
+        and prompts routed to that console.
+        """
+
+        _CONTEXT.console = console
+        try:
+            if cmd.strip():
+                self.logger.do_action(cmd)
+        except EOFError:
+            pass
+        except Exception as e:
+            self.logger.cprint(f"Error: {e}", "RED")
+        finally:
+            console.flush()
+            _CONTEXT.console = None
+        console.send({"done": True, "op": self.logger.OPERATOR, "nr": self.logger.NR_COUNTER})
+
+
+def start_session_server(logger, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                         token: str = "") -> SessionServer:
+    """
+    Parameters
+    ----------
+    logger : module
+        The loaded logger (see load_logger()), with its session recovered.
+    host : str
+        Address to listen on; "0.0.0.0" lets other computers connect.
+    port : int
+        Port to listen on (0 picks a free one).
+    token : str
+        Token the consoles must send. Required unless `host` is a loopback
+        address; a random one is made up when it is missing.
+
+    Returns
+    -------
+    server : SessionServer
+        The running server (event loop in a daemon thread); its port and
+        token attributes hold the port and token actually used. Call
+        shutdown() to stop.
+
+    """
+
+    if not token and not is_loopback(host):
+        token = secrets.token_urlsafe(9)
+    if not isinstance(sys.stdout, ConsoleOutput):
+        sys.stdout = ConsoleOutput(sys.stdout)
+    logger.input = console_input    # 命令中的 input() 改为向发出命令的控制台提问
+    server = SessionServer(logger, host, port, token)
+    thread = threading.Thread(target = asyncio.run, args = (server.serve(),), name = "session-server", daemon = True)
+    thread.start()
+    while not server.ready.wait(0.05):
+        if not thread.is_alive():
+            raise OSError(f"cannot listen on {host}:{port}")
+    return server
+
+
+class SessionClient:
+    """
+    A connection to a session server. Broadcast events are passed to
+    `on_event` from a reader thread (or collected in `events`); command()
+    sends one command and waits until it is done.
+    """
+
+    def __init__(self, host: str, port: int, on_event = None, timeout: float = 10.0, token: str = ""):
+        self.sock = socket.create_connection((host, port), timeout = timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile("rb")
+        self.send_lock = threading.Lock()
+        self.replies = queue.Queue()
+        self.on_event = on_event
+        self.events = []
+        self.op, self.nr = "", 1
+        self.name = ""
+        self.closed = False
+
+        # 不要求token的服务器会忽略这一行
+        self.send({"token": token})
+        hello = json.loads(self.rfile.readline() or b"{}")
+        if "hello" not in hello:
+            self.sock.close()
+            raise ConnectionError(hello.get("out", "not a session server").strip())
+        self.op, self.nr, self.name = hello["op"], hello["nr"], hello.get("you", "")
+        self.sock.settimeout(None)
+        threading.Thread(target = self.read_loop, name = "session-reader", daemon = True).start()
+
+    def send(self, message: dict) -> None:
+        data = (json.dumps(message, ensure_ascii = False) + "\n").encode("utf-8")
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def read_loop(self) -> None:
+        try:
+            for line in self.rfile:
+                message = json.loads(line)
+                if "event" in message:
+                    self.track(message)
+                    if self.on_event is not None:
+                        self.on_event(message)
+                    else:
+                        self.events.append(message)
+                else:
+                    if "done" in message:
+                        self.op, self.nr = message["op"], message["nr"]
+                    self.replies.put(message)
+        except (OSError, ValueError):
+            pass
+        self.closed = True
+        self.replies.put(None)
+
+    def track(self, event: dict) -> None:
+        """
+        Keeps the operator and the next NR shown in the prompt up to date.
+        """
+
+        op = event["event"]
+        if op in ("reserve", "append"):
+            self.nr = max(self.nr, int(event["rec"]["NR"]) + 1)
+        elif op == "clear":
+            self.nr = 1
+        elif op == "op":
+            self.op = event["call"]
+        elif op == "restore":
+            self.op, self.nr = event["call"], event["nr"]
+
+    def command(self, line: str, ask = None, output = None) -> str:
+        """
+        Parameters
+        ----------
+        line : str
+            The command, as typed at the prompt.
+        ask : callable, optional
+            Called with the prompt when the command asks for a line; returns
+            the answer (default: empty answer).
+        output : callable, optional
+            Called with each piece of output as it arrives; otherwise the
+            output is returned.
+
+        Returns
+        -------
+        text : str
+            The collected output (empty when `output` is given).
+
+        """
+
+        self.send({"cmd": line})
+        parts = []
+        while True:
+            message = self.replies.get()
+            if message is None:
+                raise ConnectionError("the session server closed the connection")
+            if "out" in message:
+                if output is not None:
+                    output(message["out"])
+                else:
+                    parts.append(message["out"])
+            elif "ask" in message:
+                self.send({"answer": ask(message["ask"]) if ask is not None else ""})
+            elif "done" in message:
+                return "".join(parts)
+
+    def close(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def describe_event(event: dict):
+    """
+    Returns the (text, color) shown on a console for a broadcast event, or
+    None for events that are not shown (placeholders waiting for the AI).
+    """
+
+    op, rec = event["event"], event.get("rec", {})
+    if op in ("fill", "append"):
+        return f"Record #{rec['NR']} added: {rec['CALL']} - {rec['DATE']} {rec['UTC']} [{rec['OP']}]", Fore.GREEN
+    if op == "defer":
+        return f"Record #{rec['NR']} kept with local fields only (AI unavailable): {rec['CALL']}", Fore.YELLOW
+    if op == "edit":
+        return f"Record #{rec['NR']} updated: {rec['CALL']} - {rec['QTH']}", Fore.CYAN
+    if op == "op":
+        return f"Operator changed to: {event['call']}", Fore.GREEN
+    if op == "clear":
+        return "Records cleared.", Fore.YELLOW
+    if op == "restore":
+        return f"Session reloaded; next record is Nr. {event['nr']}", Fore.CYAN
+    return None
+
+
+def run_console(host: str, port: int, token: str = "") -> int:
+    """
+    The thin console: reads commands like the stand-alone program does and
+    shows the broadcast records of every operator as they are logged.
+    """
+
+    print_lock = threading.Lock()
+    at_prompt = threading.Event()
+    client = None
+
+    def prompt_text() -> str:
+        op = f"{Fore.GREEN}[{client.op}]" if client.op else f"{Fore.RED}[OP NOT SET!]"
+        return f"{op}{Style.RESET_ALL}{Style.BRIGHT}{Fore.WHITE}[Nr. {client.nr}] > {Style.RESET_ALL}"
+
+    def show_event(event: dict) -> None:
+        shown = describe_event(event)
+        if shown is None or event.get("from") == client.name:
+            return
+        with print_lock:
+            if at_prompt.is_set():
+                # 主控正在输入，另起一行打印后重绘提示符
+                print(f"\n{shown[1]}{shown[0]}{Style.RESET_ALL}")
+                print(prompt_text(), end = "", flush = True)
+            else:
+                print(f"{shown[1]}{shown[0]}{Style.RESET_ALL}", flush = True)
+
+    def show_output(text: str) -> None:
+        with print_lock:
+            print(text, end = "", flush = True)
+
+    try:
+        client = SessionClient(host, port, on_event = show_event, token = token)
+    except (OSError, ValueError) as e:
+        print(f"{Fore.RED}Cannot connect to {host}:{port}: {e}{Style.RESET_ALL}")
+        return 1
+    print(f"{Style.BRIGHT}{Fore.GREEN}Connected to the shared session at {host}:{port}{Style.RESET_ALL}")
+    print(f"{Style.BRIGHT}{Fore.YELLOW}Type 'H' or 'HELP' for help; QUIT leaves the session running{Style.RESET_ALL}")
+    print(f"{Fore.YELLOW}The operator is shared: OP changes it for every console{Style.RESET_ALL}")
+
+    try:
+        while not client.closed:
+            with print_lock:
+                print(prompt_text(), end = "", flush = True)
+                at_prompt.set()
+            try:
+                cmd = input().strip().upper()
+            finally:
+                at_prompt.clear()
+            if cmd == "QUIT":
+                break
+            if cmd:
+                client.command(cmd, ask = input, output = show_output)
+    except (EOFError, KeyboardInterrupt):
+        print()
+    except ConnectionError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        return 1
+    finally:
+        client.close()
+    print(f"{Fore.RED}Disconnected.{Style.RESET_ALL}")
+    return 0
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Shared roll-call session for several operators")
+    parser.add_argument("--host", default = "127.0.0.1",
+                        help = "address to listen on; 0.0.0.0 lets other computers connect")
+    parser.add_argument("--port", type = int, default = DEFAULT_PORT)
+    parser.add_argument("--connect", default = "", metavar = "HOST[:PORT]",
+                        help = "run a console connected to a session server instead")
+    parser.add_argument("--token", default = os.getenv(TOKEN_ENV, ""),
+                        help = f"shared token of the session (default: ${TOKEN_ENV}); the server makes one up "
+                               f"when it listens beyond this computer and none is given")
+    args = parser.parse_args()
+
+    if args.connect:
+        host, _, port = args.connect.rpartition(":") if ":" in args.connect else (args.connect, "", args.port)
+        sys.exit(run_console(host, int(port), args.token))
+
+    logger = load_logger()
+    logger.start_warm_up()
+    logger.cprint("Radio Roll-call AI Logger Assistant - shared session", "GREEN", bright = True)
+    logger.recover_session()
+    try:
+        server = start_session_server(logger, args.host, args.port, args.token)
+    except OSError as e:
+        logger.cprint(f"Error: {e}", "RED")
+        sys.exit(1)
+    logger.cprint(f"Session server listening on {args.host}:{server.port}; press Ctrl+C to stop", "GREEN")
+    if server.token:
+        logger.cprint(f"Consoles connect with: --connect <this computer>:{server.port} --token {server.token}",
+                      "YELLOW", bright = True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        logger.wait_pending()
+        logger.cprint("Session server stopped.", "RED", bright = True)
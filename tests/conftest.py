@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+The logger script loaded as a module, shared by the tests
+
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+LOGGER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "AI Logger Assistant.py")
+
+
+@pytest.fixture(scope = "session")
+def logger(tmp_path_factory):
+    spec = importlib.util.spec_from_file_location("ai_logger", LOGGER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["ai_logger"] = module
+    spec.loader.exec_module(module)
+    # 缓存、档案、日志簿等文件写到临时目录
+    workdir = tmp_path_factory.mktemp("logger")
+    module.JOURNAL_FILE = ""
+    module.CACHE_FILE = str(workdir / "extract_cache.json")
+    module.PROFILE_FILE = str(workdir / "station_profiles.json")
+    module.LOGBOOK_DB = str(workdir / "logbook.db")
+    return module
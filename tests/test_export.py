@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the incremental export files (FINAL, EXPORT, LIVE_EXPORT_FILE)
+
+Run with: python -m pytest tests
+
+"""
+import os
+
+import pytest
+
+
+def records(logger, calls):
+    return [dict(zip(logger.RECORD_FIELDS, [str(nr), "2025-12-04", "14:58", call, "59", "杭州", "NULL", "NULL",
+                                            "5W", "NULL", "NULL", "BG5CVB"]))
+            for nr, call in enumerate(calls, 1)]
+
+
+@pytest.mark.parametrize("ext", [".csv", ".adi", ".log"])
+def test_file_changed_outside_is_written_in_full(logger, tmp_path, ext):
+    path = str(tmp_path / f"final{ext}")
+    export = logger.ExportFile(path)
+    export.sync(records(logger, ["BG5AAA", "BG5BBB"]))
+    # 例如用表格软件改过第一条记录并保存，后面各条的位置都变了
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data.replace("杭州".encode("utf-8"), "杭州市西湖区".encode("utf-8"), 1))
+
+    rows = records(logger, ["BG5AAA", "BG5BBB", "BG5CCC"])
+    export.sync(rows)
+    fresh = str(tmp_path / f"fresh{ext}")
+    logger.ExportFile(fresh).sync(rows)
+    with open(path, "rb") as f, open(fresh, "rb") as g:
+        assert f.read() == g.read()
+
+
+def test_unchanged_file_is_appended(logger, tmp_path):
+    path = str(tmp_path / "final.csv")
+    export = logger.ExportFile(path)
+    export.sync(records(logger, ["BG5AAA", "BG5BBB"]))
+    assert export.sync(records(logger, ["BG5AAA", "BG5BBB", "BG5CCC"])) == 1
+    assert os.path.getsize(path) == export.stamp[0]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the local (no AI) parsing of QSO lines and EDIT corrections
+
+Run with: python -m pytest tests
+
+"""
+import pytest
+
+
+@pytest.mark.parametrize("correction, patch", [
+    ("PWR 10w, ANT gp", {"PWR": "10W", "ANT": "GP"}),
+    ("RIG uvk5", {"RIG": "UV-K5"}),
+    ("RIG ic 705", {"RIG": "IC-705"}),
+    ("rig to baofeng", {"RIG": "baofeng"}),
+    ("ALT 30楼", {"ALT": "30楼"}),
+    ("RMKS 信号不错", {"RMKS": "信号不错"}),
+])
+def test_edit_parsed_locally(logger, correction, patch):
+    assert logger.parse_edit(correction) == patch
+
+
+@pytest.mark.parametrize("correction", [
+    "PWR 10W ANT GP",          # 两个子句之间没有分隔，ANT不能丢
+    "QTH 西湖 RIG UV-K5",      # RIG不能并入QTH
+    "地点 西湖 设备 UV-K5",
+    "QTH 西湖 UV-K5",
+    "PWR 10W 30楼",
+    "RMKS 路过 ANT GP",
+    "QTH should be checked later",    # 英文的不确定说法
+    "RIG is broken",
+    "ANT not sure",
+    "QTH west lake",                  # 几个词，又不是已知地点
+])
+def test_edit_with_several_fields_goes_to_ai(logger, correction):
+    assert logger.parse_edit(correction) is None
+
+
+@pytest.mark.parametrize("raw_text, rst", [
+    ("BG5AAA 59 5W", "59"),
+    ("BG5AAA 599", "599"),
+    ("RST 57 BG5AAA", "57"),
+])
+def test_rst_in_report_position(logger, raw_text, rst):
+    fields, resolved, leftover = logger.local_extract(raw_text)
+    assert fields["RST"] == rst and "RST" in resolved and not leftover
+
+
+@pytest.mark.parametrize("raw_text", [
+    "BA1AA 144",               # 波段，不是信号报告
+    "BG5XXX 12 XIXI",
+    "BG5AAA 435",
+    "59 BG5AAA",               # 不在呼号之后
+])
+def test_number_that_may_not_be_rst_goes_to_ai(logger, raw_text):
+    fields, resolved, leftover = logger.local_extract(raw_text)
+    assert "RST" not in resolved and leftover
+    assert logger.fast_path(raw_text)[2] is None
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of the SQLite logbook kept across sessions
+
+Run with: python -m pytest tests
+
+"""
+import datetime
+
+import pytest
+
+WHEN = datetime.datetime(2025, 12, 4, 14, 58)
+
+
+@pytest.fixture
+def logbook(logger, monkeypatch, tmp_path):
+    monkeypatch.setattr(logger, "LOGBOOK_DB", str(tmp_path / "logbook.db"))
+    monkeypatch.setattr(logger, "_LOGBOOK", None)
+    monkeypatch.setattr(logger, "JOURNAL_FILE", str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(logger, "JOURNAL_SNAPSHOT", str(tmp_path / "journal_snapshot.json"))
+    monkeypatch.setattr(logger, "_JOURNAL", None)
+    logger.restore_state({})
+    return logger
+
+
+def log(logger, call):
+    logger.append_record([call, "59"] + ["NULL"] * 6, announce = False, when = WHEN)
+
+
+def test_sessions_started_in_the_same_minute_keep_their_rows(logbook):
+    log(logbook, "BG5AAA")
+    log(logbook, "BG5BBB")
+    first = logbook.session_key()
+    logbook.do_action("CLEAR")
+    log(logbook, "BG5CCC")
+    second = logbook.session_key()
+
+    assert first != second
+    assert logbook.logbook_query("SELECT session, nr, call FROM qso ORDER BY call") == [
+        (first, 1, "BG5AAA"), (first, 2, "BG5BBB"), (second, 1, "BG5CCC")]
+
+
+def test_resumed_session_keeps_its_key(logbook):
+    log(logbook, "BG5AAA")
+    session = logbook.session_key()
+    state = logbook.read_journal()
+
+    logbook.restore_state({})
+    logbook.restore_state(state)
+    assert logbook.session_key() == session
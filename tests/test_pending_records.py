@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Checks of records that are still waiting for the AI (EDIT, fill, recovery)
+
+Run with: python -m pytest tests
+
+"""
+import json
+from concurrent.futures import Future
+
+import pytest
+
+RAW_TEXT = "BG5AAA 59 IC-705 5W"
+ANSWER = json.dumps({"CALL": "BG5AAA", "RST": "59", "QTH": "NULL", "RIG": "IC-705", "ANT": "NULL",
+                     "PWR": "5W", "ALT": "NULL", "RMKS": "NULL"})
+
+
+@pytest.fixture
+def held(logger, monkeypatch):
+    # 提交一条QSO，AI的结果由测试决定何时到达
+    future = Future()
+    monkeypatch.setattr(logger, "extract_async", lambda raw_text: future)
+    monkeypatch.setattr(logger, "input", lambda prompt = "": "PWR 10W", raising = False)
+    logger.restore_state({})
+    logger.submit_qso(RAW_TEXT)
+    record = logger.RECORD.find_call("BG5AAA")[0]
+    return record, future
+
+
+def test_edit_of_pending_record_is_refused(logger, held):
+    record, future = held
+    logger.edit_record("BG5AAA")
+    assert record.PWR == logger.PENDING_MARK and record.NR in logger.PENDING
+    future.set_result(ANSWER)
+    assert record.PWR == "5W" and record.NR not in logger.PENDING
+
+
+def test_late_answer_keeps_edit_of_deferred_record(logger, held):
+    record, future = held
+    # 只有本地字段、正在重试的记录可以编辑，迟到的结果不能覆盖更正
+    logger._RETRY[record.NR] = [record, RAW_TEXT, 1, float("inf")]
+    logger.edit_record("BG5AAA")
+    assert record.PWR == "10W" and record.NR not in logger.PENDING
+    future.set_result(ANSWER)
+    assert record.PWR == "10W"
+
+
+@pytest.mark.parametrize("edited, pending", [
+    (["...", "...", "...", "...", "...", "10W", "...", RAW_TEXT], ["1"]),    # 更正了占位记录，仍待识别
+    (["BG5AAA", "59", "NULL", "IC-705", "NULL", "10W", "NULL", RAW_TEXT], []),
+])
+def test_recovery_after_edit(logger, monkeypatch, tmp_path, edited, pending):
+    journal = tmp_path / "journal.jsonl"
+    reserve = ["1", "2025-12-04", "14:58"] + ["..."] * 7 + [RAW_TEXT, "BG5CVB"]
+    edit = ["1", "2025-12-04", "14:58"] + edited + ["BG5CVB"]
+    journal.write_text(json.dumps({"seq": 1, "op": "reserve", "rec": reserve}) + "\n"
+                       + json.dumps({"seq": 2, "op": "edit", "rec": edit}) + "\n", encoding = "utf-8")
+    monkeypatch.setattr(logger, "JOURNAL_FILE", str(journal))
+    monkeypatch.setattr(logger, "JOURNAL_SNAPSHOT", str(tmp_path / "journal_snapshot.json"))
+    assert logger.read_journal()["PENDING"] == pending